@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cleaner Benchmark - 清洗器效能基準
+以 benchmarks/fixtures.py 產生的合成原始檔（固定亂數種子），加上 benchmarks/recorded/ 中
+由實際下載檔錄製的樣本（變形標示為 recorded），量測每一條清洗路徑：
+  - 上市每日：daily_data_updater.process_*（直接傳入 bytes）
+  - 上市歷史：historical_tse_batch_downloader.process_date_*
+  - 上櫃：OTCDataCleaner.clean_single_file（讀檔 + 清洗 + 寫檔）與 _clean_*（只量清洗本身）
+輸出每條路徑的中位數耗時、每秒處理行數與 tracemalloc 峰值記憶體，
+並與 benchmarks/baseline_cleaners.json 比對，超出容許範圍即標示退步（結束碼 1）；
+基準線隨版本控制提交，換機器量測時先以 --save-baseline 重建
+單一案例丟出例外時記為失敗（ok=False）並繼續量測其他案例
+
+用法：
+    python benchmarks/bench_cleaners.py                    # 量測並與基準線比對
+    python benchmarks/bench_cleaners.py --save-baseline    # 量測並寫入基準線
+    python benchmarks/bench_cleaners.py --rows 2000 --repeat 7 --tolerance 0.3 --only otc
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fixtures import (  # noqa: E402
+    TWSE_SOURCES, OTC_SOURCES, fixture_matrix, fixture_path, recorded_matrix, write_fixtures,
+)
+
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "baseline_cleaners.json")
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.25    # 比基準線慢 / 多用 25% 以上視為退步
+MIN_SLACK_MS = 2.0          # 極短的量測允許的絕對誤差
+MIN_SLACK_KB = 256.0
+
+# 上市歷史清洗函式名稱（mi_margn 的函式沿用 margen 拼法）
+HISTORICAL_PROCESSORS = {
+    "t86": "process_date_t86",
+    "twt44u": "process_date_twt44u",
+    "twt38u": "process_date_twt38u",
+    "mi_margn": "process_date_margen",
+    "mi_index": "process_date_mi_index",
+}
+
+
+def arg_value(flag: str, default):
+    if flag in sys.argv:
+        return type(default)(sys.argv[sys.argv.index(flag) + 1])
+    return default
+
+
+class BenchCase:
+    """單一量測案例：run() 回傳是否成功"""
+
+    def __init__(self, path: str, source: str, encoding: str, quirk: str, fixture: str, run: Callable[[], bool]):
+        self.path = path
+        self.source = source
+        self.variant = encoding + (f"+{quirk}" if quirk else "")
+        self.fixture = fixture
+        self.run = run
+
+    @property
+    def key(self) -> str:
+        return f"{self.path}|{self.source}|{self.variant}"
+
+    @property
+    def rows(self) -> int:
+        with open(self.fixture, "rb") as f:
+            return max(f.read().count(b"\n"), 1)
+
+
+# ===== 建立各清洗路徑的案例 =====
+def bench_inputs(sources) -> List[Tuple[str, str, str, str]]:
+    """(資料源, 編碼, 變形, 路徑)：合成樣本在前，錄製樣本在後"""
+    inputs = [(s, e, q, fixture_path(s, e, q)) for s, e, q in fixture_matrix() if s in sources]
+    inputs += [(s, e, "recorded", p) for s, e, p in recorded_matrix() if s in sources]
+    return inputs
+
+
+def twse_daily_cases(out_dir: str) -> List[BenchCase]:
+    import daily_data_updater as module
+    module.CLEANED_DIR = out_dir
+    cases = []
+    for source, encoding, quirk, path in bench_inputs(TWSE_SOURCES):
+        processor = module.PROCESSORS[source]
+
+        def run(processor=processor, path=path):
+            with open(path, "rb") as f:
+                processor(raw=f.read())
+            return True
+
+        cases.append(BenchCase(processor.__name__, source, encoding, quirk, path, run))
+    return cases
+
+
+def twse_historical_cases(out_dir: str) -> List[BenchCase]:
+    import historical_tse_batch_downloader as module
+    module.CLEANED_DIR = out_dir
+    cases = []
+    for source, encoding, quirk, path in bench_inputs(TWSE_SOURCES):
+        processor = getattr(module, HISTORICAL_PROCESSORS[source])
+        date_str = os.path.basename(path)[:8]
+        cases.append(BenchCase(processor.__name__, source, encoding, quirk, path,
+                               lambda processor=processor, path=path, date_str=date_str: processor(date_str, path)))
+    return cases
+
+
+def otc_cases(out_dir: str) -> List[BenchCase]:
+    import pandas  # noqa: F401  上櫃清洗器讀檔時會吞掉例外，先確認 pandas 可用
+    import otc_common
+    from otc_downloader_optimized import DEFAULT_CONFIG
+    otc_common.CLEAN_DIR = Path(out_dir)
+    cleaner = otc_common.OTCDataCleaner(DEFAULT_CONFIG)
+    cases = []
+    for source, encoding, quirk, name in bench_inputs(OTC_SOURCES):
+        path = Path(name)
+        cases.append(BenchCase("clean_single_file", source, encoding, quirk, str(path),
+                               lambda path=path: cleaner.clean_single_file(path)))
+
+        # _clean_*：先讀好資料框，只量清洗本身
+        file_type, skiprows = cleaner.get_file_type_and_config(path.name)
+        df = cleaner.read_csv_with_encoding(path, max(skiprows, 0))
+        if df is None:
+            continue
+        df.columns = df.columns.str.strip()
+        df = df.dropna(axis=1, how="all").dropna(axis=0, how="all")
+        method = otc_clean_method(cleaner, file_type)
+
+        def run(df=df, file_type=file_type, name=path.name):
+            result = cleaner._clean_by_type(df.copy(), file_type, name)
+            return result is not None and len(result) > 0
+
+        cases.append(BenchCase(method, source, encoding, quirk, str(path), run))
+    return cases
+
+
+def otc_clean_method(cleaner, file_type: str) -> str:
+    """_clean_by_type 會分派到的方法名稱（報表用）"""
+    if "investment_trust" in file_type:
+        return "_clean_investment_trust"
+    name = "_clean_daily_close" if file_type == "daily_close_no1430" else f"_clean_{file_type}"
+    return name if hasattr(cleaner, name) else "_clean_by_type"
+
+
+GROUPS = {
+    "twse_daily": twse_daily_cases,
+    "twse_historical": twse_historical_cases,
+    "otc": otc_cases,
+}
+
+
+# ===== 量測 =====
+def measure(case: BenchCase, repeat: int) -> Dict:
+    samples = []
+    ok = True
+    error = None
+    peak = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                ok = bool(case.run()) and ok
+                samples.append(time.perf_counter() - start)
+
+            # 峰值記憶體另跑一次（tracemalloc 會拖慢計時）
+            tracemalloc.start()
+            try:
+                case.run()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+
+    median = statistics.median(samples) if samples else None
+    result = {
+        "key": case.key,
+        "path": case.path,
+        "source": case.source,
+        "variant": case.variant,
+        "ok": ok,
+        "rows": case.rows,
+        "median_ms": round(median * 1000, 2) if median is not None else None,
+        "rows_per_sec": round(case.rows / median) if median else None,
+        "peak_kb": round(peak / 1024, 1) if peak is not None else None,
+    }
+    if error:
+        result["error"] = error
+    return result
+
+
+def compare(results: List[Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """回傳退步項目說明"""
+    regressions = []
+    for r in results:
+        base = baseline.get(r["key"])
+        if base is None:
+            continue
+        if base.get("ok") and not r["ok"]:
+            regressions.append(f"{r['key']}：基準線成功，本次失敗")
+        if r["median_ms"] is None or r["peak_kb"] is None or base.get("median_ms") is None:
+            continue
+        limit_ms = base["median_ms"] * (1 + tolerance) + MIN_SLACK_MS
+        if r["median_ms"] > limit_ms:
+            regressions.append(f"{r['key']}：耗時 {base['median_ms']} → {r['median_ms']} ms")
+        limit_kb = base["peak_kb"] * (1 + tolerance) + MIN_SLACK_KB
+        if r["peak_kb"] > limit_kb:
+            regressions.append(f"{r['key']}：峰值記憶體 {base['peak_kb']} → {r['peak_kb']} KB")
+    return regressions
+
+
+def load_baseline() -> Dict[str, Dict]:
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+        return {r["key"]: r for r in json.load(f)["results"]}
+
+
+def save_baseline(results: List[Dict], rows: int, repeat: int) -> None:
+    payload = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "rows": rows,
+        "repeat": repeat,
+        "results": results,
+    }
+    with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def main() -> int:
+    rows = arg_value("--rows", 1000)
+    repeat = arg_value("--repeat", DEFAULT_REPEAT)
+    tolerance = arg_value("--tolerance", DEFAULT_TOLERANCE)
+    only = arg_value("--only", "")
+
+    write_fixtures(rows)
+    logging.disable(logging.CRITICAL)
+    print(f"[📊] 清洗器基準測試（每檔約 {rows} 筆，每案例 {repeat} 次取中位數）")
+
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for group, build in GROUPS.items():
+            if only and only not in group:
+                continue
+            try:
+                cases = build(out_dir)
+            except ImportError as e:
+                print(f"  {group:<16} 無法載入：{e}")
+                continue
+            print(f"\n  [{group}]")
+            for case in cases:
+                r = measure(case, repeat)
+                results.append(r)
+                if r["median_ms"] is None or r["peak_kb"] is None:
+                    print(f"  {r['path']:<30} {r['source']:<22} {r['variant']:<20}  [❌ {r['error']}]")
+                    continue
+                status = "" if r["ok"] else f"  [❌ 清洗失敗{'：' + r['error'] if 'error' in r else ''}]"
+                print(f"  {r['path']:<30} {r['source']:<22} {r['variant']:<20} "
+                      f"{r['median_ms']:>9.2f} ms {r['rows_per_sec'] or 0:>10,} 行/秒 {r['peak_kb']:>10,.0f} KB{status}")
+
+    if "--json" in sys.argv:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+    if "--save-baseline" in sys.argv:
+        save_baseline(results, rows, repeat)
+        print(f"\n[✅] 基準線已寫入 {BASELINE_FILE}")
+        return 0
+
+    baseline = load_baseline()
+    if not baseline:
+        print("\n[ℹ] 尚無基準線，可用 --save-baseline 建立")
+        return 0
+    regressions = compare(results, baseline, tolerance)
+    if regressions:
+        print(f"\n[⚠️] 發現 {len(regressions)} 項退步（容許 {tolerance:.0%}）：")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print(f"\n[✅] 與基準線相比無退步（容許 {tolerance:.0%}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cold Start Benchmark - 入口程式冷啟動時間量測
+每次以新的 Python 行程載入入口模組，量測載入耗時（取中位數），
+並檢查重量級套件（pandas / selenium / psutil / holidays）是否被提前載入
+
+用法：
+    python benchmarks/bench_cold_start.py               # 只量測 import
+    python benchmarks/bench_cold_start.py --run-modes   # 另外實際執行 --verify-only / --clean-only
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ["daily_otc_updater", "otc_downloader_optimized", "daily_data_updater"]
+HEAVY_MODULES = ["pandas", "numpy", "selenium", "webdriver_manager", "psutil", "holidays"]
+RUN_MODES = ["--verify-only", "--clean-only"]
+RUNS = 5
+
+PROBE = """
+import sys, time, json
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module: str, runs: int = RUNS) -> dict:
+    """於新行程載入模組 runs 次，回傳中位數耗時與已載入的重量級套件"""
+    samples = []
+    loaded = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            return {"module": module, "error": proc.stderr.strip().splitlines()[-1]}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        samples.append(result["elapsed"])
+        loaded = result["loaded"]
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+        "heavy_loaded": loaded,
+    }
+
+
+def measure_mode(script: str, flag: str) -> dict:
+    """實際執行 script flag 一次，回傳總耗時（含清洗 / 驗證工作本身）"""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, script, flag], cwd=ROOT, capture_output=True, text=True)
+    return {
+        "command": f"{script} {flag}",
+        "seconds": round(time.perf_counter() - start, 2),
+        "returncode": proc.returncode,
+    }
+
+
+def main():
+    print(f"[📊] 冷啟動量測（每個模組 {RUNS} 次，新行程）")
+    results = [measure_import(m) for m in ENTRY_POINTS]
+    for r in results:
+        if "error" in r:
+            print(f"  {r['module']:<28} 無法載入：{r['error']}")
+            continue
+        heavy = ", ".join(r["heavy_loaded"]) or "無"
+        print(f"  {r['module']:<28} 中位數 {r['median_ms']:>7.1f} ms  最大 {r['max_ms']:>7.1f} ms  已載入重量級套件：{heavy}")
+
+    if "--run-modes" in sys.argv:
+        print("\n[📊] 只清洗 / 只驗證模式實際執行")
+        for script in ("daily_otc_updater.py", "otc_downloader_optimized.py"):
+            for flag in RUN_MODES:
+                r = measure_mode(script, flag)
+                print(f"  {r['command']:<45} {r['seconds']:>6.2f} 秒（結束碼 {r['returncode']}）")
+
+    if "--json" in sys.argv:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
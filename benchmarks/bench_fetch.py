@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fetch Benchmark - 下載器端對端吞吐量量測（離線）
+啟動本機替身伺服器，以 TWSE_BASE_URL / TPEX_BASE_URL 把下載器導向它，
+原始檔 / 清洗檔寫到暫存目錄，量測總耗時、請求數與每秒請求數
+
+用法：
+    python benchmarks/bench_fetch.py                         # 上市每日 + 上市歷史（最近 20 天）
+    python benchmarks/bench_fetch.py --days 60 --latency 120 --error-rate 0.05 --throttle 10
+    python benchmarks/bench_fetch.py --otc                   # 另外跑上櫃每日（需要 Chrome）
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from standin_server import StandinConfig, start_server, base_url, arg_value  # noqa: E402
+
+
+def run_twse_daily(raw_dir: str, clean_dir: str) -> None:
+    import daily_data_updater as module
+    module.RAW_DIR, module.CLEANED_DIR = raw_dir, clean_dir
+    module.download_all()
+
+
+def run_twse_historical(raw_dir: str, clean_dir: str, days: int) -> None:
+    import historical_tse_batch_downloader as module
+    module.RAW_DIR, module.CLEANED_DIR = raw_dir, clean_dir
+    module.START_DATE = datetime.today() - timedelta(days=days)
+    module.MIN_DELAY = module.MAX_DELAY = 0   # 量測下載器本身，不含禮貌延遲
+    module.download_all_historical()
+
+
+def run_otc_daily(raw_dir: str, clean_dir: str) -> None:
+    import daily_otc_updater as module
+    from otc_common import load_config
+    module.RAW_DIR = Path(raw_dir)
+    config = load_config(module.DEFAULT_CONFIG)
+    config["settings"]["headless"] = True
+    module.OTCDataDownloader(config).download_all()
+
+
+def measure(label: str, server, func, *args) -> dict:
+    before = server.stats.as_dict()
+    start = time.perf_counter()
+    error = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            func(*args)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - start
+    after = server.stats.as_dict()
+    requests = after["requests"] - before["requests"]
+    outcomes = {k: v - before["by_outcome"].get(k, 0) for k, v in after["by_outcome"].items()}
+    return {
+        "run": label,
+        "seconds": round(elapsed, 2),
+        "requests": requests,
+        "requests_per_sec": round(requests / elapsed, 2) if elapsed else 0,
+        "outcomes": {k: v for k, v in outcomes.items() if v},
+        "error": error,
+    }
+
+
+def main():
+    config = StandinConfig(
+        latency=arg_value("--latency", 50), jitter=arg_value("--jitter", 20),
+        error_rate=arg_value("--error-rate"), no_data_rate=arg_value("--no-data-rate"),
+        throttle=arg_value("--throttle"), rows=arg_value("--rows"),
+    )
+    days = int(arg_value("--days", 20))
+    server = start_server(0, config)
+    url = base_url(server)
+    # 必須在載入下載器模組之前設定
+    os.environ["TWSE_BASE_URL"] = url
+    os.environ["TPEX_BASE_URL"] = url
+
+    print(f"[📊] 端對端吞吐量（替身伺服器 {url}，設定 {config.as_dict()}）")
+    runs = [("twse_daily", run_twse_daily), ("twse_historical", run_twse_historical)]
+    if "--otc" in sys.argv:
+        runs.append(("otc_daily", run_otc_daily))
+
+    results = []
+    for label, func in runs:
+        with tempfile.TemporaryDirectory() as tmp:
+            raw_dir, clean_dir = os.path.join(tmp, "raw"), os.path.join(tmp, "cleaned")
+            args = (raw_dir, clean_dir, days) if label == "twse_historical" else (raw_dir, clean_dir)
+            r = measure(label, server, func, *args)
+            r["raw_files"] = len(os.listdir(raw_dir)) if os.path.isdir(raw_dir) else 0
+        results.append(r)
+        if r["error"]:
+            print(f"  {label:<16} 失敗：{r['error']}")
+            continue
+        print(f"  {label:<16} {r['seconds']:>8.2f} 秒  {r['requests']:>5} 請求  "
+              f"{r['requests_per_sec']:>7.2f} 請求/秒  原始檔 {r['raw_files']:>4}  {r['outcomes']}")
+
+    server.shutdown()
+    if "--json" in sys.argv:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
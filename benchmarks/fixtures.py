@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Raw Fixtures - 清洗器基準測試用的合成原始檔
+不是實際下載的檔案：依各資料源實際 CSV 版面（標題列數、欄位名稱、千分位、="代號"、頁尾說明、尾端逗號）
+以固定亂數種子產生上市 5 種與上櫃 10 種原始檔，並提供 cp950 / UTF-8 與標題列位移等變形
+同一組參數每次產生的內容完全相同，可作為基準線比對的固定輸入
+另可由實際下載的原始檔錄製樣本（benchmarks/recorded/，納入版本控制）：保留標題、區段與頁尾，
+只截取前幾筆個股資料列，並轉出另一種編碼；錄製不同日期即可收錄各日不同的標題列位置
+
+用法：
+    python benchmarks/fixtures.py                # 寫出到 benchmarks/fixtures/
+    python benchmarks/fixtures.py --rows 2000
+    python benchmarks/fixtures.py --record 20241016 C:\05model\raw otc_raw   # 錄製指定日期的實際原始檔
+"""
+
+import os
+import random
+import re
+import sys
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(ROOT, "benchmarks", "fixtures")
+RECORDED_DIR = os.path.join(ROOT, "benchmarks", "recorded")
+RECORDED_ROWS = 50
+# 個股資料列：第一欄為股票代號（可能是 ="2330" 或 "2330"）
+DATA_ROW = re.compile(rb'^\s*=?"?\d{4}[0-9A-Z]{0,2}"?\s*,')
+FIXTURE_DATE = "20241016"
+ROC_DATE = "113/10/16"
+DEFAULT_ROWS = 1000
+SEED = 20241016
+
+# 上市原始檔沒有 BOM；上櫃「CSV(UTF-8)」下載帶 BOM
+ENCODINGS = {"cp950": "cp950", "utf8": "utf-8"}
+OTC_ENCODINGS = {"cp950": "cp950", "utf8": "utf-8-sig"}
+
+NAMES = ["台積電", "鴻海", "聯發科", "富邦金", "國泰金", "中華電", "台達電", "統一", "南亞", "台塑",
+         "日月光", "中信金", "兆豐金", "長榮", "陽明", "元大金", "聯電", "華碩", "廣達", "光寶科"]
+
+
+# ===== 共用 =====
+def stock_ids(rng: random.Random, rows: int) -> List[str]:
+    """股票代號：大多為 4 碼，夾雜 ETF、權證與含字母代號（清洗器應濾除）；第一筆固定為 4 碼"""
+    ids = []
+    for i in range(rows):
+        roll = rng.random() if i else 1.0
+        if roll < 0.04:
+            ids.append(f"00{rng.randint(50, 999)}")
+        elif roll < 0.07:
+            ids.append(f"{rng.randint(700000, 799999)}")
+        elif roll < 0.08:
+            ids.append(f"{1101 + i}A")
+        else:
+            ids.append(str(1101 + i))
+    return ids
+
+
+def name_for(i: int) -> str:
+    return f"{NAMES[i % len(NAMES)]}{i // len(NAMES) or ''}"
+
+
+def shares(rng: random.Random, signed: bool = False) -> str:
+    value = rng.randint(0, 50_000_000)
+    if signed and rng.random() < 0.5:
+        value = -value
+    return f"{value:,}"
+
+
+def price(rng: random.Random) -> str:
+    if rng.random() < 0.03:
+        return "--"
+    return f"{rng.uniform(5, 1200):,.2f}"
+
+
+def csv_line(cells: List[str], trailing_comma: bool = False) -> str:
+    line = ",".join(f'"{c}"' for c in cells)
+    return line + ("," if trailing_comma else "")
+
+
+# ===== 上市（TWSE） =====
+def twse_t86(rng, rows, quirk):
+    header = ["證券代號", "證券名稱",
+              "外陸資買進股數(不含外資自營商)", "外陸資賣出股數(不含外資自營商)", "外陸資買賣超股數(不含外資自營商)",
+              "外資自營商買進股數", "外資自營商賣出股數", "外資自營商買賣超股數",
+              "投信買進股數", "投信賣出股數", "投信買賣超股數", "自營商買賣超股數",
+              "自營商買進股數(自行買賣)", "自營商賣出股數(自行買賣)", "自營商買賣超股數(自行買賣)",
+              "自營商買進股數(避險)", "自營商賣出股數(避險)", "自營商買賣超股數(避險)", "三大法人買賣超股數"]
+    lines = ['"113年10月16日 三大法人買賣超日報"', csv_line(header, True)]
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        values = [shares(rng, signed=(j % 3 == 2)) for j in range(len(header) - 2)]
+        lines.append(csv_line([sid, name_for(i)] + values, True))
+    lines += ['"說明:"', '"本資料僅供參考"']
+    return lines
+
+
+def twse_twt44u(rng, rows, quirk):
+    lines = ['"113年10月16日 投信買賣超彙總表"',
+             csv_line(["", "證券代號", "證券名稱", "買進股數", "賣出股數", "買賣超股數"], True)]
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        lines.append(csv_line([" ", f"={sid}", name_for(i), shares(rng), shares(rng), shares(rng, True)], True))
+    lines.append('"說明:"')
+    return lines
+
+
+def twse_twt38u(rng, rows, quirk):
+    lines = ['"113年10月16日 外資及陸資買賣超彙總表"',
+             csv_line(["", "", "", "外資及陸資(不含外資自營商)", "", "", "外資自營商", "", "", "外資及陸資", "", ""], True),
+             csv_line(["", "證券代號", "證券名稱", "買進股數", "賣出股數", "買賣超股數",
+                       "買進股數", "賣出股數", "買賣超股數", "買進股數", "賣出股數", "買賣超股數"], True)]
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        lines.append(csv_line([" ", f"={sid}", name_for(i)] + [shares(rng, j % 3 == 2) for j in range(9)], True))
+    lines.append('"說明:"')
+    return lines
+
+
+def twse_mi_margn(rng, rows, quirk):
+    lines = ['"113年10月16日 融資融券彙總"',
+             '"信用交易統計"',
+             csv_line(["項目", "買進", "賣出", "現金(券)償還", "前日餘額", "今日餘額"]),
+             csv_line(["融資(交易單位)", shares(rng), shares(rng), shares(rng), shares(rng), shares(rng)]),
+             csv_line(["融券(交易單位)", shares(rng), shares(rng), shares(rng), shares(rng), shares(rng)]),
+             csv_line(["融資金額(仟元)", shares(rng), shares(rng), shares(rng), shares(rng), shares(rng)]),
+             '"融資融券彙總"',
+             csv_line(["代號", "名稱", "買進", "賣出", "現金償還", "前日餘額", "今日餘額", "次一營業日限額",
+                       "買進", "賣出", "現券償還", "前日餘額", "今日餘額", "次一營業日限額", "資券互抵", "註記"], True)]
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        values = [shares(rng) for _ in range(13)]
+        lines.append(csv_line([sid, name_for(i)] + values + [rng.choice(["", "X", "O"])], True))
+    lines.append('"說明:"')
+    return lines
+
+
+def twse_mi_index(rng, rows, quirk):
+    # 個股表格前有大盤統計、漲跌證券數等區段；區段數量隨日期變動，標題列位置不固定
+    lines = ['"113年10月16日 價格指數(臺灣證券交易所)"', csv_line(["指數", "收盤指數", "漲跌(+/-)", "漲跌點數", "漲跌百分比(%)"])]
+    for k in range(rng.randint(20, 40) + (15 if quirk == "header_offset" else 0)):
+        lines.append(csv_line([f"指數{k}", price(rng), "+", price(rng), f"{rng.uniform(-3, 3):.2f}"]))
+    lines += ['""', '"113年10月16日 每日收盤行情(全部(不含權證、牛熊證))"',
+              csv_line(["證券代號", "證券名稱", "成交股數", "成交筆數", "成交金額", "開盤價", "最高價", "最低價",
+                        "收盤價", "漲跌(+/-)", "漲跌價差", "最後揭示買價", "最後揭示買量", "最後揭示賣價",
+                        "最後揭示賣量", "本益比"], True)]
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        sign = rng.choice(["<p style= color:red>+</p>", "<p style= color:green>-</p>", " "])
+        lines.append(csv_line([sid, name_for(i), shares(rng), shares(rng), shares(rng), price(rng), price(rng),
+                               price(rng), price(rng), sign, price(rng), price(rng), shares(rng), price(rng),
+                               shares(rng), f"{rng.uniform(0, 80):.2f}"], True))
+    lines.append('"備註:"')
+    return lines
+
+
+# ===== 上櫃（TPEx） =====
+def otc_title(title: str, extra: int = 1) -> List[str]:
+    lines = [csv_line([title]), csv_line([f"資料日期:{ROC_DATE}"])]
+    return lines + [csv_line(["單位:元、股"])] * (extra - 1)
+
+
+def otc_footer(rows: int) -> List[str]:
+    return [csv_line([f"共{rows}筆"]), csv_line(["註:本資料僅供參考"])]
+
+
+def otc_daily_close(rng, rows, quirk):
+    # skiprows=3；header_offset 少一行標題，讀取時會偵測到數字欄名並自動退一行
+    lines = otc_title("上櫃股票每日收盤行情(不含定價)", 1 if quirk == "header_offset" else 2)
+    lines.append(csv_line(["代號", "名稱", "收盤 ", "漲跌", "開盤 ", "最高 ", "最低", "均價 ", "成交股數  ",
+                           "成交金額(元)", "成交筆數 ", "最後買價", "最後買量(千股)", "最後賣價", "最後賣量(千股)",
+                           "發行股數 ", "次日參考價 ", "次日漲停價 ", "次日跌停價"]))
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        lines.append(csv_line([sid, name_for(i)] + [price(rng) for _ in range(6)] +
+                              [shares(rng) for _ in range(3)] + [price(rng), shares(rng), price(rng), shares(rng),
+                                                                 shares(rng), price(rng), price(rng), price(rng)]))
+    return lines + otc_footer(rows)
+
+
+def otc_margin_transactions(rng, rows, quirk):
+    lines = otc_title("上櫃股票融資融券餘額", 2)
+    lines.append(csv_line(["代號", "名稱", "前資餘額(張)", "資買", "資賣", "現償", "資餘額", "資屬證金",
+                           "資使用率(%)", "資限額", "前券餘額(張)", "券賣", "券買", "券償", "券餘額", "券屬證金",
+                           "券使用率(%)", "券限額", "資券相抵(張)", "備註"]))
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        lines.append(csv_line([sid, name_for(i)] + [shares(rng) for _ in range(17)] + [rng.choice(["", "*"])]))
+    return lines + otc_footer(rows)
+
+
+def otc_institutional_detail(rng, rows, quirk):
+    groups = ["外資及陸資(不含外資自營商)", "外資自營商", "外資及陸資", "投信", "自營商(自行買賣)", "自營商(避險)", "自營商"]
+    header = ["代號", "名稱"]
+    for g in groups:
+        header += [f"{g}-買進股數", f"{g}-賣出股數", f"{g}-買賣超股數"]
+    header.append("三大法人買賣超股數合計")
+    lines = [csv_line(["上櫃股票三大法人買賣明細資訊"]), csv_line(header)]
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        lines.append(csv_line([sid, name_for(i)] + [shares(rng, j % 3 == 2) for j in range(len(header) - 2)]))
+    return lines + otc_footer(rows)
+
+
+def otc_day_trading(rng, rows, quirk):
+    lines = otc_title("現股當沖交易統計資訊", 1)
+    lines += [csv_line(["當日沖銷交易總成交股數", shares(rng)]),
+              csv_line(["當日沖銷交易總買進成交金額", shares(rng)]),
+              csv_line(["當日沖銷交易總賣出成交金額", shares(rng)]),
+              csv_line(["證券代號", "證券名稱", "暫停現股賣出後現款買進當沖註記", "當日沖銷交易成交股數",
+                        "當日沖銷交易買進成交金額", "當日沖銷交易賣出成交金額"])]
+    lines.insert(2, csv_line([""]))
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        lines.append(csv_line([sid, name_for(i), rng.choice(["", "Y"]), shares(rng), shares(rng), shares(rng)]))
+    return lines + [csv_line(["共計", str(rows)])] + otc_footer(rows)
+
+
+def otc_sec_trading(rng, rows, quirk):
+    lines = otc_title("各券商當日營業金額統計表", 1)
+    lines.append(csv_line(["名次", "前日名次", "證券商代號", "證券商名稱", "成交金額(千元)",
+                           "名次", "前日名次", "證券商代號", "證券商名稱", "成交金額(千元)"]))
+    half = max(rows // 10, 1)
+    for i in range(half):
+        left = [str(i + 1), str(rng.randint(1, half)), f"{9200 + i}", f"券商{i}", shares(rng)]
+        right = [str(half + i + 1), str(rng.randint(1, half)), f"{9600 + i}", f"券商{half + i}", shares(rng)]
+        lines.append(csv_line(left + right))
+    return lines + otc_footer(half)
+
+
+def otc_investment_trust(rng, rows, quirk):
+    lines = [csv_line(["投信買賣超彙總表"]),
+             csv_line(["排行", "代號", "名稱", "買進(股)", "賣出(股)", "買賣超(股)",
+                       "買進金額(元)", "賣出金額(元)", "買賣超金額(元)"])]
+    for i, sid in enumerate(stock_ids(rng, max(rows // 4, 1))):
+        lines.append(csv_line([str(i + 1), sid, name_for(i)] + [shares(rng, j % 3 == 2) for j in range(6)]))
+    return lines + otc_footer(rows)
+
+
+def otc_highlight(rng, rows, quirk):
+    lines = otc_title("上櫃股票信用交易融資融券餘額概況表", 1)
+    lines.append(csv_line(["排名", "代號", "名稱", "月均融資餘額(張)", "月均融券餘額(張)", "券資比(%)"]))
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        lines.append(csv_line([str(i + 1), sid, name_for(i), shares(rng), shares(rng), f"{rng.uniform(0, 90):.2f}"]))
+    return lines + otc_footer(rows)
+
+
+def otc_sbl(rng, rows, quirk):
+    lines = otc_title("信用額度總量管制餘額表", 1)
+    lines.append(csv_line(["股票代號", "股票名稱", "融券前日餘額", "融券賣出", "融券買進", "融券現券",
+                           "融券當日餘額", "融券限額", "借券前日餘額", "借券當日賣出", "借券當日還券",
+                           "借券當日調整數額", "借券當日餘額", "借券次一營業日可借券賣出限額", "備註"]))
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        lines.append(csv_line([sid, name_for(i)] + [shares(rng) for _ in range(12)] + [rng.choice(["", "X"])]))
+    return lines + otc_footer(rows)
+
+
+def otc_exempted(rng, rows, quirk):
+    lines = [csv_line(["平盤下得融(借)券賣出之證券名單"]),
+             csv_line(["證券代號", "證券名稱", "融券註記", "借券註記"])]
+    for i, sid in enumerate(stock_ids(rng, rows)):
+        lines.append(csv_line([sid, name_for(i), rng.choice(["*", ""]), rng.choice(["*", ""])]))
+    return lines + [csv_line([f"共{rows}筆"])]
+
+
+TWSE_SOURCES: Dict[str, Callable] = {
+    "t86": twse_t86,
+    "twt44u": twse_twt44u,
+    "twt38u": twse_twt38u,
+    "mi_margn": twse_mi_margn,
+    "mi_index": twse_mi_index,
+}
+
+OTC_SOURCES: Dict[str, Callable] = {
+    "daily_close_no1430": otc_daily_close,
+    "margin_transactions": otc_margin_transactions,
+    "institutional_detail": otc_institutional_detail,
+    "day_trading": otc_day_trading,
+    "sec_trading": otc_sec_trading,
+    "investment_trust_buy": otc_investment_trust,
+    "investment_trust_sell": otc_investment_trust,
+    "highlight": otc_highlight,
+    "sbl": otc_sbl,
+    "exempted": otc_exempted,
+}
+
+# 額外的版面變形（source → quirk 名稱）
+QUIRKS = {
+    "mi_index": ["header_offset"],
+    "daily_close_no1430": ["header_offset"],
+}
+
+
+def build_fixture(source: str, encoding: str = "cp950", rows: int = DEFAULT_ROWS, quirk: str = "") -> bytes:
+    """產生單一原始檔內容（bytes）；同參數結果固定"""
+    if source in TWSE_SOURCES:
+        builder, codec = TWSE_SOURCES[source], ENCODINGS[encoding]
+    else:
+        builder, codec = OTC_SOURCES[source], OTC_ENCODINGS[encoding]
+    rng = random.Random(f"{SEED}:{source}:{quirk}")
+    text = "\r\n".join(builder(rng, rows, quirk)) + "\r\n"
+    return text.encode(codec)
+
+
+def fixture_matrix() -> List[Tuple[str, str, str]]:
+    """所有 (資料源, 編碼, 變形) 組合"""
+    matrix = []
+    for source in list(TWSE_SOURCES) + list(OTC_SOURCES):
+        for encoding in ENCODINGS:
+            for quirk in [""] + QUIRKS.get(source, []):
+                matrix.append((source, encoding, quirk))
+    return matrix
+
+
+def fixture_path(source: str, encoding: str, quirk: str = "", base_dir: str = FIXTURE_DIR) -> str:
+    """檔名沿用下載器命名（YYYYMMDD_資料源.csv），讓清洗器依檔名判斷類型"""
+    folder = encoding + (f"_{quirk}" if quirk else "")
+    return os.path.join(base_dir, folder, f"{FIXTURE_DATE}_{source}.csv")
+
+
+def write_fixtures(rows: int = DEFAULT_ROWS, base_dir: str = FIXTURE_DIR) -> List[str]:
+    """寫出所有組合，回傳檔案路徑"""
+    paths = []
+    for source, encoding, quirk in fixture_matrix():
+        path = fixture_path(source, encoding, quirk, base_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(build_fixture(source, encoding, rows, quirk))
+        paths.append(path)
+    return paths
+
+
+def trim_rows(content: bytes, rows: int) -> bytes:
+    """保留標題、區段與頁尾，只截掉第 rows 筆之後的個股資料列"""
+    kept, count = [], 0
+    for line in content.splitlines(keepends=True):
+        if DATA_ROW.match(line):
+            count += 1
+            if count > rows:
+                continue
+        kept.append(line)
+    return b"".join(kept)
+
+
+def detect_encoding(content: bytes) -> str:
+    """實際檔案為 cp950 或 UTF-8（cp950 的中文幾乎不會是合法 UTF-8）"""
+    try:
+        content.decode("utf-8")
+        return "utf8"
+    except UnicodeDecodeError:
+        return "cp950"
+
+
+def record_fixtures(date_str: str, raw_dirs: List[str], rows: int = RECORDED_ROWS,
+                    base_dir: str = RECORDED_DIR) -> List[str]:
+    """由實際原始檔錄製樣本：原編碼照原樣截取，另一種編碼由同一份內容轉出"""
+    paths = []
+    for source in list(TWSE_SOURCES) + list(OTC_SOURCES):
+        found = [os.path.join(d, f"{date_str}_{source}.csv") for d in raw_dirs]
+        found = [p for p in found if os.path.exists(p)]
+        if not found:
+            print(f"[⚠] 找不到 {date_str}_{source}.csv")
+            continue
+        with open(found[0], "rb") as f:
+            content = trim_rows(f.read(), rows)
+        original = detect_encoding(content)
+        text = content.decode("utf-8-sig" if original == "utf8" else "cp950")
+        codecs = OTC_ENCODINGS if source in OTC_SOURCES else ENCODINGS
+        for encoding, codec in codecs.items():
+            try:
+                body = content if encoding == original else text.encode(codec)
+            except UnicodeEncodeError:
+                print(f"[⚠] {source} 無法轉成 {encoding}，略過")
+                continue
+            path = os.path.join(base_dir, encoding, f"{date_str}_{source}.csv")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(body)
+            paths.append(path)
+    return paths
+
+
+def recorded_matrix(base_dir: str = RECORDED_DIR) -> List[Tuple[str, str, str]]:
+    """已錄製的 (資料源, 編碼, 路徑)"""
+    matrix = []
+    for encoding in ENCODINGS:
+        folder = os.path.join(base_dir, encoding)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            match = re.match(r"^\d{8}_(.+)\.csv$", name)
+            if match and (match.group(1) in TWSE_SOURCES or match.group(1) in OTC_SOURCES):
+                matrix.append((match.group(1), encoding, os.path.join(folder, name)))
+    return matrix
+
+
+def main():
+    if "--record" in sys.argv:
+        i = sys.argv.index("--record")
+        date_str, raw_dirs = sys.argv[i + 1], [a for a in sys.argv[i + 2:] if not a.startswith("--")]
+        paths = record_fixtures(date_str, raw_dirs)
+        print(f"[✅] 已錄製 {len(paths)} 個原始檔樣本 → {RECORDED_DIR}")
+        return
+    rows = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else DEFAULT_ROWS
+    paths = write_fixtures(rows)
+    size = sum(os.path.getsize(p) for p in paths)
+    print(f"[✅] 已產生 {len(paths)} 個原始檔樣本（每檔約 {rows} 筆，共 {size / 1024:.0f} KB）→ {FIXTURE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
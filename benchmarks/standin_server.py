@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stand-in Server - 證交所 / 櫃買中心本機替身伺服器
+模擬上市 URLS 的 CSV 端點與上櫃 download_items 的查詢頁面（日期欄、下拉選單、表格、
+「另存 CSV」按鈕），CSV 內容取自 benchmarks/fixtures.py，讓下載器可離線做端對端壓測與效能分析
+可設定延遲、錯誤率、限流與「查無資料」頁面比例
+
+用法：
+    python benchmarks/standin_server.py --port 8765 --latency 80 --jitter 40 --error-rate 0.05 \
+        --throttle 20 --no-data-rate 0.1
+    set TWSE_BASE_URL=http://127.0.0.1:8765
+    set TPEX_BASE_URL=http://127.0.0.1:8765
+執行中可用 /standin/stats 查看統計、/standin/config?latency=200 調整設定
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fixtures import build_fixture  # noqa: E402
+
+DEFAULT_PORT = 8765
+
+# 上市 CSV 端點（對應 daily_data_updater / historical_tse_batch_downloader 的 URLS）
+TWSE_ROUTES = {
+    "/rwd/zh/fund/T86": "t86",
+    "/fund/TWT44U": "twt44u",
+    "/fund/TWT38U": "twt38u",
+    "/exchangeReport/MI_MARGN": "mi_margn",
+    "/rwd/zh/afterTrading/MI_INDEX": "mi_index",
+}
+
+# 上櫃下載檔名前綴（每日更新沿用原始檔名，清洗器依前綴判斷類型）
+TPEX_FILE_PREFIX = {
+    "daily_close_no1430": "RSTA3104",
+    "margin_transactions": "RSTA3106",
+    "institutional_detail": "BIGD",
+    "day_trading": "DAYTRADERPT",
+    "sec_trading": "BRKTOP1",
+    "investment_trust_buy": "SIT",
+    "investment_trust_sell": "SIT",
+    "highlight": "MARGRATIO",
+    "sbl": "OWZ66U",
+    "exempted": "MARGMARK",
+}
+
+NO_DATA_HTML = "<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>很抱歉，沒有符合條件的資料!</body></html>"
+THROTTLED_HTML = "<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>查詢過於頻繁，請稍後再試</body></html>"
+
+
+class StandinConfig:
+    """替身伺服器行為設定（執行中可透過 /standin/config 調整）"""
+
+    FIELDS = {
+        "latency": float,       # 每個請求的基本延遲（毫秒）
+        "jitter": float,        # 延遲的隨機增減（毫秒）
+        "error_rate": float,    # 回 HTTP 500 的比例
+        "no_data_rate": float,  # 回「查無資料」的比例（另外週末一律無資料）
+        "throttle": float,      # 每秒請求上限，超過回 429；0 表示不限
+        "rows": int,            # 每份 CSV 的筆數
+    }
+
+    def __init__(self, **kwargs):
+        self.latency = 0.0
+        self.jitter = 0.0
+        self.error_rate = 0.0
+        self.no_data_rate = 0.0
+        self.throttle = 0.0
+        self.rows = 1000
+        self.update(kwargs)
+
+    def update(self, values: Dict[str, Any]) -> None:
+        for key, value in values.items():
+            key = key.replace("-", "_")
+            if key in self.FIELDS and value is not None:
+                setattr(self, key, self.FIELDS[key](value))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+
+class StandinStats:
+    """請求統計"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.by_outcome: Dict[str, int] = {}
+        self.by_source: Dict[str, int] = {}
+        self.recent = deque()
+
+    def admit(self, limit: float) -> bool:
+        """限流：最近一秒內的請求數超過 limit 時拒絕"""
+        now = time.time()
+        with self.lock:
+            while self.recent and now - self.recent[0] > 1.0:
+                self.recent.popleft()
+            if limit and len(self.recent) >= limit:
+                return False
+            self.recent.append(now)
+            return True
+
+    def record(self, outcome: str, source: Optional[str], size: int) -> None:
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += size
+            self.by_outcome[outcome] = self.by_outcome.get(outcome, 0) + 1
+            if source:
+                self.by_source[source] = self.by_source.get(source, 0) + 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            elapsed = time.time() - self.started
+            return {
+                "uptime_seconds": round(elapsed, 1),
+                "requests": self.requests,
+                "requests_per_sec": round(self.requests / elapsed, 2) if elapsed else 0,
+                "bytes_sent": self.bytes_sent,
+                "by_outcome": dict(self.by_outcome),
+                "by_source": dict(self.by_source),
+            }
+
+
+# 上櫃查詢頁路徑 → 資料源（同一頁面可能對應買超 / 賣超兩項）
+# 與 download_items 的網址對應；刻意不載入下載器模組，避免在設定 TPEX_BASE_URL 前載入設定
+TPEX_PAGES = {
+    "/zh-tw/mainboard/trading/info/mi-pricing.html": ["daily_close_no1430"],
+    "/zh-tw/mainboard/trading/margin-trading/transactions.html": ["margin_transactions"],
+    "/zh-tw/mainboard/trading/major-institutional/detail/day.html": ["institutional_detail"],
+    "/zh-tw/mainboard/trading/day-trading/statistics/day.html": ["day_trading"],
+    "/zh-tw/mainboard/trading/info/sec-trading.html": ["sec_trading"],
+    "/zh-tw/mainboard/trading/major-institutional/domestic-inst/day.html":
+        ["investment_trust_buy", "investment_trust_sell"],
+    "/zh-tw/mainboard/trading/margin-trading/highlight.html": ["highlight"],
+    "/zh-tw/mainboard/trading/margin-trading/sbl.html": ["sbl"],
+    "/zh-tw/mainboard/trading/margin-trading/exempted.html": ["exempted"],
+}
+
+
+def parse_date(value: str) -> Optional[datetime]:
+    """YYYYMMDD 或民國 YYY/MM/DD"""
+    value = (value or "").strip()
+    try:
+        if "/" in value:
+            year, month, day = (int(part) for part in value.split("/"))
+            return datetime(year + 1911, month, day)
+        return datetime.strptime(value, "%Y%m%d")
+    except ValueError:
+        return None
+
+
+def tpex_page_html(path: str, sources: List[str]) -> str:
+    """模擬櫃買中心查詢頁：下載器用到的欄位、按鈕與表格都在，點「另存 CSV」導向 CSV 端點"""
+    today = datetime.today()
+    roc = f"{today.year - 1911}/{today.month:02d}/{today.day:02d}"
+    years = "".join(f"<option value='{y}'>{y}</option>" for y in range(today.year - 1911 - 3, today.year - 1911 + 1))
+    months = "".join(f"<option value='{m}'>{m}</option><option value='{m:02d}'>{m:02d}</option>" for m in range(1, 13))
+    rows = "".join(f"<tr><td>{1101 + i}</td><td>樣本{i}</td><td>{i * 10}</td></tr>" for i in range(20))
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{' / '.join(sources)}</title></head>
+<body>
+<div class="cookie-banner">本網站使用 cookie <button class="btn-close" onclick="this.parentNode.remove()">×</button></div>
+<form onsubmit="return false">
+  <input type="text" name="date" class="date" readonly value="{roc}">
+  <select class="form-select" name="type"><option value="EW">上櫃股票</option><option value="AL">所有證券</option></select>
+  <select name="year">{years}</select>
+  <select name="month">{months}</select>
+  <select name="searchType"><option value="buy">買超</option><option value="sell">賣超</option></select>
+  <select name="sect"><option value="EW">上櫃股票</option><option value="AL">全部</option></select>
+  <button type="button" class="btn-primary">查詢</button>
+</form>
+<button type="button" class="response" data-format="csv" onclick="saveCsv()">另存 CSV</button>
+<table class="table-default"><tr><th>代號</th><th>名稱</th><th>數值</th></tr>{rows}</table>
+<script>
+function saveCsv() {{
+  var q = new URLSearchParams();
+  q.set("page", location.pathname);
+  q.set("date", document.querySelector("input[name=date]").value);
+  q.set("year", document.querySelector("select[name=year]").value);
+  q.set("month", document.querySelector("select[name=month]").value);
+  q.set("searchType", document.querySelector("select[name=searchType]").value);
+  location.href = "/standin/tpex/csv?" + q.toString();
+}}
+</script>
+</body></html>"""
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    server_version = "StandinServer/1.0"
+    fixture_cache: Dict[Tuple[str, int], bytes] = {}
+    fixture_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # ----- 回應 -----
+    def _send(self, status: int, body: bytes, content_type: str, outcome: str,
+              source: Optional[str] = None, filename: Optional[str] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if filename:
+            self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(filename)}")
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stats.record(outcome, source, len(body))
+
+    def _html(self, status: int, html: str, outcome: str, source: Optional[str] = None) -> None:
+        self._send(status, html.encode("utf-8"), "text/html; charset=utf-8", outcome, source)
+
+    def _fixture(self, source: str, rows: int) -> bytes:
+        key = (source, rows)
+        with self.fixture_lock:
+            if key not in self.fixture_cache:
+                self.fixture_cache[key] = build_fixture(source, "cp950", rows)
+            return self.fixture_cache[key]
+
+    # ----- 路由 -----
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        config = self.server.config
+
+        if url.path == "/standin/stats":
+            body = json.dumps(self.server.stats.as_dict(), ensure_ascii=False).encode("utf-8")
+            return self._send(200, body, "application/json", "control")
+        if url.path == "/standin/config":
+            config.update(query)
+            body = json.dumps(config.as_dict()).encode("utf-8")
+            return self._send(200, body, "application/json", "control")
+
+        delay = max(config.latency + random.uniform(-config.jitter, config.jitter), 0)
+        time.sleep(delay / 1000)
+
+        if not self.server.stats.admit(config.throttle):
+            return self._html(429, THROTTLED_HTML, "throttled")
+        if random.random() < config.error_rate:
+            return self._html(500, "<html><body>Internal Server Error</body></html>", "error")
+
+        if url.path in TWSE_ROUTES:
+            return self._twse_csv(TWSE_ROUTES[url.path], query)
+        if url.path == "/standin/tpex/csv":
+            return self._tpex_csv(query)
+        if url.path in self.server.pages:
+            return self._html(200, tpex_page_html(url.path, self.server.pages[url.path]), "page")
+        return self._html(404, "<html><body>Not Found</body></html>", "not_found")
+
+    def _no_data(self, date: Optional[datetime]) -> bool:
+        weekend = date is not None and date.weekday() >= 5
+        return weekend or random.random() < self.server.config.no_data_rate
+
+    def _twse_csv(self, source: str, query: Dict[str, str]) -> None:
+        if self._no_data(parse_date(query.get("date", ""))):
+            return self._html(200, NO_DATA_HTML, "no_data", source)
+        body = self._fixture(source, self.server.config.rows)
+        self._send(200, body, "text/csv; charset=big5", "csv", source)
+
+    def _tpex_csv(self, query: Dict[str, str]) -> None:
+        sources = self.server.pages.get(query.get("page", ""), [])
+        if not sources:
+            return self._html(404, "<html><body>Not Found</body></html>", "not_found")
+        source = sources[0]
+        if len(sources) > 1:
+            wanted = f"_{query.get('searchType', '')}"
+            source = next((s for s in sources if s.endswith(wanted)), sources[0])
+
+        date = parse_date(query.get("date", "")) or datetime.today()
+        rows = 0 if self._no_data(date) else self.server.config.rows
+        roc = f"{date.year - 1911}{date.month:02d}{date.day:02d}"
+        filename = f"{TPEX_FILE_PREFIX.get(source, source.upper())}_{roc}.csv"
+        self._send(200, self._fixture(source, rows), "text/csv; charset=big5",
+                   "csv" if rows else "no_data", source, filename)
+
+
+def start_server(port: int = DEFAULT_PORT, config: Optional[StandinConfig] = None,
+                 verbose: bool = False) -> ThreadingHTTPServer:
+    """於背景執行緒啟動替身伺服器（供端對端壓測程式使用），回傳 server；以 server.shutdown() 結束"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StandinHandler)
+    server.daemon_threads = True
+    server.config = config or StandinConfig()
+    server.stats = StandinStats()
+    server.pages = TPEX_PAGES
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def arg_value(flag: str, default=None):
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+
+def main():
+    config = StandinConfig(
+        latency=arg_value("--latency"), jitter=arg_value("--jitter"),
+        error_rate=arg_value("--error-rate"), no_data_rate=arg_value("--no-data-rate"),
+        throttle=arg_value("--throttle"), rows=arg_value("--rows"),
+    )
+    server = start_server(int(arg_value("--port", DEFAULT_PORT)), config, verbose="--verbose" in sys.argv)
+    url = base_url(server)
+    print(f"[🔗] 替身伺服器啟動：{url}")
+    print(f"     設定：{config.as_dict()}")
+    print(f"     set TWSE_BASE_URL={url}")
+    print(f"     set TPEX_BASE_URL={url}")
+    print("     Ctrl+C 結束")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"\n[📊] 統計：{json.dumps(server.stats.as_dict(), ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cleaned Data Service - 清洗資料本機查詢服務
+把上市（C:\\05model\\cleaned）與上櫃（otc_cleaned/）的清洗檔整理成統一欄位，
+以 HTTP 提供查詢；多個模型行程共用同一份已載入的記憶體快取，不必各自 glob + 解析 CSV。
+每日資料表載入後以 stock_id 為索引放在 LRU 快取（依記憶體用量淘汰）；
+每次取用都比對來源檔的修改時間，每日更新發布新檔後下一次查詢自動重新載入
+
+端點（日期皆為 YYYYMMDD，stock_id 可用逗號分隔多檔）：
+    /close?stock_id=2330&from=20250101&to=20250131   收盤行情（上市 + 上櫃）
+    /institutional?date=20250102[&stock_id=...]      三大法人買賣超（未給 date 取最新一天）
+    /margin?stock_id=2330&from=&to=                  融資融券餘額序列
+    /dates?dataset=close                              可查詢的日期
+    /stats                                            快取狀態
+
+用法：
+    python cleaned_data_service.py                    # 127.0.0.1:8765
+    python cleaned_data_service.py --port 9000 --cache-mb 2048
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flow_features import source_dates, source_path
+from lazy_imports import lazy_import
+from margin_series import MarginSeries, series_dir
+from market_snapshot import (
+    OTC_COLUMNS, OTC_CLEAN_DIR, TWSE_COLUMNS, TWSE_CLEANED_DIR, TWSE_RAW_DIR,
+    normalize, signed_twse_change, snapshot_path,
+)
+
+pd = lazy_import("pandas")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_MB = 1024
+DATES_TTL = 30        # 日期清單最多沿用幾秒（目錄未變動時）
+
+# 法人買賣超統一欄位：上市由 T86（外資 / 合計）與 TWT44U（投信）合併，上櫃取自三大法人明細
+INSTITUTIONAL_COLUMNS = ["foreign_net", "trust_net", "total_net"]
+TWSE_INSTITUTIONAL = {"t86": {"foreign_buy": "foreign_net", "insti_net": "total_net"},
+                      "twt44u": {"trust_net": "trust_net"}}
+OTC_INSTITUTIONAL = {"institutional_detail": {"ii_foreign_net": "foreign_net", "ii_trust_net": "trust_net",
+                                              "ii_total_net": "total_net"}}
+
+# 各資料集的日期來源：(交易所, 清洗檔資料源)
+DATASET_SOURCES = {
+    "close": [("TWSE", "mi_index"), ("TPEx", "daily_close_no1430")],
+    "institutional": [("TWSE", "t86"), ("TWSE", "twt44u"), ("TPEx", "institutional_detail")],
+}
+
+
+class QueryError(Exception):
+    """查詢參數錯誤（回 400）"""
+
+
+# ===== LRU 快取 =====
+class FrameCache:
+    """
+    以記憶體用量為上限的 LRU 快取；每筆資料附帶來源檔簽章（路徑 + 修改時間），
+    簽章不同即視為過期重新載入。載入在鎖外進行，慢的讀檔不會擋住其他查詢
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict = OrderedDict()   # key → (signature, frame, nbytes)
+        self.total_bytes = 0
+        self.hits = self.misses = self.reloads = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str], signature: tuple, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+
+        frame = loader()
+        nbytes = int(frame.memory_usage(index=True, deep=True).sum())
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[2]
+            self.entries[key] = (signature, frame, nbytes)
+            self.total_bytes += nbytes
+            # 至少保留剛載入的這一筆
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, _, size) = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                self.evictions += 1
+        return frame
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"entries": len(self.entries), "mb": round(self.total_bytes / 1e6, 1),
+                    "max_mb": round(self.max_bytes / 1e6, 1), "hits": self.hits, "misses": self.misses,
+                    "reloads": self.reloads, "evictions": self.evictions}
+
+
+def file_signature(paths: List[Optional[str]]) -> tuple:
+    """來源檔簽章；檔案不存在時記為 None，出現後簽章即改變"""
+    signature = []
+    for path in paths:
+        try:
+            signature.append((str(path), os.stat(path).st_mtime_ns))
+        except (OSError, TypeError):
+            signature.append((str(path), None))
+    return tuple(signature)
+
+
+# ===== 資料載入（每日一張表，以 stock_id 為索引）=====
+def read_cleaned(path: str) -> pd.DataFrame:
+    return pd.read_csv(path, dtype={"stock_id": str}, encoding="utf-8-sig")
+
+
+def close_paths(date_str: str) -> List[Optional[str]]:
+    return [source_path("TWSE", "mi_index", date_str), source_path("TPEx", "daily_close_no1430", date_str)]
+
+
+def load_close(date_str: str) -> pd.DataFrame:
+    """已有比來源新的快照就直接讀 Feather；否則由清洗檔組成（只有一邊有資料也可查）"""
+    twse_path, otc_path = close_paths(date_str)
+    snapshot = snapshot_path(date_str)
+    sources = [p for p in (twse_path, otc_path) if p]
+    if twse_path and otc_path and snapshot.exists() and \
+            snapshot.stat().st_mtime >= max(os.path.getmtime(p) for p in sources):
+        return pd.read_feather(snapshot).set_index("stock_id")
+    frames = []
+    if twse_path:
+        frames.append(normalize(signed_twse_change(read_cleaned(twse_path)), "TWSE", TWSE_COLUMNS))
+    if otc_path:
+        frames.append(normalize(read_cleaned(otc_path), "TPEx", OTC_COLUMNS))
+    if not frames:
+        return pd.DataFrame(index=pd.Index([], name="stock_id"))
+    close = pd.concat(frames, ignore_index=True).drop_duplicates("stock_id", keep="first")
+    return close.set_index("stock_id").sort_index()
+
+
+def institutional_paths(date_str: str) -> List[Optional[str]]:
+    return [source_path("TWSE", s, date_str) for s in TWSE_INSTITUTIONAL] + \
+           [source_path("TPEx", s, date_str) for s in OTC_INSTITUTIONAL]
+
+
+def read_institutional(exchange: str, spec: Dict[str, Dict[str, str]], date_str: str) -> Optional[pd.DataFrame]:
+    merged = None
+    for source, renames in spec.items():
+        path = source_path(exchange, source, date_str)
+        if path is None:
+            continue
+        df = read_cleaned(path)
+        df = df[["stock_id"] + [c for c in renames if c in df.columns]].rename(columns=renames)
+        df["stock_id"] = df["stock_id"].str.strip()
+        df = df.groupby("stock_id").sum()
+        merged = df if merged is None else merged.join(df, how="outer")
+    if merged is None:
+        return None
+    merged = merged.reindex(columns=INSTITUTIONAL_COLUMNS)
+    merged.insert(0, "exchange", exchange)
+    return merged
+
+
+def load_institutional(date_str: str) -> pd.DataFrame:
+    frames = [f for f in (read_institutional("TWSE", TWSE_INSTITUTIONAL, date_str),
+                          read_institutional("TPEx", OTC_INSTITUTIONAL, date_str)) if f is not None]
+    if not frames:
+        return pd.DataFrame(columns=["exchange"] + INSTITUTIONAL_COLUMNS, index=pd.Index([], name="stock_id"))
+    return pd.concat(frames).sort_index()
+
+
+DATASETS = {
+    "close": (close_paths, load_close),
+    "institutional": (institutional_paths, load_institutional),
+}
+
+
+# ===== 查詢 =====
+class CleanedDataStore:
+    """服務端的資料存取層（也可在單一行程內直接使用）"""
+
+    def __init__(self, cache_mb: int = DEFAULT_CACHE_MB):
+        self.cache = FrameCache(cache_mb * 1_000_000)
+        self.dates_cache: Dict[str, Tuple[tuple, float, List[str]]] = {}
+        self.margin: Dict[str, Tuple[tuple, MarginSeries]] = {}
+        self.lock = threading.Lock()
+
+    def dates(self, dataset: str) -> List[str]:
+        """資料集可查詢的日期；目錄（含上市原始檔索引）有變動或超過 DATES_TTL 才重新列出"""
+        if dataset not in DATASET_SOURCES:
+            raise QueryError(f"未知的資料集：{dataset}")
+        signature = file_signature([TWSE_CLEANED_DIR, TWSE_RAW_DIR, str(OTC_CLEAN_DIR)])
+        with self.lock:
+            cached = self.dates_cache.get(dataset)
+            if cached and cached[0] == signature and time.time() - cached[1] < DATES_TTL:
+                return cached[2]
+        dates = set()
+        for exchange, source in DATASET_SOURCES[dataset]:
+            dates.update(source_dates(exchange, source))
+        dates = sorted(dates)
+        with self.lock:
+            self.dates_cache[dataset] = (signature, time.time(), dates)
+        return dates
+
+    def day(self, dataset: str, date_str: str) -> pd.DataFrame:
+        paths_func, loader = DATASETS[dataset]
+        return self.cache.get((dataset, date_str), file_signature(paths_func(date_str)),
+                              lambda: loader(date_str))
+
+    def range(self, dataset: str, stock_ids: Optional[List[str]], start: str, end: str) -> pd.DataFrame:
+        """[start, end] 區間的長表（date / stock_id / 欄位）"""
+        dates = self.dates(dataset)
+        selected = dates[bisect.bisect_left(dates, start):bisect.bisect_right(dates, end)]
+        frames = []
+        for date_str in selected:
+            day = self.day(dataset, date_str)
+            if stock_ids is not None:
+                day = day.loc[day.index.intersection(stock_ids)]
+            if len(day):
+                frames.append(day.reset_index().assign(date=date_str))
+        if not frames:
+            return pd.DataFrame(columns=["date", "stock_id"])
+        result = pd.concat(frames, ignore_index=True)
+        return result[["date"] + [c for c in result.columns if c != "date"]]
+
+    def margin_series(self, exchange: str) -> MarginSeries:
+        """融資券序列本身以 memmap 讀取；index.json 變動（每日追加）時重新開啟"""
+        signature = file_signature([str(series_dir(exchange) / "index.json")])
+        with self.lock:
+            cached = self.margin.get(exchange)
+            if cached and cached[0] == signature:
+                return cached[1]
+        series = MarginSeries(exchange, read_only=True)
+        with self.lock:
+            self.margin[exchange] = (signature, series)
+        return series
+
+    def margin_range(self, stock_ids: Optional[List[str]], start: str, end: str) -> pd.DataFrame:
+        frames = []
+        for exchange in ("TWSE", "TPEx"):
+            result = self.margin_series(exchange).query(stock_ids, start, end)
+            if len(result):
+                frames.append(result.assign(exchange=exchange))
+        if not frames:
+            return pd.DataFrame(columns=["date", "stock_id"])
+        return pd.concat(frames, ignore_index=True).sort_values(["date", "stock_id"], ignore_index=True)
+
+
+# ===== HTTP =====
+def parse_stock_ids(params: Dict[str, List[str]]) -> Optional[List[str]]:
+    values = [v.strip() for raw in params.get("stock_id", []) for v in raw.split(",") if v.strip()]
+    return values or None
+
+
+def parse_date(params: Dict[str, List[str]], name: str, default: str) -> str:
+    value = params.get(name, [default])[0] or default
+    if not (len(value) == 8 and value.isdigit()):
+        raise QueryError(f"{name} 必須是 YYYYMMDD：{value}")
+    return value
+
+
+def records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """NaN → null；透過 to_json 處理 numpy 型別"""
+    return json.loads(df.to_json(orient="records", force_ascii=False))
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    store: CleanedDataStore = None   # 由 serve() 指定
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        route = url.path.rstrip("/") or "/"
+        try:
+            handler = {
+                "/close": self.handle_close,
+                "/institutional": self.handle_institutional,
+                "/margin": self.handle_margin,
+                "/dates": self.handle_dates,
+                "/stats": self.handle_stats,
+            }.get(route)
+            if handler is None:
+                self.reply(404, {"error": f"未知的端點：{route}"})
+                return
+            self.reply(200, handler(params))
+        except QueryError as e:
+            self.reply(400, {"error": str(e)})
+        except Exception as e:
+            logging.exception(f"[查詢服務] {self.path} 失敗")
+            self.reply(500, {"error": str(e)})
+
+    def handle_close(self, params):
+        stock_ids = parse_stock_ids(params)
+        start, end = parse_date(params, "from", "00000000"), parse_date(params, "to", "99999999")
+        if stock_ids is None and (start == "00000000" or end == "99999999"):
+            raise QueryError("未指定 stock_id 時必須給 from 與 to")
+        return {"rows": records(self.store.range("close", stock_ids, start, end))}
+
+    def handle_institutional(self, params):
+        dates = self.store.dates("institutional")
+        if not dates:
+            return {"date": None, "rows": []}
+        date_str = parse_date(params, "date", dates[-1])
+        day = self.store.day("institutional", date_str)
+        stock_ids = parse_stock_ids(params)
+        if stock_ids is not None:
+            day = day.loc[day.index.intersection(stock_ids)]
+        return {"date": date_str, "rows": records(day.reset_index())}
+
+    def handle_margin(self, params):
+        stock_ids = parse_stock_ids(params)
+        if stock_ids is None:
+            raise QueryError("必須指定 stock_id")
+        start, end = parse_date(params, "from", "00000000"), parse_date(params, "to", "99999999")
+        return {"rows": records(self.store.margin_range(stock_ids, start, end))}
+
+    def handle_dates(self, params):
+        dataset = params.get("dataset", ["close"])[0]
+        return {"dataset": dataset, "dates": self.store.dates(dataset)}
+
+    def handle_stats(self, params):
+        return self.store.cache.stats()
+
+    def reply(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(f"[查詢服務] {self.address_string()} {format % args}")
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, cache_mb: int = DEFAULT_CACHE_MB) -> None:
+    ServiceHandler.store = CleanedDataStore(cache_mb)
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    logging.info(f"[查詢服務] http://{host}:{port}（快取上限 {cache_mb} MB）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("[查詢服務] 收到中斷，停止服務")
+    finally:
+        server.server_close()
+
+
+# ===== 用戶端（給模型程式用）=====
+def query(endpoint: str, base_url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+          timeout: float = 60, **params) -> pd.DataFrame:
+    """
+    查詢服務並回傳 DataFrame，例如 query("close", stock_id="2330,6488", **{"from": "20250101"})；
+    stock_id 可傳清單
+    """
+    if isinstance(params.get("stock_id"), (list, tuple)):
+        params["stock_id"] = ",".join(params["stock_id"])
+    url = f"{base_url}/{endpoint.strip('/')}?{urllib.parse.urlencode(params)}"
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        body = json.loads(response.read().decode("utf-8"))
+    return pd.DataFrame(body.get("rows", []))
+
+
+def arg_value(flag: str, default: str) -> str:
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    serve(arg_value("--host", DEFAULT_HOST), int(arg_value("--port", str(DEFAULT_PORT))),
+          int(arg_value("--cache-mb", str(DEFAULT_CACHE_MB))))
+
+
+if __name__ == "__main__":
+    main()
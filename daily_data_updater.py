@@ -2,18 +2,34 @@
 # -*- coding: utf-8 -*-
 
 import os
-import re
 import io
-import requests
+import shutil
+import sys
 import urllib3
-import pandas as pd
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_imports import lazy_import
+from raw_catalog import get_catalog, parse_filename
+from http_client import create_session, connection_stats, format_stats
+from endpoints import twse_host, twse_url
+from market_snapshot import update_snapshot
+from flow_features import update_flow_features
+from margin_series import update_margin_series
+from retry_engine import RetryEngine, RetryPolicy, FetchError, classify_response
+from source_readiness import FRESH, STALE, previous_trading_day, wait_until_ready
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# pandas 延遲到第一次清洗才載入，下載可先開始
+pd = lazy_import("pandas")
+
 RAW_DIR = r"C:\05model\raw"
 CLEANED_DIR = r"C:\05model\cleaned"
-MAX_LOOKBACK = 5
+READY_MAX_WAIT = 20 * 60      # 過了公布時間仍未出現時最多等待秒數（--no-wait 不等待）
+HTTP_TRANSPORT = "requests"   # "requests" 或 "httpx"（HTTP/2）
+PIPELINED = True              # 下載後直接以記憶體交給清洗；--no-pipeline 改回逐步模式
+
+RETRY_ENGINE = RetryEngine(twse_host(), RetryPolicy(max_attempts=3, base_delay=5))
 
 HEADERS = {
     "User-Agent": (
@@ -23,57 +39,108 @@ HEADERS = {
     )
 }
 
-REFERER = {
-    "t86": "https://www.twse.com.tw/exchangeReport/TWT86U",
-    "twt44u": "https://www.twse.com.tw/fund/TWT44U",
-    "twt38u": "https://www.twse.com.tw/fund/TWT38U",
-    "mi_margn": "https://www.twse.com.tw/exchangeReport/MI_MARGN",
-    "mi_index": "https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX"
+# 網址在呼叫時才組出（TWSE_BASE_URL 於組網址時讀取）
+REFERER_PATH = {
+    "t86": "/exchangeReport/TWT86U",
+    "twt44u": "/fund/TWT44U",
+    "twt38u": "/fund/TWT38U",
+    "mi_margn": "/exchangeReport/MI_MARGN",
+    "mi_index": "/rwd/zh/afterTrading/MI_INDEX"
 }
 
 URLS = {
-    "t86": lambda d, tw: f"https://www.twse.com.tw/rwd/zh/fund/T86?response=csv&date={d}&selectType=ALLBUT0999",
-    "twt44u": lambda d, tw: f"https://www.twse.com.tw/fund/TWT44U?response=csv&date={d}&selectType=ALL",
-    "twt38u": lambda d, tw: f"https://www.twse.com.tw/fund/TWT38U?response=csv&date={d}&selectType=ALL",
-    "mi_margn": lambda d, tw: f"https://www.twse.com.tw/exchangeReport/MI_MARGN?response=csv&date={d}&selectType=ALL",
-    "mi_index": lambda d, tw: f"https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX?response=csv&date={d}&type=ALL"
+    "t86": lambda d, tw: twse_url(f"/rwd/zh/fund/T86?response=csv&date={d}&selectType=ALLBUT0999"),
+    "twt44u": lambda d, tw: twse_url(f"/fund/TWT44U?response=csv&date={d}&selectType=ALL"),
+    "twt38u": lambda d, tw: twse_url(f"/fund/TWT38U?response=csv&date={d}&selectType=ALL"),
+    "mi_margn": lambda d, tw: twse_url(f"/exchangeReport/MI_MARGN?response=csv&date={d}&selectType=ALL"),
+    "mi_index": lambda d, tw: twse_url(f"/rwd/zh/afterTrading/MI_INDEX?response=csv&date={d}&type=ALL")
 }
 
 def ensure_dir(path):
-    if not os.path.exists(path):
-        os.makedirs(path)
+    # 清洗可能在多個執行緒同時呼叫
+    os.makedirs(path, exist_ok=True)
+
+def persist_raw(d, name, content):
+    """原始檔落地（pipelined 模式下於背景執行緒寫入，供稽核）"""
+    ensure_dir(RAW_DIR)
+    fn = os.path.join(RAW_DIR, f"{d}_{name}.csv")
+    catalog = get_catalog(RAW_DIR)
+    with catalog.writing():
+        with open(fn, "wb") as f:
+            f.write(content)
+        catalog.record(fn, content)
+    print(f"[✅] {name} raw → {fn}")
+    return fn
+
+def roc_date(t):
+    return f"{t.year-1911}/{t.month:02}/{t.day:02}"
+
+def fetch_date(session, name, url_func, t):
+    """抓取指定日期；該日無資料回傳 None，網站異常時拋出例外"""
+    d = t.strftime("%Y%m%d")
+
+    def fetch():
+        r = session.get(url_func(d, roc_date(t)), headers={"Referer": twse_url(REFERER_PATH[name])}, timeout=10)
+        kind = classify_response(r.status_code, r.content, allow_html=(name == "t86"))
+        if kind:
+            raise FetchError(kind, f"status={r.status_code} size={len(r.content)}", r.status_code)
+        return r.content
 
-def is_html_bytes(b: bytes) -> bool:
-    text = b.decode("utf-8", errors="ignore").lower()
-    return any(tag in text[:500] for tag in ("<html", "<!doctype", "<head", "<script"))
+    return RETRY_ENGINE.run(fetch, label=f"{name} {d}")
+
+# 本次執行各資料源的就緒結果（fresh / stale / error）
+READINESS = {}
+
+def fetch_latest(session, name, url_func):
+    """
+    依公布時間決定應取得的交易日，探測到已公布時直接沿用探測讀完的內容（只發一次 GET）；回傳 (YYYYMMDD, bytes)。
+    尚未公布時不回溯下載舊日期，回傳 None 讓清洗沿用磁碟上最新的原始檔；
+    只有前一交易日的原始檔也不在時才補抓前一交易日
+    """
+    wait = 0 if "--no-wait" in sys.argv else READY_MAX_WAIT
+    result = wait_until_ready(session, name, lambda t: url_func(t.strftime("%Y%m%d"), roc_date(t)),
+                              twse_url(REFERER_PATH[name]), allow_html=(name == "t86"), max_wait=wait)
+    READINESS[name] = result
+    if result.ready:
+        return result.date_str, result.content
+
+    print(f"[⏳] {result.describe()}")
+    prev = previous_trading_day(result.target)
+    prev_str = prev.strftime("%Y%m%d")
+    if result.status == STALE and not get_catalog(RAW_DIR).has(name, prev_str):
+        try:
+            content = fetch_date(session, name, url_func, prev)
+        except Exception as e:
+            print(f"[❌] {name} raw 下載失敗: {e}")
+            return None
+        if content is not None:
+            print(f"[ℹ] {name} 補抓前一交易日 {prev_str}")
+            return prev_str, content
+    return None
+
+def print_readiness():
+    """回報各資料源是否取得當日資料"""
+    if not READINESS:
+        return
+    fresh = sum(1 for r in READINESS.values() if r.status == FRESH)
+    print(f"[📅] 當日資料 {fresh}/{len(READINESS)}")
+    for result in READINESS.values():
+        tag = "[✅]" if result.status == FRESH else "[⏳]" if result.status == STALE else "[❌]"
+        print(f"  {tag} {result.describe()}")
 
 def download_one(session, name, url_func):
-    today = datetime.today()
-    for i in range(MAX_LOOKBACK):
-        t = today - timedelta(days=i)
-        d = t.strftime("%Y%m%d")
-        tw = f"{t.year-1911}/{t.month:02}/{t.day:02}"
-        r = session.get(
-            url_func(d, tw),
-            headers={**HEADERS, "Referer": REFERER[name]},
-            verify=False,
-            timeout=10
-        )
-        if r.status_code == 200 and len(r.content) > 500:
-            if name == "t86" or not is_html_bytes(r.content):
-                ensure_dir(RAW_DIR)
-                fn = os.path.join(RAW_DIR, f"{d}_{name}.csv")
-                with open(fn, "wb") as f:
-                    f.write(r.content)
-                print(f"[✅] {name} raw → {fn}")
-                return True
-    print(f"[❌] {name} raw 無法下載 (超過 {MAX_LOOKBACK} 天)")
-    return False
+    got = fetch_latest(session, name, url_func)
+    if got is None:
+        return False
+    persist_raw(got[0], name, got[1])
+    return True
 
 def download_all():
-    sess = requests.Session()
+    sess = create_session(HEADERS, transport=HTTP_TRANSPORT)
     for name, func in URLS.items():
         download_one(sess, name, func)
+    print_readiness()
+    print(f"[🔗] 連線統計: {format_stats(connection_stats(sess))}")
 
 def clean_numeric(val):
     s = str(val).replace(",", "").strip()
@@ -84,24 +151,56 @@ def clean_numeric(val):
     except:
         return 0.0
 
-def read_csv_auto(path, **kwargs):
+def change_sign_series(s):
+    """漲跌(+/-) 欄：原始檔以 HTML 標示（<p style= color:red>+</p>）→ +1 / -1；空白為平盤 0，X（不比價）為 NaN"""
+    text = s.astype(str).str.replace(r"<[^>]+>", "", regex=True).str.strip()
+    return text.map({"+": 1.0, "-": -1.0, "": 0.0, "nan": 0.0})
+
+def read_csv_auto(src, **kwargs):
+    """src 可為檔案路徑或下載取得的 bytes（以 BytesIO 包裝，不經過磁碟）"""
     for enc in ("cp950", "utf-8"):
         try:
-            return pd.read_csv(path, encoding=enc, **kwargs)
+            return pd.read_csv(_as_buffer(src), encoding=enc, **kwargs)
         except:
             pass
-    return pd.read_csv(path, encoding="cp950", errors="ignore", **kwargs)
+    return pd.read_csv(_as_buffer(src), encoding="cp950", encoding_errors="ignore", **kwargs)
+
+def _as_buffer(src):
+    # BytesIO 包裝 bytes 時共用同一塊記憶體，直到被寫入才複製
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return io.BytesIO(src)
+    return src
 
 def latest_raw(prefix):
-    fs = [f for f in os.listdir(RAW_DIR) if f.lower().endswith(f"_{prefix}.csv")]
-    if not fs:
+    # 由原始檔目錄索引查詢，不再每次列出並排序整個 RAW_DIR
+    p = get_catalog(RAW_DIR).latest(prefix)
+    if p is None:
         raise FileNotFoundError(prefix)
-    fs.sort(key=lambda x: int(re.search(r"(\d{8})", x).group(1)), reverse=True)
-    return os.path.join(RAW_DIR, fs[0])
+    return p
 
-def process_t86():
+def resolve_raw(raw, date_str, name):
+    """raw 未指定時取原始檔索引中最新的檔案；資料日期取自呼叫端，或原始檔檔名"""
+    if raw is None:
+        raw = latest_raw(name)
+    if date_str is None and isinstance(raw, str):
+        parsed = parse_filename(os.path.basename(raw))
+        date_str = parsed[0] if parsed else None
+    return raw, date_str
+
+def write_cleaned(df, suffix, date_str):
+    """
+    寫出 cleaned_<suffix>.csv（既有流程沿用），並另存帶資料日期的 <date>_cleaned_<suffix>.csv
+    （與歷史批量同名）；下游依日期取檔，清洗失敗的日子不會誤用前一天的 cleaned_<suffix>.csv
+    """
+    out = os.path.join(CLEANED_DIR, f"cleaned_{suffix}.csv")
+    df.to_csv(out, index=False, encoding="utf-8-sig")
+    if date_str:
+        shutil.copyfile(out, os.path.join(CLEANED_DIR, f"{date_str}_cleaned_{suffix}.csv"))
+    return out
+
+def process_t86(raw=None, date_str=None):
     ensure_dir(CLEANED_DIR)
-    p = latest_raw("t86")
+    p, date_str = resolve_raw(raw, date_str, "t86")
     df = read_csv_auto(p, skiprows=1, dtype=str)
     df.columns = df.columns.str.strip()
     df = df.rename(columns={
@@ -112,13 +211,12 @@ def process_t86():
     df = df[df["stock_id"].str.match(r"^\d{4}$", na=False)]
     df["foreign_buy"] = df["foreign_buy"].apply(clean_numeric)
     df["insti_net"] = df["insti_net"].apply(clean_numeric)
-    out = os.path.join(CLEANED_DIR, "cleaned_t86.csv")
-    df.to_csv(out, index=False, encoding="utf-8-sig")
+    out = write_cleaned(df, "t86", date_str)
     print(f"[✅] t86 cleaned → {out}")
 
-def process_twt44u():
+def process_twt44u(raw=None, date_str=None):
     ensure_dir(CLEANED_DIR)
-    p = latest_raw("twt44u")
+    p, date_str = resolve_raw(raw, date_str, "twt44u")
     df = read_csv_auto(p, skiprows=1, dtype=str)
     df.columns = df.columns.str.strip()
     df.iloc[:, 1] = df.iloc[:, 1].str.replace("=", "").str.strip()
@@ -128,13 +226,12 @@ def process_twt44u():
     df["trust_buy"] = df["trust_buy"].apply(clean_numeric)
     df["trust_sell"] = df["trust_sell"].apply(clean_numeric)
     df["trust_net"] = df["trust_net"].apply(clean_numeric)
-    out = os.path.join(CLEANED_DIR, "cleaned_twt44u.csv")
-    df.to_csv(out, index=False, encoding="utf-8-sig")
+    out = write_cleaned(df, "twt44u", date_str)
     print(f"[✅] twt44u cleaned → {out}")
 
-def process_twt38u():
+def process_twt38u(raw=None, date_str=None):
     ensure_dir(CLEANED_DIR)
-    p = latest_raw("twt38u")
+    p, date_str = resolve_raw(raw, date_str, "twt38u")
     df = read_csv_auto(p, skiprows=2, dtype=str)
     df.columns = df.columns.str.strip()
     df.iloc[:, 1] = df.iloc[:, 1].str.replace("=", "").str.strip()
@@ -150,32 +247,38 @@ def process_twt38u():
     result_df["FA_Sell"] = df.iloc[:, 10].apply(clean_numeric)
     result_df["FA_Net"] = df.iloc[:, 11].apply(clean_numeric)
     result_df = result_df[result_df["stock_id"].str.match(r"^\d{4}$", na=False)]
-    out = os.path.join(CLEANED_DIR, "cleaned_twt38u.csv")
-    result_df.to_csv(out, index=False, encoding="utf-8-sig")
+    out = write_cleaned(result_df, "twt38u", date_str)
     print(f"[✅] twt38u cleaned → {out}")
 
-def process_margen():
+def process_margen(raw=None, date_str=None):
     ensure_dir(CLEANED_DIR)
-    p = latest_raw("mi_margn")
+    p, date_str = resolve_raw(raw, date_str, "mi_margn")
     df = read_csv_auto(p, skiprows=7, dtype=str)
     df.columns = df.columns.str.strip()
     df["stock_id"] = df.iloc[:, 0].str.strip()
     df = df[df["stock_id"].str.match(r"^\d{4}$", na=False)]
     df["margin_diff"] = df.iloc[:, 6].apply(clean_numeric) - df.iloc[:, 5].apply(clean_numeric)
     df["short_diff"] = df.iloc[:, 12].apply(clean_numeric) - df.iloc[:, 11].apply(clean_numeric)
-    out = os.path.join(CLEANED_DIR, "cleaned_margen.csv")
-    df[["stock_id", "margin_diff", "short_diff"]].to_csv(out, index=False, encoding="utf-8-sig")
+    out = write_cleaned(df[["stock_id", "margin_diff", "short_diff"]], "margen", date_str)
     print(f"[✅] mi_margn cleaned → {out}")
 
-def process_mi_index():
-    ensure_dir(CLEANED_DIR)
-    p = latest_raw("mi_index")
-    header_row = None
-    with open(p, "r", encoding="cp950", errors="ignore") as f:
-        for idx, line in enumerate(f):
+def find_mi_index_header(src):
+    # 與 read_csv_auto 相同的編碼順序：cp950 找不到標題時再以 UTF-8（含 BOM）尋找
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        raw = bytes(src)
+    else:
+        with open(src, "rb") as f:
+            raw = f.read()
+    for enc in ("cp950", "utf-8-sig"):
+        for idx, line in enumerate(raw.decode(enc, errors="ignore").split("\n")):
             if "證券代號" in line and "收盤價" in line:
-                header_row = idx
-                break
+                return idx
+    return None
+
+def process_mi_index(raw=None, date_str=None):
+    ensure_dir(CLEANED_DIR)
+    p, date_str = resolve_raw(raw, date_str, "mi_index")
+    header_row = find_mi_index_header(p)
     if header_row is None:
         raise RuntimeError("找不到 MI_INDEX 標題")
     print(f"[ℹ] mi_index header at line {header_row+1}")
@@ -186,7 +289,11 @@ def process_mi_index():
     df = df.drop(columns=[c for c in df.columns if c.startswith("Unnamed")], errors="ignore")
 
     # 只保留 4 位數股票代號
-    df = df[df["證券代號"].str.match(r"^\d{4}$", na=False)]
+    df = df[df["證券代號"].str.match(r"^\d{4}$", na=False)].copy()
+
+    # 漲跌價差不含正負號，另存方向欄 change_sign
+    if "漲跌(+/-)" in df.columns:
+        df["change_sign"] = change_sign_series(df.pop("漲跌(+/-)"))
 
     # 重新命名欄位（包含 '證券名稱' → 'name'）
     df = df.rename(columns={
@@ -207,16 +314,64 @@ def process_mi_index():
         "本益比": "per"
     })
 
-    # 針對數值欄位做 clean_numeric；保留 'stock_id' 和 'name' 不轉為數字
+    # 針對數值欄位做 clean_numeric；保留 'stock_id'、'name' 與 'change_sign' 不轉換
     for col in df.columns:
-        if col not in ["stock_id", "name"]:
+        if col not in ["stock_id", "name", "change_sign"]:
             df[col] = df[col].apply(clean_numeric)
 
-    out = os.path.join(CLEANED_DIR, "cleaned_mi_index.csv")
-    df.to_csv(out, index=False, encoding="utf-8-sig")
+    out = write_cleaned(df, "mi_index", date_str)
     print(f"[✅] mi_index cleaned → {out}")
 
+PROCESSORS = {
+    "t86": process_t86,
+    "twt44u": process_twt44u,
+    "twt38u": process_twt38u,
+    "mi_margn": process_margen,
+    "mi_index": process_mi_index
+}
+
+def run_pipelined():
+    """
+    下載 → 清洗直接以記憶體交棒：
+    回應 bytes 直接交給對應的 process_*，原始檔在背景寫入；
+    清洗與後續資料源的下載重疊，也不需要再掃描 RAW_DIR
+    """
+    sess = create_session(HEADERS, transport=HTTP_TRANSPORT)
+    jobs = []
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="raw-writer") as writer, \
+            ThreadPoolExecutor(max_workers=2, thread_name_prefix="cleaner") as cleaners:
+        for name, func in URLS.items():
+            got = fetch_latest(sess, name, func)
+            if got is None:
+                # 今日下載失敗時沿用磁碟上最新的原始檔，行為與逐步模式一致
+                jobs.append((name, None, cleaners.submit(PROCESSORS[name])))
+                continue
+            d, content = got
+            jobs.append((name,
+                         writer.submit(persist_raw, d, name, content),
+                         cleaners.submit(PROCESSORS[name], content, d)))
+
+        failed = 0
+        for name, persisted, cleaned in jobs:
+            try:
+                if persisted is not None:
+                    persisted.result()
+                cleaned.result()
+            except Exception as e:
+                failed += 1
+                print(f"[❌] {name} 失敗: {e}")
+    print_readiness()
+    print(f"[🔗] 連線統計: {format_stats(connection_stats(sess))}")
+    return failed
+
 if __name__ == "__main__":
+    if PIPELINED and "--no-pipeline" not in sys.argv:
+        print("── Downloading + cleaning (pipelined) ──")
+        failed = run_pipelined()
+        update_snapshot()
+        update_flow_features(exchange="TWSE")
+        update_margin_series(exchange="TWSE")
+        sys.exit(1 if failed else 0)
     print("── Downloading raw data ──")
     download_all()
     print("── Cleaning each source ──")
@@ -225,3 +380,6 @@ if __name__ == "__main__":
     process_twt38u()
     process_margen()
     process_mi_index()
+    update_snapshot()
+    update_flow_features(exchange="TWSE")
+    update_margin_series(exchange="TWSE")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Endpoints - 證交所 / 櫃買中心網址根目錄
+預設為正式網站；設定環境變數 TWSE_BASE_URL / TPEX_BASE_URL 即可把所有下載導向其他主機
+（例如 benchmarks/standin_server.py 的本機替身伺服器），離線跑端對端測試。
+環境變數在組網址時才讀取，載入模組之後再設定也有效
+"""
+
+import os
+from typing import Any, Dict
+from urllib.parse import urlparse
+
+TWSE_DEFAULT = "https://www.twse.com.tw"
+TPEX_DEFAULT = "https://www.tpex.org.tw"
+
+
+def twse_base_url() -> str:
+    return os.environ.get("TWSE_BASE_URL", TWSE_DEFAULT).rstrip("/")
+
+
+def tpex_base_url() -> str:
+    return os.environ.get("TPEX_BASE_URL", TPEX_DEFAULT).rstrip("/")
+
+
+# 熔斷器以主機區分；改用替身伺服器時不會影響正式網站的熔斷狀態
+def twse_host() -> str:
+    return urlparse(twse_base_url()).netloc
+
+
+def tpex_host() -> str:
+    return urlparse(tpex_base_url()).netloc
+
+
+def twse_url(path: str) -> str:
+    """上市網址：path 以 / 開頭"""
+    return f"{twse_base_url()}{path}"
+
+
+def tpex_url(url: str) -> str:
+    """上櫃網址：完整正式網址或 / 開頭的路徑都改寫到 TPEX_BASE_URL"""
+    if url.startswith(TPEX_DEFAULT):
+        url = url[len(TPEX_DEFAULT):]
+    if url.startswith("/"):
+        return f"{tpex_base_url()}{url}"
+    return url
+
+
+def rebase_download_items(config: Dict[str, Any]) -> Dict[str, Any]:
+    """把設定檔 download_items 的網址改寫到 TPEX_BASE_URL（未設定環境變數時不變）"""
+    for item in config.get("download_items", {}).values():
+        if "url" in item:
+            item["url"] = tpex_url(item["url"])
+    return config
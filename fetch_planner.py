@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fetch Planner - 上市資料抓取計畫
+依各資料源支援的查詢變體（單日 / 月份 / 區間）把 (資料源, 日期) 組成最少的請求：
+- 有月份或區間變體的資料源：一個請求抓整段，再切回逐日原始檔（與 process_date_* 讀取格式相同）
+- 只有單日變體的資料源：逐日請求，但先剔除休市日與已存在的檔案
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+try:
+    import holidays
+except ImportError:  # 沒有 holidays 時只排除週末
+    holidays = None
+
+
+class BulkVariant:
+    """
+    資料源的批量查詢變體
+    - url_func(start, end)：產生涵蓋 start~end 的查詢網址
+    - split(content)：把回應切成 {YYYYMMDD: 逐日原始檔 bytes}，輸出須與單日 CSV 位元組相容
+    - span："month"（依月份分組）或 "range"（連續日期一次抓）
+    """
+
+    def __init__(self, url_func: Callable[[datetime, datetime], str],
+                 split: Callable[[bytes], Dict[str, bytes]], span: str = "month"):
+        self.url_func = url_func
+        self.split = split
+        self.span = span
+
+
+# 資料源 → 批量變體。
+# 目前 T86 / TWT44U / TWT38U / MI_MARGN / MI_INDEX 在 twse 只提供單日全市場 CSV
+# （月報 / 週報是彙總數字，無法切回逐日明細），因此預設皆為逐日請求；
+# 日後找到可切分的變體時以 register_bulk_variant() 登記即可。
+BULK_VARIANTS: Dict[str, BulkVariant] = {}
+
+
+def register_bulk_variant(name: str, variant: BulkVariant) -> None:
+    """登記資料源的批量查詢變體"""
+    BULK_VARIANTS[name] = variant
+
+
+class FetchRequest:
+    """一個實際送出的 HTTP 請求，涵蓋一個或多個日期"""
+
+    def __init__(self, name: str, dates: List[datetime], variant: Optional[BulkVariant] = None):
+        self.name = name
+        self.dates = dates
+        self.variant = variant
+
+    @property
+    def is_bulk(self) -> bool:
+        return self.variant is not None
+
+    @property
+    def url(self) -> Optional[str]:
+        if not self.is_bulk:
+            return None
+        return self.variant.url_func(self.dates[0], self.dates[-1])
+
+    def __repr__(self) -> str:
+        kind = self.variant.span if self.is_bulk else "daily"
+        return f"FetchRequest({self.name}, {kind}, {len(self.dates)} 日)"
+
+
+def is_trading_day(date_obj: datetime, tw_holidays=None) -> bool:
+    """週一到週五且不是國定假日"""
+    if date_obj.weekday() >= 5:
+        return False
+    return tw_holidays is None or date_obj.date() not in tw_holidays
+
+
+def trading_calendar(dates: Iterable[datetime]) -> List[datetime]:
+    """剔除週末與國定假日（休市日的請求必定回傳無資料）"""
+    dates = list(dates)
+    if not dates:
+        return []
+    tw_holidays = None
+    if holidays is not None:
+        years = sorted({d.year for d in dates})
+        tw_holidays = holidays.TW(years=years)
+    return [d for d in dates if is_trading_day(d, tw_holidays)]
+
+
+def _group(dates: List[datetime], span: str) -> List[List[datetime]]:
+    """依月份或連續區間分組"""
+    groups: "OrderedDict[str, List[datetime]]" = OrderedDict()
+    for d in sorted(dates):
+        key = d.strftime("%Y%m") if span == "month" else "all"
+        groups.setdefault(key, []).append(d)
+    return list(groups.values())
+
+
+def build_fetch_plan(names: Iterable[str], dates: Iterable[datetime],
+                     existing: Optional[Set[str]] = None) -> List[FetchRequest]:
+    """
+    建立抓取計畫
+    existing 為已存在的 "YYYYMMDD_name" 集合；計畫依日期排序，同一日期的資料源相鄰
+    """
+    existing = existing or set()
+    calendar = trading_calendar(dates)
+    daily: List[FetchRequest] = []
+    bulk: List[FetchRequest] = []
+
+    for name in names:
+        missing = [d for d in calendar if f"{d.strftime('%Y%m%d')}_{name}" not in existing]
+        if not missing:
+            continue
+        variant = BULK_VARIANTS.get(name)
+        if variant is None:
+            daily.extend(FetchRequest(name, [d]) for d in missing)
+        else:
+            bulk.extend(FetchRequest(name, group, variant) for group in _group(missing, variant.span))
+
+    daily.sort(key=lambda r: r.dates[0])
+    return bulk + daily
+
+
+def plan_summary(plan: List[FetchRequest]) -> Dict[str, int]:
+    """計畫統計：實際請求數 vs. 涵蓋的 (資料源, 日期) 數"""
+    covered = sum(len(r.dates) for r in plan)
+    return {
+        "requests": len(plan),
+        "bulk_requests": sum(1 for r in plan if r.is_bulk),
+        "covered_pairs": covered,
+        "saved_requests": covered - len(plan),
+    }
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flow Features - 法人買賣超滾動特徵（增量計算）
+每檔股票維護 5 / 20 / 60 日買賣超累計與連續買（賣）超天數，狀態以陣列形式
+存在清洗資料旁的 npz（flow_<群組>.npz）；每多一個交易日只做 O(股票數) 的更新：
+新值加進各窗口累計，同時減去 w 天前離開窗口的值（環狀緩衝區保留最近 60 天）
+
+用法：
+    python flow_features.py              # 把各群組補到最新一天
+    python flow_features.py --rebuild    # 清掉狀態，從頭重播所有日期
+    python flow_features.py 2330 6488    # 顯示指定股票目前的特徵
+"""
+
+from __future__ import annotations
+
+import glob
+import logging
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fetch_planner import trading_calendar
+from lazy_imports import lazy_import
+from market_snapshot import TWSE_CLEANED_DIR, OTC_CLEAN_DIR, twse_cleaned_path
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+WINDOWS = (5, 20, 60)
+HISTORY = max(WINDOWS)
+
+# 群組：每個群組對應一個（或一組）清洗檔，各自以自己的日期前進
+#   exchange / source：清洗檔來源；columns：要累計的買賣超欄位
+FLOW_GROUPS = {
+    "twse_t86": {"exchange": "TWSE", "sources": ["t86"], "columns": ["foreign_buy", "insti_net"]},
+    "twse_twt44u": {"exchange": "TWSE", "sources": ["twt44u"], "columns": ["trust_net"]},
+    "twse_twt38u": {"exchange": "TWSE", "sources": ["twt38u"], "columns": ["FI_Net", "FA_Net"]},
+    "otc_institutional": {
+        "exchange": "TPEx", "sources": ["institutional_detail"],
+        "columns": ["ii_foreign_net", "ii_foreign_self_net", "ii_trust_net",
+                    "ii_dealer_self_net", "ii_dealer_hedge_net", "ii_total_net"],
+    },
+    # 投信買超 / 賣超排行分成兩個檔，同一天合併後再累計
+    "otc_investment_trust": {
+        "exchange": "TPEx", "sources": ["investment_trust_buy", "investment_trust_sell"],
+        "columns": ["it_diff_shares"],
+    },
+}
+
+
+def state_path(group: str) -> Path:
+    """狀態檔放在該交易所清洗資料的目錄"""
+    base = TWSE_CLEANED_DIR if FLOW_GROUPS[group]["exchange"] == "TWSE" else OTC_CLEAN_DIR
+    return Path(base) / f"flow_{group}.npz"
+
+
+# ===== 清洗檔與日期 =====
+def source_path(exchange: str, source: str, date_str: str) -> Optional[str]:
+    if exchange == "TWSE":
+        return twse_cleaned_path(date_str, source)
+    path = OTC_CLEAN_DIR / f"{date_str}_{source}.csv"
+    return str(path) if path.exists() else None
+
+
+def source_dates(exchange: str, source: str) -> List[str]:
+    if exchange == "TWSE":
+        pattern = os.path.join(TWSE_CLEANED_DIR, f"*_cleaned_{source}.csv")
+    else:
+        pattern = str(OTC_CLEAN_DIR / f"*_{source}.csv")
+    dates = {m.group(1) for m in (re.match(r"(\d{8})_", os.path.basename(p)) for p in glob.glob(pattern)) if m}
+    return sorted(dates)
+
+
+def group_dates(group: str) -> List[str]:
+    """群組內任一來源有資料的日期（投信買超 / 賣超可能只有其中一邊）"""
+    spec = FLOW_GROUPS[group]
+    dates = set()
+    for source in spec["sources"]:
+        dates.update(source_dates(spec["exchange"], source))
+    return sorted(dates)
+
+
+def trading_dates(after: str, until: str) -> List[str]:
+    """after（不含）到 until（含）之間的交易日"""
+    first = datetime.strptime(after, "%Y%m%d") + timedelta(days=1)
+    last = datetime.strptime(until, "%Y%m%d")
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    return [d.strftime("%Y%m%d") for d in trading_calendar(days)]
+
+
+def read_day(group: str, date_str: str) -> Optional[pd.DataFrame]:
+    """讀取單日清洗檔，回傳以 stock_id 為索引、只含累計欄位的資料框"""
+    spec = FLOW_GROUPS[group]
+    frames = []
+    for source in spec["sources"]:
+        path = source_path(spec["exchange"], source, date_str)
+        if path is None:
+            continue
+        df = pd.read_csv(path, dtype={"stock_id": str}, encoding="utf-8-sig")
+        columns = [c for c in spec["columns"] if c in df.columns]
+        frames.append(df[["stock_id"] + columns])
+    if not frames:
+        return None
+    day = pd.concat(frames, ignore_index=True)
+    day["stock_id"] = day["stock_id"].str.strip()
+    values = day.reindex(columns=spec["columns"]).apply(pd.to_numeric, errors="coerce").fillna(0)
+    values["stock_id"] = day["stock_id"]
+    return values.groupby("stock_id").sum()
+
+
+# ===== 滾動狀態 =====
+class FlowState:
+    """
+    單一群組的滾動狀態
+      history[c, slot, s]：最近 HISTORY 天的每日值（環狀緩衝區，head 為下一個寫入位置）
+      sums[c, w, s]：各窗口累計
+      streak[c, s]：連續買超為正、連續賣超為負、當天為 0 則歸零
+      gaps：沒有清洗檔、以 0 推進的交易日（窗口依交易日前進，不是依有檔案的日期）
+    數值以 int64 保存（股數），累計不會有浮點誤差
+    """
+
+    def __init__(self, columns: List[str]):
+        self.columns = list(columns)
+        self.stock_ids = np.array([], dtype="U8")
+        self.history = np.zeros((len(columns), HISTORY, 0), dtype=np.int64)
+        self.sums = np.zeros((len(columns), len(WINDOWS), 0), dtype=np.int64)
+        self.streak = np.zeros((len(columns), 0), dtype=np.int32)
+        self.head = 0
+        self.days = 0
+        self.first_date = ""
+        self.last_date = ""
+        self.gaps: List[str] = []
+
+    # ---- 持久化 ----
+    @classmethod
+    def load(cls, path: Path, columns: List[str]) -> FlowState:
+        state = cls(columns)
+        if not path.exists():
+            return state
+        with np.load(path, allow_pickle=False) as data:
+            if list(data["columns"]) != state.columns or tuple(data["windows"]) != WINDOWS:
+                logging.warning(f"[特徵] {path.name} 欄位或窗口設定已變更，重新計算")
+                return state
+            state.stock_ids = data["stock_ids"]
+            state.history = data["history"]
+            state.sums = data["sums"]
+            state.streak = data["streak"]
+            state.head = int(data["head"])
+            state.days = int(data["days"])
+            state.last_date = str(data["last_date"])
+            # 舊版狀態檔沒有這兩項
+            if "first_date" in data.files:
+                state.first_date = str(data["first_date"])
+            if "gaps" in data.files:
+                state.gaps = [str(d) for d in data["gaps"]]
+        return state
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, columns=np.array(self.columns), windows=np.array(WINDOWS),
+                     stock_ids=self.stock_ids, history=self.history, sums=self.sums,
+                     streak=self.streak, head=self.head, days=self.days, first_date=self.first_date,
+                     last_date=self.last_date, gaps=np.array(self.gaps, dtype="U8"))
+        os.replace(tmp_path, path)
+
+    # ---- 更新 ----
+    def _align(self, stock_ids: np.ndarray) -> np.ndarray:
+        """新股票補進陣列尾端（歷史為 0），回傳今日各列在陣列中的位置"""
+        new_ids = np.setdiff1d(stock_ids, self.stock_ids)
+        if len(new_ids):
+            self.stock_ids = np.concatenate([self.stock_ids, new_ids.astype(self.stock_ids.dtype)])
+            pad = len(new_ids)
+            self.history = np.pad(self.history, ((0, 0), (0, 0), (0, pad)))
+            self.sums = np.pad(self.sums, ((0, 0), (0, 0), (0, pad)))
+            self.streak = np.pad(self.streak, ((0, 0), (0, pad)))
+        order = np.argsort(self.stock_ids)
+        return order[np.searchsorted(self.stock_ids, stock_ids, sorter=order)]
+
+    def update(self, date_str: str, day: Optional[pd.DataFrame]) -> None:
+        """
+        加入一天：當天沒出現的股票視為 0（未交易或未上榜）；
+        day 為 None 表示該交易日沒有清洗檔，窗口照樣推進一格（全為 0），連續天數不變
+        """
+        if day is None:
+            today = np.zeros((len(self.columns), len(self.stock_ids)), dtype=np.int64)
+        else:
+            positions = self._align(day.index.to_numpy().astype("U8"))
+            today = np.zeros((len(self.columns), len(self.stock_ids)), dtype=np.int64)
+            today[:, positions] = day[self.columns].to_numpy().round().astype(np.int64).T
+
+        for i, window in enumerate(WINDOWS):
+            # w 天前的值離開窗口；未滿 w 天時該格仍為 0，不需特別處理
+            leaving = self.history[:, (self.head - window) % HISTORY, :]
+            self.sums[:, i, :] += today - leaving
+        self.history[:, self.head, :] = today
+        self.head = (self.head + 1) % HISTORY
+
+        if day is None:
+            self.gaps.append(date_str)
+        else:
+            buy, sell = today > 0, today < 0
+            self.streak = np.where(buy, np.where(self.streak > 0, self.streak + 1, 1),
+                                   np.where(sell, np.where(self.streak < 0, self.streak - 1, -1), 0)).astype(np.int32)
+        self.days += 1
+        self.first_date = self.first_date or date_str
+        self.last_date = date_str
+
+    # ---- 輸出 ----
+    def frame(self) -> pd.DataFrame:
+        """stock_id × <欄位>_sum<窗口> / <欄位>_streak"""
+        data = {}
+        for c, column in enumerate(self.columns):
+            for i, window in enumerate(WINDOWS):
+                data[f"{column}_sum{window}"] = self.sums[c, i]
+            data[f"{column}_streak"] = self.streak[c]
+        df = pd.DataFrame(data, index=pd.Index(self.stock_ids, name="stock_id"))
+        return df.sort_index()
+
+
+def update_group(group: str, rebuild: bool = False) -> FlowState:
+    """
+    把單一群組補到最新一天：依交易日曆逐日推進，缺檔的交易日以 0 推進並記在 gaps；
+    之後才補到的缺檔日或早於起始日的檔案需要 --rebuild
+    """
+    path = state_path(group)
+    columns = FLOW_GROUPS[group]["columns"]
+    state = FlowState(columns) if rebuild else FlowState.load(path, columns)
+    dates = group_dates(group)
+    if not dates:
+        return state
+    gaps = set(state.gaps)
+    late = [d for d in dates if d <= state.last_date and (d in gaps or d < state.first_date)]
+    if late:
+        logging.warning(f"[特徵] {group} 有 {len(late)} 個早於 {state.last_date} 的新日期"
+                        f"（{late[0]}…{late[-1]}），需要 --rebuild")
+    pending = sorted({d for d in dates if d > state.last_date}
+                     | set(trading_dates(state.last_date or dates[0], dates[-1])))
+    missing = 0
+    for date_str in pending:
+        day = read_day(group, date_str)
+        missing += day is None
+        state.update(date_str, day)
+    if pending:
+        state.save(path)
+        logging.info(f"[特徵] {group}: +{len(pending)} 天（缺檔 {missing}）→ {state.last_date}"
+                     f"（{len(state.stock_ids)} 檔）")
+    return state
+
+
+def update_flow_features(rebuild: bool = False, exchange: Optional[str] = None) -> Dict[str, str]:
+    """每日流程結尾呼叫；回傳各群組最新日期，失敗不影響主流程"""
+    latest = {}
+    for group, spec in FLOW_GROUPS.items():
+        if exchange and spec["exchange"] != exchange:
+            continue
+        try:
+            latest[group] = update_group(group, rebuild).last_date
+        except Exception as e:
+            logging.warning(f"[特徵] {group} 更新失敗：{e}")
+    return latest
+
+
+def load_features(group: str) -> pd.DataFrame:
+    """讀取群組目前的滾動特徵（不更新）"""
+    return FlowState.load(state_path(group), FLOW_GROUPS[group]["columns"]).frame()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    latest = update_flow_features(rebuild="--rebuild" in sys.argv)
+    stock_ids = [a for a in sys.argv[1:] if not a.startswith("--")]
+    for group, date_str in latest.items():
+        print(f"[📊] {group}: {date_str or '尚無資料'}")
+        if stock_ids and date_str:
+            features = load_features(group)
+            print(features.loc[features.index.intersection(stock_ids)].to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gap Planner - 原始 / 清洗資料缺漏分析與定點修補
+以交易日曆 × 原始檔目錄索引 × 清洗檔比對每個 (資料源, 交易日)，找出：
+  missing      原始檔不存在（從未下載或下載失敗）
+  empty        原始檔過小（無資料回應）
+  html         原始檔其實是 HTML 頁面
+  clean_failed 原始檔正常但沒有清洗檔
+  clean_undated 上市原始檔只由舊版每日更新清洗過（只有不帶日期的 cleaned_<source>.csv）
+  clean_stale  清洗檔比原始檔舊（原始檔重抓後未重新清洗）
+  clean_empty  清洗檔只有標題列
+前三類需要重抓（壞檔先改名為 .bad 保留），其餘只需重新清洗；
+修補只處理這份清單，不必整段重跑。歷次上櫃回補的失敗紀錄（historical_results_*.jsonl）附註在缺漏上
+
+用法：
+    python gap_planner.py                          # 分析 2025/01/01 至今，寫出 logs/gap_plan.json
+    python gap_planner.py --from 20250601 --to 20250630 --exchange TWSE
+    python gap_planner.py --from 20250601 --repair # 分析後直接修補
+"""
+
+from __future__ import annotations
+
+import glob
+import json
+import logging
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import historical_tse_batch_downloader as twse_hist
+from fetch_planner import build_fetch_plan, plan_summary, trading_calendar
+from market_snapshot import OTC_CLEAN_DIR, TWSE_CLEANED_DIR, TWSE_RAW_DIR, twse_cleaned_path
+from memory_governor import read_results
+from otc_browser import NetworkCapture
+from otc_common import LOG_DIR, RAW_DIR as OTC_RAW_DIR, OTCDataCleaner, load_config
+from otc_downloader_optimized import DEFAULT_CONFIG as OTC_DEFAULT_CONFIG, OTCHistoricalDownloader
+from pipeline_daemon import SCHEDULE
+from raw_catalog import get_catalog
+from retry_engine import MIN_CONTENT_SIZE, is_html_bytes
+from source_readiness import at_time, now_tw
+
+PLAN_FILE = LOG_DIR / "gap_plan.json"
+DEFAULT_START = "20250101"
+HEAD_BYTES = 2048
+
+MISSING, EMPTY, HTML = "missing", "empty", "html"
+CLEAN_FAILED, CLEAN_STALE, CLEAN_EMPTY = "clean_failed", "clean_stale", "clean_empty"
+CLEAN_UNDATED = "clean_undated"
+FETCH_STATUSES = (MISSING, EMPTY, HTML)
+
+# 交易所 → 原始檔目錄與資料源（資料源 → 清洗檔名稱；上市以 CLEAN_SPECS 的輸出名稱命名）
+ARCHIVES = {
+    "TWSE": {"raw": TWSE_RAW_DIR, "sources": {name: spec[2] for name, spec in twse_hist.CLEAN_SPECS.items()}},
+    "TPEx": {"raw": str(OTC_RAW_DIR), "sources": {name: name for name in OTC_DEFAULT_CONFIG["download_items"]}},
+}
+
+
+class Gap:
+    """單一 (交易所, 資料源, 日期) 的缺漏"""
+
+    def __init__(self, exchange: str, source: str, date: str, status: str,
+                 path: Optional[str] = None, note: str = ""):
+        self.exchange = exchange
+        self.source = source
+        self.date = date
+        self.status = status
+        self.path = path
+        self.note = note
+
+    @property
+    def needs_fetch(self) -> bool:
+        return self.status in FETCH_STATUSES
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"exchange": self.exchange, "source": self.source, "date": self.date,
+                "status": self.status, "path": self.path, "note": self.note}
+
+
+# ===== 分析 =====
+def cleaned_path(exchange: str, source: str, date_str: str) -> Optional[str]:
+    if exchange == "TWSE":
+        return twse_cleaned_path(date_str, ARCHIVES["TWSE"]["sources"][source])
+    path = OTC_CLEAN_DIR / f"{date_str}_{source}.csv"
+    return str(path) if path.exists() else None
+
+
+def read_head(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(HEAD_BYTES)
+
+
+def has_data_rows(path: str) -> bool:
+    """清洗檔除標題列外至少還有一列"""
+    with open(path, "r", encoding="utf-8-sig", errors="ignore") as f:
+        f.readline()
+        return any(line.strip() for line in f)
+
+
+def raw_status(exchange: str, source: str, entry: Dict[str, Any]) -> Optional[str]:
+    """原始檔本身的問題（None 表示正常）"""
+    if entry["size"] <= MIN_CONTENT_SIZE:
+        return EMPTY
+    # T86 下載時允許 HTML 外觀的回應（與 download_one_date 相同）
+    if not (exchange == "TWSE" and source == "t86") and is_html_bytes(read_head(entry["path"])):
+        return HTML
+    return None
+
+
+def clean_status(exchange: str, source: str, date_str: str, raw_path: str) -> Optional[str]:
+    path = cleaned_path(exchange, source, date_str)
+    if path is None:
+        if exchange == "TWSE":
+            # 舊版每日更新只寫 cleaned_<source>.csv（每天覆蓋）：清洗過但沒有留下該日的檔案，
+            # 不算清洗失敗；重新清洗即補上帶日期的清洗檔
+            undated = os.path.join(TWSE_CLEANED_DIR, f"cleaned_{ARCHIVES['TWSE']['sources'][source]}.csv")
+            if os.path.exists(undated) and os.path.getmtime(undated) >= os.path.getmtime(raw_path):
+                return CLEAN_UNDATED
+        return CLEAN_FAILED
+    if os.path.getmtime(path) < os.path.getmtime(raw_path):
+        return CLEAN_STALE
+    if not has_data_rows(path):
+        return CLEAN_EMPTY
+    return None
+
+
+def expected_dates(source: str, start: str, end: str) -> List[str]:
+    """區間內的交易日；今天只有在過了該資料源公布時間後才算"""
+    first, last = datetime.strptime(start, "%Y%m%d"), datetime.strptime(end, "%Y%m%d")
+    now = now_tw()
+    publish = SCHEDULE.get(source, {}).get("publish", "15:00")
+    if last.date() >= now.date():
+        last = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        if now < at_time(now, publish):
+            last -= timedelta(days=1)
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    return [d.strftime("%Y%m%d") for d in trading_calendar(days)]
+
+
+def failure_notes() -> Dict[str, str]:
+    """歷次上櫃回補的結果檔：每個任務最後一次的狀態（較新的檔案覆蓋較舊的）"""
+    notes: Dict[str, str] = {}
+    for path in sorted(glob.glob(str(LOG_DIR / "historical_results_*.jsonl"))):
+        for entry in read_results(Path(path)):
+            if entry.get("status") == "ok":
+                notes.pop(entry["task"], None)
+            else:
+                notes[entry["task"]] = f"{entry.get('status')}（{entry.get('kind') or ''}）{entry.get('error') or ''}".strip()
+    return notes
+
+
+def find_gaps(start: str, end: str, exchanges: Optional[List[str]] = None) -> List[Gap]:
+    """交易日曆 × 原始檔索引 × 清洗檔"""
+    notes = failure_notes()
+    gaps: List[Gap] = []
+    for exchange, archive in ARCHIVES.items():
+        if exchanges and exchange not in exchanges:
+            continue
+        if not os.path.isdir(archive["raw"]):
+            logging.warning(f"[缺漏] {exchange} 原始檔目錄不存在：{archive['raw']}")
+            continue
+        catalog = get_catalog(archive["raw"])
+        for source in archive["sources"]:
+            entries = {e["date"]: e for e in catalog.entries(source)}
+            for date_str in expected_dates(source, start, end):
+                entry = entries.get(date_str)
+                if entry is None or not os.path.exists(entry["path"]):
+                    status, path = MISSING, None
+                else:
+                    path = entry["path"]
+                    status = raw_status(exchange, source, entry) or clean_status(exchange, source, date_str, path)
+                if status:
+                    gaps.append(Gap(exchange, source, date_str, status, path, notes.get(f"{date_str}_{source}", "")))
+    return gaps
+
+
+# ===== 修補計畫 =====
+def build_plan(gaps: List[Gap], start: str, end: str) -> Dict[str, Any]:
+    """最少的修補工作：依 (交易所, 資料源) 分組的重抓日期與重新清洗日期"""
+    fetch: Dict[tuple, List[str]] = {}
+    clean: Dict[tuple, List[str]] = {}
+    for gap in gaps:
+        target = fetch if gap.needs_fetch else clean
+        target.setdefault((gap.exchange, gap.source), []).append(gap.date)
+
+    requests = 0
+    for (exchange, source), dates in fetch.items():
+        if exchange == "TWSE":
+            # 上市依抓取計畫計算實際請求數（有批量變體時一個月一個請求）
+            requests += plan_summary(build_fetch_plan([source], [datetime.strptime(d, "%Y%m%d") for d in dates]))["requests"]
+        else:
+            requests += len(dates)
+
+    return {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "range": [start, end],
+        "summary": {"gaps": len(gaps), "fetch_pairs": sum(len(d) for d in fetch.values()),
+                    "fetch_requests": requests, "clean_pairs": sum(len(d) for d in clean.values()),
+                    "by_status": count_by(gaps, "status")},
+        "fetch": [{"exchange": e, "source": s, "dates": d} for (e, s), d in sorted(fetch.items())],
+        "clean": [{"exchange": e, "source": s, "dates": d} for (e, s), d in sorted(clean.items())],
+        "gaps": [g.as_dict() for g in gaps],
+    }
+
+
+def count_by(gaps: List[Gap], attr: str) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for gap in gaps:
+        key = getattr(gap, attr)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def save_plan(plan: Dict[str, Any], path: Path = PLAN_FILE) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+# ===== 修補 =====
+def quarantine(gaps: List[Gap]) -> None:
+    """壞原始檔改名為 .bad（保留以便檢查）並移出索引，下載器才會重抓"""
+    for gap in gaps:
+        if gap.status in (EMPTY, HTML) and gap.path and os.path.exists(gap.path):
+            catalog = get_catalog(ARCHIVES[gap.exchange]["raw"])
+            with catalog.writing():
+                os.replace(gap.path, gap.path + ".bad")
+                catalog.remove(gap.path)
+
+
+def raw_path(exchange: str, source: str, date_str: str) -> str:
+    return os.path.join(ARCHIVES[exchange]["raw"], f"{date_str}_{source}.csv")
+
+
+def repair_twse(fetch: Dict[str, List[str]], clean: Dict[str, List[str]]) -> Dict[str, int]:
+    stats = {"fetched": 0, "fetch_failed": 0, "cleaned": 0, "clean_failed": 0}
+    if fetch:
+        session = twse_hist.create_session(twse_hist.HEADERS, transport=twse_hist.HTTP_TRANSPORT)
+        # 每個資料源只對清單上的日期建立抓取計畫（有批量變體時自動合併成整月請求）
+        plan = [req for name, dates in fetch.items()
+                for req in build_fetch_plan([name], [datetime.strptime(d, "%Y%m%d") for d in dates])]
+        for i, req in enumerate(plan, 1):
+            if req.is_bulk:
+                ok, failed = twse_hist.download_bulk(session, req)
+            else:
+                ok = int(twse_hist.download_one_date(session, req.name, twse_hist.URLS[req.name], req.dates[0]))
+                failed = 1 - ok
+            stats["fetched"] += ok
+            stats["fetch_failed"] += failed
+            for d in req.dates:
+                date_str = d.strftime("%Y%m%d")
+                if os.path.exists(raw_path("TWSE", req.name, date_str)):
+                    clean.setdefault(req.name, []).append(date_str)
+            if i < len(plan):
+                twse_hist.smart_delay()
+
+    for name, dates in clean.items():
+        for date_str in dates:
+            if twse_hist.process_date(name, date_str, raw_path("TWSE", name, date_str)):
+                stats["cleaned"] += 1
+            else:
+                stats["clean_failed"] += 1
+    return stats
+
+
+def repair_otc(fetch: Dict[str, List[str]], clean: Dict[str, List[str]]) -> Dict[str, int]:
+    stats = {"fetched": 0, "fetch_failed": 0, "cleaned": 0, "clean_failed": 0}
+    config = load_config(OTC_DEFAULT_CONFIG)
+    if fetch:
+        downloader = OTCHistoricalDownloader(config)
+        downloader.driver = downloader.setup_chrome_driver()
+        if downloader.settings.get("network_capture", True):
+            downloader.capture = NetworkCapture(downloader.driver)
+        try:
+            tasks = sorted((d, name) for name, dates in fetch.items() for d in dates)
+            for i, (date_str, name) in enumerate(tasks, 1):
+                date_obj = datetime.strptime(date_str, "%Y%m%d")
+                if downloader.governor.checkpoint(date_str, downloader.driver):
+                    downloader.recycle_driver()
+                if downloader.download_single_item(name, downloader.download_items[name], date_obj):
+                    stats["fetched"] += 1
+                    clean.setdefault(name, []).append(date_str)
+                else:
+                    stats["fetch_failed"] += 1
+                if i < len(tasks):
+                    downloader.smart_delay()
+        finally:
+            if downloader.driver:
+                downloader.driver.quit()
+            shutil.rmtree(downloader.download_dir, ignore_errors=True)
+            downloader.latency.save()
+
+    cleaner = OTCDataCleaner(config)
+    cleaner.ensure_dir(OTC_CLEAN_DIR)
+    for name, dates in clean.items():
+        for date_str in dates:
+            if cleaner.clean_single_file(Path(raw_path("TPEx", name, date_str))):
+                stats["cleaned"] += 1
+            else:
+                stats["clean_failed"] += 1
+    return stats
+
+
+def repair(gaps: List[Gap]) -> Dict[str, Dict[str, int]]:
+    """依缺漏清單重抓 / 重新清洗；回傳各交易所統計"""
+    quarantine(gaps)
+    results = {}
+    for exchange, func in (("TWSE", repair_twse), ("TPEx", repair_otc)):
+        fetch: Dict[str, List[str]] = {}
+        clean: Dict[str, List[str]] = {}
+        for gap in gaps:
+            if gap.exchange == exchange:
+                (fetch if gap.needs_fetch else clean).setdefault(gap.source, []).append(gap.date)
+        if fetch or clean:
+            results[exchange] = func(fetch, clean)
+    return results
+
+
+# ===== 主程式 =====
+def arg_value(flag: str, default: Optional[str]) -> Optional[str]:
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+
+def print_report(plan: Dict[str, Any]) -> None:
+    summary = plan["summary"]
+    print(f"[📊] {plan['range'][0]} ~ {plan['range'][1]}：缺漏 {summary['gaps']} 筆 {summary['by_status']}")
+    for job in plan["fetch"]:
+        print(f"    [⬇] {job['exchange']} {job['source']}: {len(job['dates'])} 日（{job['dates'][0]} ~ {job['dates'][-1]}）")
+    for job in plan["clean"]:
+        print(f"    [🧹] {job['exchange']} {job['source']}: {len(job['dates'])} 日（{job['dates'][0]} ~ {job['dates'][-1]}）")
+    print(f"[ℹ] 重抓 {summary['fetch_pairs']} 筆（{summary['fetch_requests']} 個請求），重新清洗 {summary['clean_pairs']} 筆")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    start = arg_value("--from", DEFAULT_START)
+    end = arg_value("--to", datetime.now().strftime("%Y%m%d"))
+    exchange = arg_value("--exchange", None)
+
+    gaps = find_gaps(start, end, [exchange] if exchange else None)
+    plan = build_plan(gaps, start, end)
+    print_report(plan)
+    print(f"[📁] 修補計畫：{save_plan(plan)}")
+
+    if "--repair" in sys.argv and gaps:
+        for name, stats in repair(gaps).items():
+            print(f"[✅] {name} 修補：{stats}")
+        remaining = find_gaps(start, end, [exchange] if exchange else None)
+        print(f"[📊] 修補後剩餘缺漏 {len(remaining)} 筆 {count_by(remaining, 'status')}")
+
+
+if __name__ == "__main__":
+    main()
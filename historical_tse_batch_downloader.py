@@ -6,15 +6,24 @@ Historical Batch Downloader - 台股歷史資料批量下載器
 日期範圍：2025/01/01 到今天
 """
 
+import csv
+import io
 import os
-import re
-import requests
 import urllib3
 import pandas as pd
 import time
 import random
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 
+from fetch_planner import build_fetch_plan, plan_summary, trading_calendar
+from raw_catalog import get_catalog
+from http_client import create_session, connection_stats, format_stats
+from endpoints import twse_host, twse_url
+from retry_engine import RetryEngine, RetryPolicy, FetchError, classify_response
+from shared_frames import HandoffDir, assemble, export_frame, summarize_tables
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # ===== 設定區域 =====
@@ -29,9 +38,16 @@ END_DATE = datetime.today()
 MIN_DELAY = 3.0      # 最小間隔秒數
 MAX_DELAY = 6.0      # 最大間隔秒數
 MAX_RETRIES = 3      # 最大重試次數
-RETRY_DELAY = 10     # 重試間隔秒數
+RETRY_DELAY = 10     # 重試間隔秒數（指數退避的基準）
+
+# 所有上市資料源共用同一個重試引擎與上市主機（twse_host()）熔斷器
+RETRY_ENGINE = RetryEngine(
+    twse_host(),
+    RetryPolicy(max_attempts=MAX_RETRIES, base_delay=RETRY_DELAY)
+)
 
 # HTTP 設定
+HTTP_TRANSPORT = "requests"   # "requests" 或 "httpx"（HTTP/2，需安裝 httpx[http2]）
 HEADERS = {
     "User-Agent": (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -40,32 +56,28 @@ HEADERS = {
     )
 }
 
-REFERER = {
-    "t86": "https://www.twse.com.tw/exchangeReport/TWT86U",
-    "twt44u": "https://www.twse.com.tw/fund/TWT44U",
-    "twt38u": "https://www.twse.com.tw/fund/TWT38U",
-    "mi_margn": "https://www.twse.com.tw/exchangeReport/MI_MARGN",
-    "mi_index": "https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX"
+# 網址在呼叫時才組出（TWSE_BASE_URL 於組網址時讀取）
+REFERER_PATH = {
+    "t86": "/exchangeReport/TWT86U",
+    "twt44u": "/fund/TWT44U",
+    "twt38u": "/fund/TWT38U",
+    "mi_margn": "/exchangeReport/MI_MARGN",
+    "mi_index": "/rwd/zh/afterTrading/MI_INDEX"
 }
 
 URLS = {
-    "t86": lambda d, tw: f"https://www.twse.com.tw/rwd/zh/fund/T86?response=csv&date={d}&selectType=ALLBUT0999",
-    "twt44u": lambda d, tw: f"https://www.twse.com.tw/fund/TWT44U?response=csv&date={d}&selectType=ALL",
-    "twt38u": lambda d, tw: f"https://www.twse.com.tw/fund/TWT38U?response=csv&date={d}&selectType=ALL",
-    "mi_margn": lambda d, tw: f"https://www.twse.com.tw/exchangeReport/MI_MARGN?response=csv&date={d}&selectType=ALL",
-    "mi_index": lambda d, tw: f"https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX?response=csv&date={d}&type=ALL"
+    "t86": lambda d, tw: twse_url(f"/rwd/zh/fund/T86?response=csv&date={d}&selectType=ALLBUT0999"),
+    "twt44u": lambda d, tw: twse_url(f"/fund/TWT44U?response=csv&date={d}&selectType=ALL"),
+    "twt38u": lambda d, tw: twse_url(f"/fund/TWT38U?response=csv&date={d}&selectType=ALL"),
+    "mi_margn": lambda d, tw: twse_url(f"/exchangeReport/MI_MARGN?response=csv&date={d}&selectType=ALL"),
+    "mi_index": lambda d, tw: twse_url(f"/rwd/zh/afterTrading/MI_INDEX?response=csv&date={d}&type=ALL")
 }
 
 # ===== 工具函數 =====
 def ensure_dir(path):
     """確保目錄存在"""
-    if not os.path.exists(path):
-        os.makedirs(path)
-
-def is_html_bytes(b: bytes) -> bool:
-    """檢查回應是否為HTML（表示無資料）"""
-    text = b.decode("utf-8", errors="ignore").lower()
-    return any(tag in text[:500] for tag in ("<html", "<!doctype", "<head", "<script"))
+    # 平行清洗時多個行程可能同時建立
+    os.makedirs(path, exist_ok=True)
 
 def smart_delay():
     """智能延遲，避免被偵測"""
@@ -73,32 +85,22 @@ def smart_delay():
     print(f"[⏳] 等待 {delay:.1f} 秒...")
     time.sleep(delay)
 
-def get_existing_dates():
-    """取得已存在的日期，避免重複下載"""
+def get_existing_files():
+    """取得已存在的 YYYYMMDD_name 檔案鍵值，避免重複下載（查詢原始檔目錄索引）"""
     if not os.path.exists(RAW_DIR):
         return set()
-    
-    existing_dates = set()
-    for filename in os.listdir(RAW_DIR):
-        if filename.endswith('.csv'):
-            match = re.search(r'(\d{8})_', filename)
-            if match:
-                existing_dates.add(match.group(1))
-    
-    return existing_dates
+    return get_catalog(RAW_DIR).keys()
 
 def generate_trading_dates():
-    """生成交易日期列表（跳過週末）"""
+    """生成交易日期列表（跳過週末與國定假日）"""
     dates = []
     current_date = START_DATE
     
     while current_date <= END_DATE:
-        # 跳過週末
-        if current_date.weekday() < 5:  # 0-4 是週一到週五
-            dates.append(current_date)
+        dates.append(current_date)
         current_date += timedelta(days=1)
     
-    return dates
+    return trading_calendar(dates)
 
 # ===== 下載功能 =====
 def download_one_date(session, name, url_func, date_obj):
@@ -112,109 +114,145 @@ def download_one_date(session, name, url_func, date_obj):
         print(f"[⏭] {name} {d} 已存在，跳過")
         return True
     
-    # 嘗試下載
-    for retry in range(MAX_RETRIES):
-        try:
-            print(f"[🔄] 下載 {name} {d} (嘗試 {retry+1}/{MAX_RETRIES})")
-            
-            r = session.get(
-                url_func(d, tw),
-                headers={**HEADERS, "Referer": REFERER[name]},
-                verify=False,
-                timeout=15
-            )
-            
-            if r.status_code == 200 and len(r.content) > 500:
-                # t86 特殊處理，其他檢查是否為HTML
-                if name == "t86" or not is_html_bytes(r.content):
-                    ensure_dir(RAW_DIR)
-                    with open(fn, "wb") as f:
-                        f.write(r.content)
-                    print(f"[✅] {name} {d} → {fn}")
-                    return True
-                else:
-                    print(f"[⚠] {name} {d} 回傳 HTML (可能無資料)")
-                    return False
-            else:
-                print(f"[⚠] {name} {d} 狀態碼: {r.status_code}, 大小: {len(r.content)}")
-                
-        except Exception as e:
-            print(f"[❌] {name} {d} 錯誤: {e}")
-            if retry < MAX_RETRIES - 1:
-                wait_time = RETRY_DELAY * (2 ** retry)  # 指數退避
-                print(f"[⏳] 等待 {wait_time} 秒後重試...")
-                time.sleep(wait_time)
+    def fetch():
+        # 共用 Session 已帶入 HEADERS，每次只需附上 Referer
+        r = session.get(url_func(d, tw), headers={"Referer": twse_url(REFERER_PATH[name])}, timeout=15)
+        # t86 特殊處理，其他檢查是否為HTML
+        kind = classify_response(r.status_code, r.content, allow_html=(name == "t86"))
+        if kind:
+            raise FetchError(kind, f"狀態碼: {r.status_code}, 大小: {len(r.content)}", r.status_code)
+        return r.content
+    
+    # 嘗試下載（重試、退避、熔斷由 RetryEngine 統一處理）
+    print(f"[🔄] 下載 {name} {d}")
+    try:
+        content = RETRY_ENGINE.run(fetch, label=f"{name} {d}")
+    except Exception as e:
+        print(f"[❌] {name} {d} 下載失敗: {e}")
+        return False
+    
+    if content is None:
+        print(f"[⚠] {name} {d} 回傳 HTML 或空內容 (可能無資料)")
+        return False
     
-    print(f"[❌] {name} {d} 下載失敗")
-    return False
+    ensure_dir(RAW_DIR)
+    catalog = get_catalog(RAW_DIR)
+    with catalog.writing():
+        with open(fn, "wb") as f:
+            f.write(content)
+        catalog.record(fn, content)
+    print(f"[✅] {name} {d} → {fn}")
+    return True
+
+def download_bulk(session, req):
+    """執行批量請求，切回逐日原始檔；回傳 (成功日數, 失敗日數)"""
+    label = f"{req.name} {req.dates[0].strftime('%Y%m%d')}~{req.dates[-1].strftime('%Y%m%d')}"
+    
+    def fetch():
+        r = session.get(req.url, headers={"Referer": twse_url(REFERER_PATH[req.name])}, timeout=30)
+        kind = classify_response(r.status_code, r.content, allow_html=False)
+        if kind:
+            raise FetchError(kind, f"狀態碼: {r.status_code}, 大小: {len(r.content)}", r.status_code)
+        return r.content
+    
+    print(f"[🔄] 批量下載 {label}")
+    try:
+        content = RETRY_ENGINE.run(fetch, label=label)
+    except Exception as e:
+        print(f"[❌] {label} 下載失敗: {e}")
+        return 0, len(req.dates)
+    if content is None:
+        print(f"[⚠] {label} 無資料")
+        return 0, len(req.dates)
+    
+    per_date = req.variant.split(content)
+    ensure_dir(RAW_DIR)
+    success = 0
+    for date_obj in req.dates:
+        d = date_obj.strftime("%Y%m%d")
+        body = per_date.get(d)
+        if body is None or classify_response(200, body, allow_html=(req.name == "t86")):
+            print(f"[⚠] {req.name} {d} 批量回應中無此日資料")
+            continue
+        fn = os.path.join(RAW_DIR, f"{d}_{req.name}.csv")
+        catalog = get_catalog(RAW_DIR)
+        with catalog.writing():
+            with open(fn, "wb") as f:
+                f.write(body)
+            catalog.record(fn, body)
+        success += 1
+    print(f"[✅] {label} → {success}/{len(req.dates)} 日")
+    return success, len(req.dates) - success
 
 def download_all_historical():
-    """下載所有歷史資料"""
+    """下載所有歷史資料（依抓取計畫：可批量的資料源一次抓整月，其餘逐日）"""
     print("=== 歷史資料批量下載開始 ===")
     
-    # 生成日期列表
+    # 生成日期列表與抓取計畫
     dates = generate_trading_dates()
-    existing_dates = get_existing_dates()
+    existing_files = get_existing_files()
+    plan = build_fetch_plan(URLS.keys(), dates, existing_files)
+    summary = plan_summary(plan)
     
     total_dates = len(dates)
-    total_requests = total_dates * len(URLS)
+    total_pairs = total_dates * len(URLS)
+    total_requests = summary["requests"]
     
     print(f"[ℹ] 日期範圍: {START_DATE.strftime('%Y-%m-%d')} ~ {END_DATE.strftime('%Y-%m-%d')}")
-    print(f"[ℹ] 總交易日: {total_dates} 天")
-    print(f"[ℹ] 已存在資料: {len(existing_dates)} 個日期")
-    print(f"[ℹ] 總請求數: {total_requests}")
+    print(f"[ℹ] 總交易日: {total_dates} 天（已排除週末與國定假日）")
+    print(f"[ℹ] 已存在資料: {len(existing_files)} 個檔案")
+    print(f"[ℹ] 待抓取: {summary['covered_pairs']} 筆，實際請求數: {total_requests}（批量 {summary['bulk_requests']}）")
     print(f"[ℹ] 預估時間: {total_requests * 4.5 / 60:.1f} 分鐘")
     
     # 統計變數
     success_count = 0
     fail_count = 0
-    skip_count = 0
+    skip_count = total_pairs - summary["covered_pairs"]
     
-    sess = requests.Session()
+    sess = create_session(HEADERS, transport=HTTP_TRANSPORT)
     
-    # 開始下載
-    for i, date_obj in enumerate(dates, 1):
-        d = date_obj.strftime("%Y%m%d")
-        print(f"\n── 處理日期 {date_obj.strftime('%Y-%m-%d')} ({i}/{total_dates}) ──")
-        
-        # 檢查這個日期是否已有完整資料
-        date_files_exist = all(
-            os.path.exists(os.path.join(RAW_DIR, f"{d}_{name}.csv"))
-            for name in URLS.keys()
-        )
-        
-        if date_files_exist:
-            print(f"[⏭] {d} 所有檔案已存在，跳過整日")
-            skip_count += len(URLS)
-            continue
-        
-        # 下載各個資料源
-        for j, (name, url_func) in enumerate(URLS.items()):
-            if download_one_date(sess, name, url_func, date_obj):
+    # 開始下載（計畫依日期排序，同一日期的資料源相鄰）
+    current_day = None
+    for i, req in enumerate(plan, 1):
+        if req.is_bulk:
+            ok, failed = download_bulk(sess, req)
+            success_count += ok
+            fail_count += failed
+        else:
+            date_obj = req.dates[0]
+            if date_obj != current_day:
+                current_day = date_obj
+                print(f"\n── 處理日期 {date_obj.strftime('%Y-%m-%d')} (請求 {i}/{total_requests}) ──")
+            if download_one_date(sess, req.name, URLS[req.name], date_obj):
                 success_count += 1
             else:
                 fail_count += 1
-            
-            # 除了最後一個請求，都要延遲
-            if not (i == total_dates and j == len(URLS) - 1):
-                smart_delay()
+        
+        # 除了最後一個請求，都要延遲
+        if i < total_requests:
+            smart_delay()
     
     print(f"\n[📊] 下載統計:")
     print(f"    - 成功: {success_count}")
     print(f"    - 失敗: {fail_count}")
     print(f"    - 跳過: {skip_count}")
     print(f"    - 總計: {success_count + fail_count + skip_count}")
+    print(f"[🔗] 連線統計: {format_stats(connection_stats(sess))}")
 
-# ===== 清洗功能（保持原有邏輯） =====
-def clean_numeric(val):
-    """清洗數值資料"""
-    s = str(val).replace(",", "").strip()
-    if s in ("", "-", "NA") or all(ch == "#" for ch in s):
-        return 0.0
-    try:
-        return float(s)
-    except:
-        return 0.0
+# ===== 清洗功能 =====
+# 每個 transform_* 接收已讀入（欄名已去空白）的原始資料框，回傳清洗結果；
+# 逐檔的 process_date_* 與批次清洗引擎共用，兩條路徑輸出一致
+def clean_numeric_series(s):
+    """向量化數值清洗：去千分位；空白、"-"、"NA"、全為 # 或無法轉換者為 0"""
+    text = s.astype(str).str.replace(",", "", regex=False).str.strip()
+    values = pd.to_numeric(text, errors="coerce")
+    # 缺值（nan）維持 nan，其餘無法轉換者視為 0
+    return values.where(values.notna() | (text.str.lower() == "nan"), 0.0).astype(float)
+
+def change_sign_series(s):
+    """漲跌(+/-) 欄：原始檔以 HTML 標示（<p style= color:red>+</p>）→ +1 / -1；空白為平盤 0，X（不比價）為 NaN"""
+    text = s.astype(str).str.replace(r"<[^>]+>", "", regex=True).str.strip()
+    return text.map({"+": 1.0, "-": -1.0, "": 0.0, "nan": 0.0})
 
 def read_csv_auto(path, **kwargs):
     """自動偵測編碼讀取CSV"""
@@ -223,225 +261,312 @@ def read_csv_auto(path, **kwargs):
             return pd.read_csv(path, encoding=enc, **kwargs)
         except:
             pass
-    return pd.read_csv(path, encoding="cp950", errors="ignore", **kwargs)
+    return pd.read_csv(path, encoding="cp950", encoding_errors="ignore", **kwargs)
 
-def get_raw_files_by_date(date_str):
-    """取得指定日期的所有原始檔案"""
-    if not os.path.exists(RAW_DIR):
-        return {}
-    
-    files = {}
-    for name in URLS.keys():
-        filepath = os.path.join(RAW_DIR, f"{date_str}_{name}.csv")
-        if os.path.exists(filepath):
-            files[name] = filepath
-    
-    return files
+def transform_t86(df):
+    df = df.rename(columns={
+        "證券代號": "stock_id",
+        "外陸資買賣超股數(不含外資自營商)": "foreign_buy",
+        "三大法人買賣超股數": "insti_net"
+    })[["stock_id", "foreign_buy", "insti_net"]]
+    df = df[df["stock_id"].str.match(r"^\d{4}$", na=False)].copy()
+    df["foreign_buy"] = clean_numeric_series(df["foreign_buy"])
+    df["insti_net"] = clean_numeric_series(df["insti_net"])
+    return df
 
-def process_date_t86(date_str, filepath):
-    """處理指定日期的T86資料"""
+def transform_twt44u(df):
+    df.iloc[:, 1] = df.iloc[:, 1].str.replace("=", "").str.strip()
+    df = df.iloc[:, [1, 3, 4, 5]].copy()
+    df.columns = ["stock_id", "trust_buy", "trust_sell", "trust_net"]
+    df = df[df["stock_id"].str.match(r"^\d{4}$", na=False)].copy()
+    for col in ["trust_buy", "trust_sell", "trust_net"]:
+        df[col] = clean_numeric_series(df[col])
+    return df
+
+def transform_twt38u(df):
+    df.iloc[:, 1] = df.iloc[:, 1].str.replace("=", "").str.strip()
+    result_df = pd.DataFrame(index=df.index)
+    result_df["stock_id"] = df.iloc[:, 1]
+    result_df["FI_Buy"] = clean_numeric_series(df.iloc[:, 3])
+    result_df["FI_Sell"] = clean_numeric_series(df.iloc[:, 4])
+    result_df["FI_Net"] = clean_numeric_series(df.iloc[:, 5])
+    result_df["PD_Buy"] = 0
+    result_df["PD_Sell"] = 0
+    result_df["PD_Net"] = 0
+    result_df["FA_Buy"] = clean_numeric_series(df.iloc[:, 9])
+    result_df["FA_Sell"] = clean_numeric_series(df.iloc[:, 10])
+    result_df["FA_Net"] = clean_numeric_series(df.iloc[:, 11])
+    return result_df[result_df["stock_id"].str.match(r"^\d{4}$", na=False)]
+
+def transform_margen(df):
+    df["stock_id"] = df.iloc[:, 0].str.strip()
+    df = df[df["stock_id"].str.match(r"^\d{4}$", na=False)].copy()
+    df["margin_diff"] = clean_numeric_series(df.iloc[:, 6]) - clean_numeric_series(df.iloc[:, 5])
+    df["short_diff"] = clean_numeric_series(df.iloc[:, 12]) - clean_numeric_series(df.iloc[:, 11])
+    return df[["stock_id", "margin_diff", "short_diff"]]
+
+def transform_mi_index(df):
+    # 移除 Unnamed 欄位
+    df = df.drop(columns=[c for c in df.columns if c.startswith("Unnamed")], errors="ignore")
+    # 只保留 4 位數股票代號
+    df = df[df["證券代號"].str.match(r"^\d{4}$", na=False)].copy()
+    # 漲跌價差不含正負號，另存方向欄 change_sign
+    if "漲跌(+/-)" in df.columns:
+        df["change_sign"] = change_sign_series(df.pop("漲跌(+/-)"))
+    df = df.rename(columns={
+        "證券代號": "stock_id",
+        "證券名稱": "name",
+        "成交股數": "volume",
+        "成交金額": "value",
+        "成交筆數": "transactions",
+        "開盤價": "open",
+        "最高價": "high",
+        "最低價": "low",
+        "收盤價": "close",
+        "漲跌價差": "change",
+        "最後揭示買價": "last_bid_price",
+        "最後揭示買量": "last_bid_volume",
+        "最後揭示賣價": "last_ask_price",
+        "最後揭示賣量": "last_ask_volume",
+        "本益比": "per"
+    }).copy()
+    # 針對數值欄位做數值清洗；保留 'stock_id'、'name' 與 'change_sign'
+    for col in df.columns:
+        if col not in ["stock_id", "name", "change_sign"]:
+            df[col] = clean_numeric_series(df[col])
+    return df
+
+def is_mi_index_header(line):
+    return "證券代號" in line and "收盤價" in line
+
+def find_mi_index_header(filepath):
+    # 與 BATCH_ENCODINGS 相同的順序：cp950 找不到標題時再以 UTF-8（含 BOM）尋找
+    with open(filepath, "rb") as f:
+        raw = f.read()
+    for enc in BATCH_ENCODINGS:
+        for idx, line in enumerate(raw.decode(enc, errors="ignore").splitlines()):
+            if is_mi_index_header(line):
+                return idx
+    return None
+
+# 資料源 → (transform, 標題列前略過的行數；None 表示以 is_mi_index_header 尋找, 輸出檔後綴)
+CLEAN_SPECS = {
+    "t86": (transform_t86, 1, "t86"),
+    "twt44u": (transform_twt44u, 1, "twt44u"),
+    "twt38u": (transform_twt38u, 2, "twt38u"),
+    "mi_margn": (transform_margen, 7, "margen"),
+    "mi_index": (transform_mi_index, None, "mi_index"),
+}
+
+def write_cleaned(name, date_str, df):
+    ensure_dir(CLEANED_DIR)
+    out = os.path.join(CLEANED_DIR, f"{date_str}_cleaned_{CLEAN_SPECS[name][2]}.csv")
+    df.to_csv(out, index=False, encoding="utf-8-sig")
+    return out
+
+def process_date_frame(name, date_str, filepath):
+    """逐檔清洗（批次引擎無法處理的檔案也走這條路）；回傳清洗後資料，失敗回傳 None"""
+    transform, skiprows, _ = CLEAN_SPECS[name]
     try:
-        df = read_csv_auto(filepath, skiprows=1, dtype=str)
+        if skiprows is None:
+            skiprows = find_mi_index_header(filepath)
+            if skiprows is None:
+                print(f"[⚠] {filepath} 找不到標題列")
+                return None
+        df = read_csv_auto(filepath, skiprows=skiprows, dtype=str)
         df.columns = df.columns.str.strip()
-        df = df.rename(columns={
-            "證券代號": "stock_id",
-            "外陸資買賣超股數(不含外資自營商)": "foreign_buy",
-            "三大法人買賣超股數": "insti_net"
-        })[["stock_id", "foreign_buy", "insti_net"]]
-        df = df[df["stock_id"].str.match(r"^\d{4}$", na=False)]
-        df["foreign_buy"] = df["foreign_buy"].apply(clean_numeric)
-        df["insti_net"] = df["insti_net"].apply(clean_numeric)
-        
-        ensure_dir(CLEANED_DIR)
-        out = os.path.join(CLEANED_DIR, f"{date_str}_cleaned_t86.csv")
-        df.to_csv(out, index=False, encoding="utf-8-sig")
-        print(f"[✅] t86 {date_str} cleaned → {out}")
-        return True
+        result = transform(df)
+        out = write_cleaned(name, date_str, result)
+        print(f"[✅] {name} {date_str} cleaned → {out}")
+        return result
     except Exception as e:
-        print(f"[❌] t86 {date_str} 清洗失敗: {e}")
-        return False
+        print(f"[❌] {name} {date_str} 清洗失敗: {e}")
+        return None
+
+def process_date(name, date_str, filepath):
+    return process_date_frame(name, date_str, filepath) is not None
+
+def process_date_t86(date_str, filepath):
+    """處理指定日期的T86資料"""
+    return process_date("t86", date_str, filepath)
 
 def process_date_twt44u(date_str, filepath):
     """處理指定日期的TWT44U資料"""
-    try:
-        df = read_csv_auto(filepath, skiprows=1, dtype=str)
-        df.columns = df.columns.str.strip()
-        df.iloc[:, 1] = df.iloc[:, 1].str.replace("=", "").str.strip()
-        df = df.iloc[:, [1, 3, 4, 5]].copy()
-        df.columns = ["stock_id", "trust_buy", "trust_sell", "trust_net"]
-        df = df[df["stock_id"].str.match(r"^\d{4}$", na=False)]
-        df["trust_buy"] = df["trust_buy"].apply(clean_numeric)
-        df["trust_sell"] = df["trust_sell"].apply(clean_numeric)
-        df["trust_net"] = df["trust_net"].apply(clean_numeric)
-        
-        ensure_dir(CLEANED_DIR)
-        out = os.path.join(CLEANED_DIR, f"{date_str}_cleaned_twt44u.csv")
-        df.to_csv(out, index=False, encoding="utf-8-sig")
-        print(f"[✅] twt44u {date_str} cleaned → {out}")
-        return True
-    except Exception as e:
-        print(f"[❌] twt44u {date_str} 清洗失敗: {e}")
-        return False
+    return process_date("twt44u", date_str, filepath)
 
 def process_date_twt38u(date_str, filepath):
     """處理指定日期的TWT38U資料"""
-    try:
-        df = read_csv_auto(filepath, skiprows=2, dtype=str)
-        df.columns = df.columns.str.strip()
-        df.iloc[:, 1] = df.iloc[:, 1].str.replace("=", "").str.strip()
-        result_df = pd.DataFrame()
-        result_df["stock_id"] = df.iloc[:, 1]
-        result_df["FI_Buy"] = df.iloc[:, 3].apply(clean_numeric)
-        result_df["FI_Sell"] = df.iloc[:, 4].apply(clean_numeric)
-        result_df["FI_Net"] = df.iloc[:, 5].apply(clean_numeric)
-        result_df["PD_Buy"] = 0
-        result_df["PD_Sell"] = 0
-        result_df["PD_Net"] = 0
-        result_df["FA_Buy"] = df.iloc[:, 9].apply(clean_numeric)
-        result_df["FA_Sell"] = df.iloc[:, 10].apply(clean_numeric)
-        result_df["FA_Net"] = df.iloc[:, 11].apply(clean_numeric)
-        result_df = result_df[result_df["stock_id"].str.match(r"^\d{4}$", na=False)]
-        
-        ensure_dir(CLEANED_DIR)
-        out = os.path.join(CLEANED_DIR, f"{date_str}_cleaned_twt38u.csv")
-        result_df.to_csv(out, index=False, encoding="utf-8-sig")
-        print(f"[✅] twt38u {date_str} cleaned → {out}")
-        return True
-    except Exception as e:
-        print(f"[❌] twt38u {date_str} 清洗失敗: {e}")
-        return False
+    return process_date("twt38u", date_str, filepath)
 
 def process_date_margen(date_str, filepath):
     """處理指定日期的MI_MARGN資料"""
-    try:
-        df = read_csv_auto(filepath, skiprows=7, dtype=str)
-        df.columns = df.columns.str.strip()
-        df["stock_id"] = df.iloc[:, 0].str.strip()
-        df = df[df["stock_id"].str.match(r"^\d{4}$", na=False)]
-        df["margin_diff"] = df.iloc[:, 6].apply(clean_numeric) - df.iloc[:, 5].apply(clean_numeric)
-        df["short_diff"] = df.iloc[:, 12].apply(clean_numeric) - df.iloc[:, 11].apply(clean_numeric)
-        
-        ensure_dir(CLEANED_DIR)
-        out = os.path.join(CLEANED_DIR, f"{date_str}_cleaned_margen.csv")
-        df[["stock_id", "margin_diff", "short_diff"]].to_csv(out, index=False, encoding="utf-8-sig")
-        print(f"[✅] mi_margn {date_str} cleaned → {out}")
-        return True
-    except Exception as e:
-        print(f"[❌] mi_margn {date_str} 清洗失敗: {e}")
-        return False
+    return process_date("mi_margn", date_str, filepath)
 
 def process_date_mi_index(date_str, filepath):
     """處理指定日期的MI_INDEX資料"""
-    try:
-        # 找到標題列
-        header_row = None
-        with open(filepath, "r", encoding="cp950", errors="ignore") as f:
-            for idx, line in enumerate(f):
-                if "證券代號" in line and "收盤價" in line:
-                    header_row = idx
-                    break
-        
-        if header_row is None:
-            print(f"[⚠] {filepath} 找不到標題列")
-            return False
-        
-        df = read_csv_auto(filepath, skiprows=header_row, dtype=str)
-        df.columns = df.columns.str.strip()
-        
-        # 移除 Unnamed 欄位
-        df = df.drop(columns=[c for c in df.columns if c.startswith("Unnamed")], errors="ignore")
-        
-        # 只保留 4 位數股票代號
-        df = df[df["證券代號"].str.match(r"^\d{4}$", na=False)]
-        
-        # 重新命名欄位
-        df = df.rename(columns={
-            "證券代號": "stock_id",
-            "證券名稱": "name",
-            "成交股數": "volume",
-            "成交金額": "value",
-            "成交筆數": "transactions",
-            "開盤價": "open",
-            "最高價": "high",
-            "最低價": "low",
-            "收盤價": "close",
-            "漲跌價差": "change",
-            "最後揭示買價": "last_bid_price",
-            "最後揭示買量": "last_bid_volume",
-            "最後揭示賣價": "last_ask_price",
-            "最後揭示賣量": "last_ask_volume",
-            "本益比": "per"
-        })
-        
-        # 針對數值欄位做 clean_numeric
-        for col in df.columns:
-            if col not in ["stock_id", "name"]:
-                df[col] = df[col].apply(clean_numeric)
-        
-        ensure_dir(CLEANED_DIR)
-        out = os.path.join(CLEANED_DIR, f"{date_str}_cleaned_mi_index.csv")
-        df.to_csv(out, index=False, encoding="utf-8-sig")
-        print(f"[✅] mi_index {date_str} cleaned → {out}")
-        return True
-    except Exception as e:
-        print(f"[❌] mi_index {date_str} 清洗失敗: {e}")
-        return False
+    return process_date("mi_index", date_str, filepath)
+
+# ===== 批次清洗引擎 =====
+# 同一資料源的所有日期共用一份解析計畫（編碼、標題列位置、欄名），
+# 標題列相同的檔案把資料列串成一份文字、只呼叫一次 read_csv，清洗後再依日期拆回逐日輸出；
+# 不同資料源在各自的行程中同時清洗。讀不懂的檔案或失敗的批次退回逐檔清洗
+BATCH_FILES = 250      # 每批合併的檔案數（控制記憶體）
+CLEAN_WORKERS = None   # 同時清洗的資料源數；None = min(資料源數, CPU 數)
+BATCH_ENCODINGS = ("cp950", "utf-8-sig")   # 與 read_csv_auto 相同的嘗試順序
+
+def header_names(line):
+    """標題列 → 欄名，空白欄與重複欄比照 pandas 命名（Unnamed: i、name.1）"""
+    names, seen = [], {}
+    for i, raw in enumerate(next(csv.reader([line]))):
+        base = raw if raw != "" else f"Unnamed: {i}"
+        count = seen.get(base, 0)
+        seen[base] = count + 1
+        names.append(base if count == 0 else f"{base}.{count}")
+    return tuple(names)
+
+def split_raw_file(name, filepath):
+    """解碼原始檔並切出 (欄名, 資料列)；無法解析時回傳 None（改走逐檔清洗）"""
+    with open(filepath, "rb") as f:
+        raw = f.read()
+    for enc in BATCH_ENCODINGS:
+        try:
+            lines = raw.decode(enc).splitlines()
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        return None
+
+    skiprows = CLEAN_SPECS[name][1]
+    if skiprows is None:
+        skiprows = next((i for i, line in enumerate(lines) if is_mi_index_header(line)), None)
+        if skiprows is None:
+            return None
+    # 與 read_csv 相同：略過 skiprows 行後，第一個非空白行為標題列
+    body = (line for line in lines[skiprows:] if line.strip())
+    header = next(body, None)
+    if header is None:
+        return None
+    return header_names(header), list(body)
 
-def clean_all_downloaded():
-    """清洗所有已下載的原始資料"""
+def clean_batch(name, header, members, handoff_dir=None):
+    """
+    同標題列的多個檔案合併成一個資料框清洗，再依日期拆回；回傳 (寫出的檔案數, 交棒 handle)。
+    指定 handoff_dir 時整批結果（加上 date 欄）以 Arrow IPC 交給主行程
+    """
+    text = io.StringIO()
+    for i, (_, _, data) in enumerate(members):
+        for line in data:
+            text.write(f"{i},{line}\n")
+    text.seek(0)
+    df = pd.read_csv(text, header=None, names=("__file",) + header, dtype=str, index_col=False)
+    files = df.pop("__file").astype(int)
+    df.columns = df.columns.str.strip()
+    result = CLEAN_SPECS[name][0](df)
+    by_file = dict(tuple(result.groupby(files.loc[result.index], sort=False)))
+    for i, (date_str, _, _) in enumerate(members):
+        # 該日沒有任何符合的列時與逐檔清洗相同，輸出只有標題的檔案
+        write_cleaned(name, date_str, by_file.get(i, result.iloc[:0]))
+    handle = None
+    if handoff_dir:
+        dates = [date_str for date_str, _, _ in members]
+        result = result.assign(date=[dates[i] for i in files.loc[result.index]])
+        handle = export_frame(result, name, dates[0], handoff_dir)
+    return len(members), handle
+
+def clean_source_batch(name, files, cleaned_dir, handoff_dir=None):
+    """
+    清洗單一資料源的所有 (日期, 路徑)；於工作行程中執行，回傳統計。
+    指定 handoff_dir 時清洗結果另以 Arrow IPC 交棒，handle 放在 stats["handles"]
+    """
+    global CLEANED_DIR
+    CLEANED_DIR = cleaned_dir
+    stats = {"name": name, "files": len(files), "success": 0, "fail": 0, "fallback": 0, "handles": []}
+    fallback = []
+    for start in range(0, len(files), BATCH_FILES):
+        groups = {}
+        for date_str, filepath in files[start:start + BATCH_FILES]:
+            parsed = split_raw_file(name, filepath)
+            if parsed is None:
+                fallback.append((date_str, filepath))
+                continue
+            header, data = parsed
+            groups.setdefault(header, []).append((date_str, filepath, data))
+        for header, members in groups.items():
+            try:
+                count, handle = clean_batch(name, header, members, handoff_dir)
+                stats["success"] += count
+                if handle is not None:
+                    stats["handles"].append(handle)
+            except Exception as e:
+                print(f"[⚠] {name} 批次清洗失敗（{len(members)} 檔，改為逐檔）: {e}")
+                fallback.extend((d, p) for d, p, _ in members)
+
+    stats["fallback"] = len(fallback)
+    for date_str, filepath in fallback:
+        result = process_date_frame(name, date_str, filepath)
+        if result is None:
+            stats["fail"] += 1
+            continue
+        stats["success"] += 1
+        if handoff_dir:
+            stats["handles"].append(export_frame(result, name, date_str, handoff_dir))
+    return stats
+
+def clean_all_downloaded(workers=CLEAN_WORKERS, collect=False):
+    """
+    清洗所有已下載的原始資料（依資料源批次清洗，資料源之間平行）。
+    collect=True 時回傳 {資料源: 多日期 Arrow 表}：工作行程把結果寫在記憶體交棒目錄，
+    主行程以 memory map 組合，不經 pickle 複製，並直接在表上核對列數、日期數與股票代號
+    """
     print("\n=== 開始清洗所有資料 ===")
     
     if not os.path.exists(RAW_DIR):
         print("[⚠] Raw 資料夾不存在")
         return
     
-    # 取得所有日期
-    all_dates = set()
-    for filename in os.listdir(RAW_DIR):
-        if filename.endswith('.csv'):
-            match = re.search(r'(\d{8})_', filename)
-            if match:
-                all_dates.add(match.group(1))
-    
-    all_dates = sorted(all_dates)
-    print(f"[ℹ] 找到 {len(all_dates)} 個日期的資料")
-    
-    # 處理器映射
-    processors = {
-        't86': process_date_t86,
-        'twt44u': process_date_twt44u,
-        'twt38u': process_date_twt38u,
-        'mi_margn': process_date_margen,
-        'mi_index': process_date_mi_index
-    }
+    # 每個資料源的所有 (日期, 路徑) 一次由原始檔目錄索引取出，不再逐日查詢
+    catalog = get_catalog(RAW_DIR)
+    print(f"[ℹ] 找到 {len(catalog.dates())} 個日期的資料")
+    jobs = {name: catalog.range(name) for name in CLEAN_SPECS}
+    jobs = {name: files for name, files in jobs.items() if files}
+    if not jobs:
+        return
     
-    total_success = 0
-    total_fail = 0
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    started = time.time()
+    with HandoffDir() if collect else nullcontext() as handoff:
+        handoff_dir = str(handoff.path) if collect else None
+        if workers <= 1:
+            results = [clean_source_batch(name, files, CLEANED_DIR, handoff_dir) for name, files in jobs.items()]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(clean_source_batch, name, files, CLEANED_DIR, handoff_dir)
+                           for name, files in jobs.items()]
+                results = [f.result() for f in futures]
+        tables = assemble(h for r in results for h in r["handles"]) if collect else None
+        validation = summarize_tables(tables) if collect else {}
     
-    # 逐日處理
-    for i, date_str in enumerate(all_dates, 1):
-        print(f"\n── 清洗日期 {date_str} ({i}/{len(all_dates)}) ──")
-        
-        # 取得這個日期的所有檔案
-        date_files = get_raw_files_by_date(date_str)
-        
-        if not date_files:
-            print(f"[⚠] {date_str} 沒有找到任何原始檔案")
-            continue
-        
-        # 處理各個資料源
-        for name, filepath in date_files.items():
-            if name in processors:
-                if processors[name](date_str, filepath):
-                    total_success += 1
-                else:
-                    total_fail += 1
-            else:
-                print(f"[⚠] 不認識的資料源: {name}")
+    for r in results:
+        print(f"[✅] {r['name']}: {r['success']}/{r['files']} 檔"
+              + (f"（逐檔 {r['fallback']}）" if r["fallback"] else "")
+              + (f"，失敗 {r['fail']}" if r["fail"] else ""))
     
     print(f"\n[📊] 清洗統計:")
-    print(f"    - 成功: {total_success}")
-    print(f"    - 失敗: {total_fail}")
+    print(f"    - 成功: {sum(r['success'] for r in results)}")
+    print(f"    - 失敗: {sum(r['fail'] for r in results)}")
+    print(f"    - 耗時: {time.time() - started:.1f} 秒（{workers} 個行程）")
+    if tables:
+        success = {r["name"]: r["success"] for r in results}
+        for name, table in tables.items():
+            info = validation[name]
+            print(f"[📊] {name}: {table.num_rows} 行、{info['dates']} 個日期（{table.nbytes / 1e6:.1f} MB）")
+            # 只有標題列的清洗檔不會出現在表中
+            if info["dates"] < success.get(name, 0):
+                print(f"[⚠] {name}: {success[name] - info['dates']} 個清洗檔沒有資料列")
+            if info["invalid_ids"]:
+                print(f"[⚠] {name}: {info['invalid_ids']} 列股票代號不是 4 位數字")
+    return tables
 
 # ===== 主程式 =====
 def main():
@@ -463,8 +588,8 @@ def main():
         # 步驟 1: 下載所有歷史資料
         download_all_historical()
         
-        # 步驟 2: 清洗所有已下載的資料
-        clean_all_downloaded()
+        # 步驟 2: 清洗所有已下載的資料（清洗結果交棒給主行程核對）
+        clean_all_downloaded(collect=True)
         
         # 完成
         end_time = datetime.now()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP Client Factory - 上市抓取程式共用的 HTTP 連線工廠
+連線池大小、keep-alive、底層連線重試集中設定；
+預設使用 requests，可切換為支援 HTTP/2 的 httpx 傳輸層，並提供連線重用統計
+"""
+
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# ===== 預設設定 =====
+POOL_CONNECTIONS = 4      # 快取的主機連線池數量（twse 只有一兩個主機）
+POOL_MAXSIZE = 16         # 每個主機保留的最大連線數（需 >= 併發 worker 數）
+KEEPALIVE_TIMEOUT = 60    # 閒置連線保留秒數（僅 httpx 傳輸層可調）
+CONNECT_RETRIES = 2       # 連線層級的快速重試（DNS / TCP reset），應用層重試交給 RetryEngine
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """可回報連線重用統計的 HTTPAdapter"""
+
+    def __init__(self, *args, **kwargs):
+        self._stats_lock = threading.Lock()
+        self._retired = {"connections": 0, "requests": 0}
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        # 連線池被 LRU 淘汰時累計其統計，避免遺失
+        self.poolmanager.pools.dispose_func = self._retire_pool
+
+    def _retire_pool(self, pool) -> None:
+        with self._stats_lock:
+            self._retired["connections"] += pool.num_connections
+            self._retired["requests"] += pool.num_requests
+        pool.close()
+
+    def connection_stats(self) -> Dict[str, Any]:
+        """回傳新建連線數、請求數與連線重用率"""
+        with self._stats_lock:
+            connections = self._retired["connections"]
+            requests_sent = self._retired["requests"]
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                requests_sent += pool.num_requests
+        reused = max(requests_sent - connections, 0)
+        return {
+            "transport": "requests",
+            "connections_opened": connections,
+            "requests": requests_sent,
+            "reused": reused,
+            "reuse_ratio": round(reused / requests_sent, 3) if requests_sent else 0.0,
+        }
+
+
+class HttpxSession:
+    """
+    以 httpx（HTTP/2）實作的最小 Session 介面：get(url, headers=, timeout=, verify=)
+    回傳物件具備 status_code / content，可直接取代 requests.Session
+    """
+
+    def __init__(self, headers: Dict[str, str], pool_maxsize: int, keepalive_timeout: float):
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections=pool_maxsize,
+            max_keepalive_connections=pool_maxsize,
+            keepalive_expiry=keepalive_timeout,
+        )
+        self._client = httpx.Client(
+            headers=headers,
+            transport=httpx.HTTPTransport(
+                http2=True, verify=False, limits=limits, retries=CONNECT_RETRIES
+            ),
+        )
+        self.headers = self._client.headers
+        self._requests = 0
+        self._http2_responses = 0
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 10, **kwargs):
+        # verify 已於 client 建立時決定
+        kwargs.pop("verify", None)
+        kwargs.pop("stream", None)
+        r = self._client.get(url, headers=headers, timeout=timeout, **kwargs)
+        self._requests += 1
+        if r.http_version == "HTTP/2":
+            self._http2_responses += 1
+        return r
+
+    def connection_stats(self) -> Dict[str, Any]:
+        # httpx 不公開連線計數；HTTP/2 在單一連線上多工，回報協定使用比例
+        return {
+            "transport": "httpx",
+            "requests": self._requests,
+            "http2_responses": self._http2_responses,
+        }
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def create_session(headers: Optional[Dict[str, str]] = None, transport: str = "requests",
+                   pool_connections: int = POOL_CONNECTIONS, pool_maxsize: int = POOL_MAXSIZE,
+                   keepalive_timeout: float = KEEPALIVE_TIMEOUT, connect_retries: int = CONNECT_RETRIES):
+    """
+    建立共用 Session
+    - headers 只在建立時合併一次，呼叫端每次只需帶 Referer
+    - transport="httpx" 且已安裝 httpx[http2] 時使用 HTTP/2，否則退回 requests
+    """
+    headers = dict(headers or {})
+    headers.setdefault("Connection", "keep-alive")
+
+    if transport == "httpx":
+        try:
+            return HttpxSession(headers, pool_maxsize, keepalive_timeout)
+        except ImportError:
+            logging.warning("未安裝 httpx[http2]，改用 requests 傳輸層")
+
+    session = requests.Session()
+    session.headers.update(headers)
+    session.verify = False
+    retry = Retry(
+        total=None,
+        connect=connect_retries,
+        read=0,
+        status=0,
+        backoff_factor=0.5,
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    adapter = PooledHTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+        pool_block=True,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def connection_stats(session) -> Dict[str, Any]:
+    """取得 Session 的連線重用統計（不支援時回傳空 dict）"""
+    if hasattr(session, "connection_stats"):
+        return session.connection_stats()
+    adapter = session.get_adapter("https://") if hasattr(session, "get_adapter") else None
+    if isinstance(adapter, PooledHTTPAdapter):
+        return adapter.connection_stats()
+    return {}
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    """將統計格式化為一行文字，供 print / logging 使用"""
+    if not stats:
+        return "無連線統計"
+    if stats.get("transport") == "httpx":
+        return f"httpx 請求 {stats['requests']} 次，HTTP/2 回應 {stats['http2_responses']} 次"
+    return (f"請求 {stats['requests']} 次，新建連線 {stats['connections_opened']} 條，"
+            f"重用率 {stats['reuse_ratio']:.1%}")
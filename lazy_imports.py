@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lazy Imports - 延遲載入重量級套件
+pandas / selenium / psutil / holidays 在模組載入時只建立代理物件，
+第一次真正使用屬性或呼叫時才 import，讓「只清洗」「只驗證」等模式快速啟動
+"""
+
+import importlib
+import sys
+import threading
+from typing import Any, List
+
+
+class LazyModule:
+    """模組代理：第一次存取屬性時才載入實際模組"""
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        setattr(self._load(), attr, value)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<LazyModule {self.__dict__['_name']} ({state})>"
+
+
+class LazyAttr:
+    """模組內單一物件（類別、函式）的代理，例如 selenium 的 By、Select"""
+
+    def __init__(self, module: str, attr: str):
+        self._module = LazyModule(module)
+        self._attr = attr
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            self._target = getattr(self._module, self._attr)
+        return self._target
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._resolve(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"<LazyAttr {self._module.__dict__['_name']}.{self._attr}>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """取代 `import name`：回傳延遲載入的模組代理"""
+    return LazyModule(name)
+
+
+def lazy_attr(module: str, attr: str) -> LazyAttr:
+    """取代 `from module import attr`：回傳延遲載入的物件代理"""
+    return LazyAttr(module, attr)
+
+
+def loaded_modules(names: List[str]) -> List[str]:
+    """回傳 names 中已實際載入的模組（供啟動時間量測檢查）"""
+    return [name for name in names if name in sys.modules]
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Margin Series - 融資融券餘額時間序列（只追加的欄式儲存）
+上市由 MI_MARGN 原始檔、上櫃由 margin_transactions 清洗檔取出每日餘額、限額與使用率，
+每個欄位一個二進位檔（<欄位>.bin），每天追加一段；index.json 記錄股票清單與每天的起訖列。
+追加時只讀前一天那一段，核對今日「前日餘額」是否等於昨日「今日餘額」；
+區間查詢以 memory map 直接切片，不需要解析 CSV
+
+用法：
+    python margin_series.py                        # 追加兩個市場尚未寫入的日期
+    python margin_series.py --rebuild              # 清掉序列，從頭重建
+    python margin_series.py 2330 --from 20240101   # 查詢指定股票
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from lazy_imports import lazy_import
+from market_snapshot import TWSE_RAW_DIR, TWSE_CLEANED_DIR, OTC_CLEAN_DIR
+from raw_catalog import get_catalog
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# 欄位與型別：餘額 / 限額為張數，使用率為百分比
+FIELDS = {
+    "mt_prev_balance": "int64",
+    "mt_balance": "int64",
+    "mt_limit": "int64",
+    "mt_usage_rate": "float64",
+    "st_prev_balance": "int64",
+    "st_balance": "int64",
+    "st_limit": "int64",
+    "st_usage_rate": "float64",
+}
+STOCK_COLUMN = "stock"      # 每列的股票編號（對應 index.json 的 stocks）
+STOCK_DTYPE = "int32"
+
+# MI_MARGN 欄位位置（與 process_margen 相同的 skiprows=7 版面）
+#   融資：5 前日餘額、6 今日餘額、7 次一營業日限額；融券：11、12、13
+TWSE_MARGIN_COLUMNS = {
+    "mt_prev_balance": 5, "mt_balance": 6, "mt_limit": 7,
+    "st_prev_balance": 11, "st_balance": 12, "st_limit": 13,
+}
+
+
+def series_dir(exchange: str) -> Path:
+    base = TWSE_CLEANED_DIR if exchange == "TWSE" else OTC_CLEAN_DIR
+    return Path(base) / "margin_series"
+
+
+class MarginSeries:
+    """單一市場的融資融券餘額序列"""
+
+    def __init__(self, exchange: str, directory: Optional[Path] = None, read_only: bool = False):
+        self.exchange = exchange
+        self.read_only = read_only          # 只讀（例如查詢服務）：不截斷欄位檔，以免切到正在追加的資料
+        self.dir = Path(directory) if directory else series_dir(exchange)
+        self.index_path = self.dir / "index.json"
+        self.stocks: List[str] = []
+        self.days: List[Dict] = []          # [{"date", "start", "count", "mismatches"}]
+        self._load()
+
+    # ---- 索引 ----
+    def _load(self) -> None:
+        if self.index_path.exists():
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("fields") == list(FIELDS):
+                self.stocks = index["stocks"]
+                self.days = index["days"]
+            else:
+                logging.warning(f"[融資券序列] {self.exchange} 欄位設定已變更，需要 --rebuild")
+        self._stock_pos = {s: i for i, s in enumerate(self.stocks)}
+        if not self.read_only:
+            self._truncate_to_index()
+
+    def _save_index(self) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"exchange": self.exchange, "fields": list(FIELDS),
+                       "stocks": self.stocks, "days": self.days}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _truncate_to_index(self) -> None:
+        """追加到一半中斷時，欄位檔可能比索引長；截到索引記錄的列數"""
+        for column, dtype in self._columns().items():
+            path = self._column_path(column)
+            size = self.rows * np.dtype(dtype).itemsize
+            if path.exists() and path.stat().st_size > size:
+                os.truncate(path, size)
+
+    @property
+    def rows(self) -> int:
+        return self.days[-1]["start"] + self.days[-1]["count"] if self.days else 0
+
+    @property
+    def dates(self) -> List[str]:
+        return [d["date"] for d in self.days]
+
+    @property
+    def last_date(self) -> str:
+        return self.days[-1]["date"] if self.days else ""
+
+    # ---- 欄位檔 ----
+    @staticmethod
+    def _columns() -> Dict[str, str]:
+        return {STOCK_COLUMN: STOCK_DTYPE, **FIELDS}
+
+    def _column_path(self, column: str) -> Path:
+        return self.dir / f"{column}.bin"
+
+    def column(self, column: str, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """以 memory map 讀取欄位的 [start, stop) 列"""
+        stop = self.rows if stop is None else stop
+        dtype = self._columns()[column]
+        if stop <= start:
+            return np.empty(0, dtype=dtype)
+        data = np.memmap(self._column_path(column), dtype=dtype, mode="r", shape=(self.rows,))
+        return data[start:stop]
+
+    # ---- 追加 ----
+    def _stock_indices(self, stock_ids: Iterable[str]) -> np.ndarray:
+        indices = []
+        for stock_id in stock_ids:
+            pos = self._stock_pos.get(stock_id)
+            if pos is None:
+                pos = self._stock_pos[stock_id] = len(self.stocks)
+                self.stocks.append(stock_id)
+            indices.append(pos)
+        return np.array(indices, dtype=STOCK_DTYPE)
+
+    def reconcile(self, stock_idx: np.ndarray, day: pd.DataFrame) -> List[str]:
+        """今日前日餘額 vs 前一天今日餘額；只讀前一天那一段。回傳不一致的股票代號"""
+        if not self.days:
+            return []
+        prev = self.days[-1]
+        start, stop = prev["start"], prev["start"] + prev["count"]
+        prev_idx = self.column(STOCK_COLUMN, start, stop)
+        present = np.zeros(len(self.stocks), dtype=bool)
+        present[prev_idx] = True
+        mismatch = np.zeros(len(day), dtype=bool)
+        for side in ("mt", "st"):
+            yesterday = np.zeros(len(self.stocks), dtype=np.int64)
+            yesterday[prev_idx] = self.column(f"{side}_balance", start, stop)
+            today_prev = day[f"{side}_prev_balance"].to_numpy(dtype=np.int64)
+            mismatch |= present[stock_idx] & (today_prev != yesterday[stock_idx])
+        return [self.stocks[i] for i in stock_idx[mismatch]]
+
+    def append(self, date_str: str, day: pd.DataFrame) -> List[str]:
+        """追加一天（日期必須晚於最後一天）；回傳核對不一致的股票代號"""
+        if date_str <= self.last_date:
+            raise ValueError(f"{self.exchange} 融資券序列只能往後追加：{date_str} <= {self.last_date}")
+        day = day.drop_duplicates("stock_id").sort_values("stock_id")
+        stock_idx = self._stock_indices(day["stock_id"])
+        mismatches = self.reconcile(stock_idx, day)
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        columns = {STOCK_COLUMN: stock_idx}
+        columns.update({field: day[field].to_numpy() for field in FIELDS})
+        for column, values in columns.items():
+            with open(self._column_path(column), "ab") as f:
+                np.asarray(values, dtype=self._columns()[column]).tofile(f)
+        self.days.append({"date": date_str, "start": self.rows, "count": len(day),
+                          "mismatches": len(mismatches)})
+        self._save_index()
+        return mismatches
+
+    # ---- 查詢 ----
+    def query(self, stock_ids: Optional[Iterable[str]] = None, start: str = "00000000",
+              end: str = "99999999", fields: Optional[List[str]] = None) -> pd.DataFrame:
+        """[start, end] 區間（可指定股票與欄位），回傳 date / stock_id / 欄位 的長表"""
+        dates = self.dates
+        first, last = bisect.bisect_left(dates, start), bisect.bisect_right(dates, end)
+        fields = list(fields or FIELDS)
+        if first >= last:
+            return pd.DataFrame(columns=["date", "stock_id"] + fields)
+        days = self.days[first:last]
+        row_start, row_stop = days[0]["start"], days[-1]["start"] + days[-1]["count"]
+
+        stock_idx = self.column(STOCK_COLUMN, row_start, row_stop)
+        mask = slice(None)
+        if stock_ids is not None:
+            wanted = [self._stock_pos[s] for s in stock_ids if s in self._stock_pos]
+            mask = np.isin(stock_idx, wanted)
+
+        stocks = np.array(self.stocks)
+        data = {
+            "date": np.repeat([d["date"] for d in days], [d["count"] for d in days])[mask],
+            "stock_id": stocks[stock_idx[mask]],
+        }
+        for field in fields:
+            data[field] = self.column(field, row_start, row_stop)[mask]
+        return pd.DataFrame(data)
+
+    def balance_matrix(self, field: str = "mt_balance", start: str = "00000000",
+                       end: str = "99999999") -> pd.DataFrame:
+        """日期 × 股票 的寬表（趨勢分析用）"""
+        return self.query(start=start, end=end, fields=[field]).pivot(
+            index="date", columns="stock_id", values=field)
+
+
+# ===== 每日資料來源 =====
+def read_twse_margin(path: str) -> pd.DataFrame:
+    """MI_MARGN 原始檔 → 統一欄位；上市原始檔沒有使用率，以 餘額 / 限額 計算"""
+    for enc in ("cp950", "utf-8"):
+        try:
+            raw = pd.read_csv(path, skiprows=7, dtype=str, encoding=enc)
+            break
+        except (UnicodeDecodeError, pd.errors.ParserError):
+            continue
+    else:
+        raw = pd.read_csv(path, skiprows=7, dtype=str, encoding="cp950", encoding_errors="ignore")
+    df = pd.DataFrame({"stock_id": raw.iloc[:, 0].str.strip()})
+    for field, position in TWSE_MARGIN_COLUMNS.items():
+        values = raw.iloc[:, position].str.replace(",", "", regex=False).str.strip()
+        df[field] = pd.to_numeric(values, errors="coerce").fillna(0).astype("int64")
+    df = df[df["stock_id"].str.match(r"^\d{4}$", na=False)]
+    for side in ("mt", "st"):
+        limit = df[f"{side}_limit"]
+        df[f"{side}_usage_rate"] = (df[f"{side}_balance"] / limit.where(limit > 0) * 100).round(2).fillna(0.0)
+    return df
+
+
+def read_otc_margin(path: Path) -> pd.DataFrame:
+    """margin_transactions 清洗檔 → 統一欄位"""
+    df = pd.read_csv(path, dtype={"stock_id": str}, encoding="utf-8-sig")
+    out = pd.DataFrame({"stock_id": df["stock_id"].str.strip()})
+    for field, dtype in FIELDS.items():
+        values = pd.to_numeric(df[field], errors="coerce") if field in df.columns else 0
+        out[field] = pd.Series(values, index=df.index).fillna(0).astype(dtype)
+    return out
+
+
+def available_days(exchange: str) -> List[tuple]:
+    """目前有檔案的 (日期, 路徑)，日期遞增"""
+    if exchange == "TWSE":
+        if not os.path.isdir(TWSE_RAW_DIR):
+            return []
+        return list(get_catalog(TWSE_RAW_DIR).range("mi_margn"))
+    days = []
+    for path in sorted(OTC_CLEAN_DIR.glob("*_margin_transactions.csv")):
+        m = re.match(r"(\d{8})_", path.name)
+        if m:
+            days.append((m.group(1), path))
+    return days
+
+
+def update_margin_series(exchange: Optional[str] = None, rebuild: bool = False) -> Dict[str, str]:
+    """每日流程結尾呼叫；回傳各市場最後一天，失敗不影響主流程"""
+    latest = {}
+    for name, reader in (("TWSE", read_twse_margin), ("TPEx", read_otc_margin)):
+        if exchange and name != exchange:
+            continue
+        try:
+            if rebuild:
+                shutil.rmtree(series_dir(name), ignore_errors=True)
+            series = MarginSeries(name)
+            days = available_days(name)
+            # 序列只能往後追加；事後補進的較早日期（例如缺漏回補）要 --rebuild 才會寫入
+            known = set(series.dates)
+            late = [d for d, _ in days if d < series.last_date and d not in known]
+            if late:
+                logging.warning(f"[融資券序列] {name} 有 {len(late)} 個早於 {series.last_date} 的新日期"
+                                f"（{late[0]}…{late[-1]}），需要 --rebuild")
+            pending = [(d, p) for d, p in days if d > series.last_date]
+            for date_str, path in pending:
+                mismatches = series.append(date_str, reader(path))
+                if mismatches:
+                    sample = "、".join(mismatches[:5])
+                    logging.warning(f"[融資券序列] {name} {date_str} 前日餘額不一致 {len(mismatches)} 檔：{sample}")
+            latest[name] = series.last_date
+        except Exception as e:
+            logging.warning(f"[融資券序列] {name} 更新失敗：{e}")
+    return latest
+
+
+def arg_value(flag: str, default: str) -> str:
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    latest = update_margin_series(rebuild="--rebuild" in sys.argv)
+    for name, date_str in latest.items():
+        print(f"[📊] {name}: {date_str or '尚無資料'}")
+
+    start, end = arg_value("--from", "00000000"), arg_value("--to", "99999999")
+    stock_ids = [a for a in sys.argv[1:] if re.fullmatch(r"\d{4}", a)]
+    if stock_ids:
+        for name in latest:
+            result = MarginSeries(name).query(stock_ids, start, end)
+            if len(result):
+                print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
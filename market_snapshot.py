@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Market Snapshot - 上市 + 上櫃每日收盤合併快照
+把上市 cleaned_mi_index 與上櫃 daily_close_no1430 清洗檔統一欄位名稱與型別，
+依 stock_id 排序後存成 Feather（market_snapshots/market_close_YYYYMMDD.feather），
+全市場查詢只需讀一個檔案；load_snapshot() 以 memory map 讀取並以 stock_id 為索引
+
+用法：
+    python market_snapshot.py              # 建立最新一個兩邊都有資料的日期
+    python market_snapshot.py 20241016     # 指定日期
+    python market_snapshot.py --all        # 重建所有兩邊都有資料的日期
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+BASE_DIR = Path(__file__).parent
+SNAPSHOT_DIR = BASE_DIR / "market_snapshots"
+
+# 與 daily_data_updater / historical_tse_batch_downloader 相同
+TWSE_RAW_DIR = r"C:\05model\raw"
+TWSE_CLEANED_DIR = r"C:\05model\cleaned"
+# 與 otc_common 相同
+OTC_CLEAN_DIR = BASE_DIR / "otc_cleaned"
+
+# 統一後的欄位與型別；量為股數 / 張數取整數，價格為浮點（無成交為 NaN）
+SCHEMA = {
+    "stock_id": "string",
+    "exchange": "category",
+    "name": "string",
+    "open": "float64",
+    "high": "float64",
+    "low": "float64",
+    "close": "float64",
+    "change": "float64",
+    "volume": "int64",
+    "value": "int64",
+    "trades": "int64",
+    "last_bid_price": "float64",
+    "last_bid_volume": "int64",
+    "last_ask_price": "float64",
+    "last_ask_volume": "int64",
+}
+PRICE_COLUMNS = ["open", "high", "low", "close", "last_bid_price", "last_ask_price"]
+
+# 各交易所清洗檔欄位 → 統一欄位
+TWSE_COLUMNS = {"transactions": "trades"}
+OTC_COLUMNS = {"amount": "value", "last_bid_vol": "last_bid_volume", "last_ask_vol": "last_ask_volume"}
+
+
+def twse_cleaned_path(date_str: str, source: str) -> Optional[str]:
+    """上市清洗檔：歷史批量與每日更新都寫 YYYYMMDD_cleaned_<source>.csv
+    （不帶日期的 cleaned_<source>.csv 無法確認內容日期，不採用）"""
+    dated = os.path.join(TWSE_CLEANED_DIR, f"{date_str}_cleaned_{source}.csv")
+    return dated if os.path.exists(dated) else None
+
+
+def otc_close_path(date_str: str) -> Optional[Path]:
+    path = OTC_CLEAN_DIR / f"{date_str}_daily_close_no1430.csv"
+    return path if path.exists() else None
+
+
+def signed_twse_change(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    上市清洗檔的漲跌價差不含正負號，方向在 change_sign 欄（+1 / -1 / 0，不比價為空）；
+    還原成與上櫃相同的有號漲跌。沒有 change_sign 的舊清洗檔無法判斷方向，change 設為 NaN
+    """
+    change = pd.to_numeric(df["change"], errors="coerce").abs() if "change" in df.columns else float("nan")
+    if "change_sign" in df.columns:
+        df["change"] = change * pd.to_numeric(df["change_sign"], errors="coerce")
+    else:
+        logging.warning("[快照] 上市清洗檔沒有 change_sign 欄（舊版清洗），漲跌設為 NaN；重新清洗可還原")
+        df["change"] = float("nan")
+    return df
+
+
+def normalize(df: pd.DataFrame, exchange: str, renames: Dict[str, str]) -> pd.DataFrame:
+    """改名、補齊缺少欄位並轉成統一型別"""
+    df = df.rename(columns=renames)
+    out = pd.DataFrame(index=df.index)
+    for column, dtype in SCHEMA.items():
+        if column == "exchange":
+            out[column] = exchange
+        elif column in df.columns:
+            out[column] = df[column]
+        else:
+            out[column] = pd.NA if dtype == "string" else 0
+    out["stock_id"] = out["stock_id"].astype(str).str.strip().str.zfill(4)
+    for column in PRICE_COLUMNS:
+        values = pd.to_numeric(out[column], errors="coerce")
+        out[column] = values.where(values > 0)      # 無成交（-- 清成 0）改為 NaN
+    for column, dtype in SCHEMA.items():
+        if dtype == "int64":
+            out[column] = pd.to_numeric(out[column], errors="coerce").fillna(0).round().astype("int64")
+        elif dtype == "float64":
+            out[column] = pd.to_numeric(out[column], errors="coerce").astype("float64")
+    return out
+
+
+def build_snapshot(date_str: str) -> Optional[Path]:
+    """建立單日快照；任一交易所缺資料時回傳 None"""
+    twse_path, otc_path = twse_cleaned_path(date_str, "mi_index"), otc_close_path(date_str)
+    if twse_path is None or otc_path is None:
+        missing = [name for name, p in (("上市", twse_path), ("上櫃", otc_path)) if p is None]
+        logging.info(f"[快照] {date_str} 缺少{'、'.join(missing)}收盤資料，略過")
+        return None
+
+    twse_raw = signed_twse_change(pd.read_csv(twse_path, dtype={"stock_id": str}, encoding="utf-8-sig"))
+    twse = normalize(twse_raw, "TWSE", TWSE_COLUMNS)
+    otc = normalize(pd.read_csv(otc_path, dtype={"stock_id": str}, encoding="utf-8-sig"), "TPEx", OTC_COLUMNS)
+
+    snapshot = pd.concat([twse, otc], ignore_index=True)
+    snapshot = snapshot.drop_duplicates("stock_id", keep="first").sort_values("stock_id", ignore_index=True)
+    snapshot["exchange"] = snapshot["exchange"].astype("category")
+    snapshot = snapshot.astype({k: v for k, v in SCHEMA.items() if v != "category"})
+
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    path = snapshot_path(date_str)
+    tmp_path = path.with_suffix(".tmp")
+    snapshot.to_feather(tmp_path)
+    os.replace(tmp_path, path)
+    logging.info(f"[快照] {date_str} 上市 {len(twse)} + 上櫃 {len(otc)} → {len(snapshot)} 檔 → {path}")
+    return path
+
+
+def snapshot_path(date_str: str) -> Path:
+    return SNAPSHOT_DIR / f"market_close_{date_str}.feather"
+
+
+def load_snapshot(date_str: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """讀取快照（memory map），以 stock_id 為索引"""
+    import pyarrow.feather as feather
+    read_columns = None if columns is None else ["stock_id"] + [c for c in columns if c != "stock_id"]
+    table = feather.read_table(snapshot_path(date_str), columns=read_columns, memory_map=True)
+    return table.to_pandas().set_index("stock_id")
+
+
+def lookup(date_str: str, stock_ids: Iterable[str], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """查詢指定股票（索引已排序，直接以 loc 取值）"""
+    snapshot = load_snapshot(date_str, columns)
+    return snapshot.loc[snapshot.index.intersection(list(stock_ids))]
+
+
+def available_dates() -> List[str]:
+    """兩邊都有收盤清洗檔的日期"""
+    otc_dates = {p.name[:8] for p in OTC_CLEAN_DIR.glob("*_daily_close_no1430.csv")}
+    return sorted(d for d in otc_dates if twse_cleaned_path(d, "mi_index") is not None)
+
+
+def update_snapshot(date_str: Optional[str] = None) -> Optional[Path]:
+    """每日流程結尾呼叫：建立指定日期（預設為最新可用日期）的快照，失敗不影響主流程"""
+    try:
+        if date_str is None:
+            dates = available_dates()
+            if not dates:
+                logging.info("[快照] 尚無兩邊都有資料的日期")
+                return None
+            date_str = dates[-1]
+        return build_snapshot(date_str)
+    except Exception as e:
+        logging.warning(f"[快照] 建立失敗：{e}")
+        return None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    dates = [a for a in sys.argv[1:] if a.isdigit() and len(a) == 8]
+    if "--all" in sys.argv:
+        dates = available_dates()
+    if not dates:
+        update_snapshot()
+        return
+    for date_str in dates:
+        build_snapshot(date_str)
+
+
+if __name__ == "__main__":
+    main()
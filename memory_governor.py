@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memory Governor - 長時間回補的記憶體控管
+每換一個日期（或每 N 個任務）量一次本行程與 ChromeDriver / Chrome 子行程樹的 RSS：
+  - Chrome 超過上限 → 通知呼叫端重開瀏覽器
+  - 本行程超過上限 → gc + 清除已登記的快取（Linux 另以 malloc_trim 把空閒記憶體還給系統）
+各階段（下載 / 清洗 …）記錄 RSS 高峰，寫進效能報告；
+逐任務結果以 JSON lines 串流寫到磁碟（TaskResultLog），不在記憶體裡累積清單
+
+設定（settings["memory_governor"]）：
+    {"enabled": true, "process_limit_mb": 1024, "driver_limit_mb": 1536, "check_every_tasks": 50}
+"""
+
+from __future__ import annotations
+
+import ctypes
+import gc
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from lazy_imports import lazy_import
+
+psutil = lazy_import("psutil")
+
+MB = 1024 * 1024
+DEFAULT_PROCESS_LIMIT_MB = 1024    # 本行程（pandas / 排程器 / 快取）
+DEFAULT_DRIVER_LIMIT_MB = 1536     # ChromeDriver + 所有 Chrome 子行程
+DEFAULT_CHECK_EVERY = 50           # 日期一直沒換時，每幾個任務仍檢查一次
+FAILED_SAMPLE = 10                 # 記憶體中只保留前幾筆失敗任務（完整清單在結果檔）
+
+
+def process_rss_mb() -> float:
+    return psutil.Process().memory_info().rss / MB
+
+
+def tree_rss_mb(pid: Optional[int]) -> float:
+    """指定行程及其所有子行程的 RSS 總和；行程已結束時回傳 0"""
+    if not pid:
+        return 0.0
+    try:
+        root = psutil.Process(pid)
+        processes = [root] + root.children(recursive=True)
+    except psutil.Error:
+        return 0.0
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / MB
+
+
+def driver_pid(driver) -> Optional[int]:
+    """Selenium 啟動的 chromedriver 行程（Chrome 為其子行程）"""
+    process = getattr(getattr(driver, "service", None), "process", None)
+    return getattr(process, "pid", None)
+
+
+def release_free_memory() -> None:
+    """gc 後把 glibc 保留的空閒區塊還給系統（其他平台只做 gc）"""
+    gc.collect()
+    if sys.platform.startswith("linux"):
+        try:
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+class MemoryGovernor:
+    """量測、依門檻處置並記錄各階段高峰"""
+
+    def __init__(self, enabled: bool = True, process_limit_mb: float = DEFAULT_PROCESS_LIMIT_MB,
+                 driver_limit_mb: float = DEFAULT_DRIVER_LIMIT_MB, check_every_tasks: int = DEFAULT_CHECK_EVERY):
+        self.enabled = enabled
+        self.process_limit_mb = process_limit_mb
+        self.driver_limit_mb = driver_limit_mb
+        self.check_every_tasks = max(1, check_every_tasks)
+        self.cache_clearers: List[Callable[[], Any]] = []
+        self.phase_name = "main"
+        self.peaks: Dict[str, Dict[str, float]] = {}
+        self.events: Dict[str, int] = {"checks": 0, "driver_recycles": 0, "cache_clears": 0}
+        self._last_date: Optional[str] = None
+        self._tasks_since_check = 0
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> MemoryGovernor:
+        options = settings.get("memory_governor", {})
+        return cls(enabled=options.get("enabled", True),
+                   process_limit_mb=options.get("process_limit_mb", DEFAULT_PROCESS_LIMIT_MB),
+                   driver_limit_mb=options.get("driver_limit_mb", DEFAULT_DRIVER_LIMIT_MB),
+                   check_every_tasks=options.get("check_every_tasks", DEFAULT_CHECK_EVERY))
+
+    def register_cache(self, clearer: Callable[[], Any]) -> None:
+        """登記超過上限時要清除的快取"""
+        self.cache_clearers.append(clearer)
+
+    # ---- 量測 ----
+    def sample(self, driver=None) -> Dict[str, float]:
+        """量一次並更新目前階段的高峰"""
+        usage = {"process_mb": process_rss_mb(), "driver_mb": tree_rss_mb(driver_pid(driver)) if driver else 0.0}
+        peak = self.peaks.setdefault(self.phase_name, {"process_mb": 0.0, "driver_mb": 0.0, "samples": 0})
+        peak["process_mb"] = max(peak["process_mb"], usage["process_mb"])
+        peak["driver_mb"] = max(peak["driver_mb"], usage["driver_mb"])
+        peak["samples"] += 1
+        return usage
+
+    @contextmanager
+    def phase(self, name: str, driver=None) -> Iterator[None]:
+        """階段開始 / 結束各量一次；階段內的 checkpoint 也會計入高峰"""
+        previous, self.phase_name = self.phase_name, name
+        started = time.time()
+        self.sample(driver)
+        try:
+            yield
+        finally:
+            self.sample(driver)
+            self.peaks[name]["seconds"] = round(self.peaks[name].get("seconds", 0) + time.time() - started, 1)
+            self.phase_name = previous
+
+    # ---- 處置 ----
+    def checkpoint(self, date_str: str, driver=None) -> bool:
+        """
+        每個任務前呼叫；換日期或累積 check_every_tasks 個任務時檢查。
+        回傳 True 表示瀏覽器超過上限，呼叫端應重開 driver
+        """
+        if not self.enabled:
+            return False
+        self._tasks_since_check += 1
+        if date_str == self._last_date and self._tasks_since_check < self.check_every_tasks:
+            return False
+        self._last_date, self._tasks_since_check = date_str, 0
+        self.events["checks"] += 1
+
+        usage = self.sample(driver)
+        logging.debug("[記憶體] %s 本行程 %.0f MB，瀏覽器 %.0f MB", date_str, usage["process_mb"], usage["driver_mb"])
+        if usage["process_mb"] > self.process_limit_mb:
+            self.clear_caches()
+            after = process_rss_mb()
+            logging.info(f"[記憶體] 本行程 {usage['process_mb']:.0f} MB 超過上限 {self.process_limit_mb} MB，"
+                         f"清除快取後 {after:.0f} MB")
+        if driver is not None and usage["driver_mb"] > self.driver_limit_mb:
+            self.events["driver_recycles"] += 1
+            logging.info(f"[記憶體] 瀏覽器 {usage['driver_mb']:.0f} MB 超過上限 {self.driver_limit_mb} MB，重開瀏覽器")
+            return True
+        return False
+
+    def clear_caches(self) -> None:
+        for clearer in self.cache_clearers:
+            try:
+                clearer()
+            except Exception as e:
+                logging.warning(f"[記憶體] 清除快取失敗：{e}")
+        release_free_memory()
+        self.events["cache_clears"] += 1
+
+    def report(self) -> Dict[str, Any]:
+        """寫進效能報告的區段：各階段高峰與處置次數"""
+        phases = {name: {k: round(v, 1) if isinstance(v, float) else v for k, v in peak.items()}
+                  for name, peak in self.peaks.items()}
+        return {"limits_mb": {"process": self.process_limit_mb, "driver": self.driver_limit_mb},
+                "phases": phases, **self.events}
+
+
+class TaskResultLog:
+    """
+    逐任務結果以 JSON lines 附加寫入（每筆寫完即 flush，中斷也不會遺失）；
+    記憶體中只保留計數與前 FAILED_SAMPLE 筆失敗任務
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self.counts: Dict[str, int] = {}
+        self.failed_sample: List[str] = []
+
+    def write(self, key: str, status: str, **fields: Any) -> None:
+        entry = {"ts": datetime.now().isoformat(timespec="seconds"), "task": key, "status": status, **fields}
+        self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+        self.counts[status] = self.counts.get(status, 0) + 1
+        if status == "failed" and len(self.failed_sample) < FAILED_SAMPLE:
+            self.failed_sample.append(key)
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self) -> TaskResultLog:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_results(path: Path, status: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """逐行讀回結果檔（例如只取 failed 重新排程）"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if status is None or entry.get("status") == status:
+                    yield entry
@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OTC Browser - 上櫃下載器的瀏覽器元件
+ChromeDriver 解析一次後依 Chrome 主版本號固定在本機快取（drivers/），
+之後啟動直接使用快取，不連網；離線模式下只使用快取，找不到時明確報錯
+另提供抓取專用的輕量瀏覽器設定（scrape profile）：新版無頭模式（依 headless 設定）、eager 載入、
+以 DevTools 擋下圖片 / 字型 / CSS / 追蹤腳本，並保留小型持久化 user-data 目錄作為快取
+（同一目錄已被其他執行中的程序佔用時改用本程序專用的暫時目錄）
+下載時以 DevTools Network 事件直接取得 CSV 回應內容（NetworkCapture），
+取不到時才退回瀏覽器下載；下載目錄每次執行獨立，平行執行互不干擾
+"""
+
+import atexit
+import base64
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+from urllib.parse import unquote, urlparse
+
+from otc_common import BASE_DIR, DOWNLOAD_DIR, webdriver, Options, Service, psutil
+
+DRIVER_CACHE_DIR = BASE_DIR / "drivers"
+PROFILE_DIR = BASE_DIR / "browser_profiles"
+RUN_DOWNLOAD_DIR = BASE_DIR / "downloads"
+MANIFEST_NAME = "manifest.json"
+DRIVER_BINARY = "chromedriver.exe" if sys.platform.startswith("win") else "chromedriver"
+
+VERSION_PATTERN = re.compile(r"(\d+)\.(\d+)\.(\d+)\.(\d+)")
+
+# 依平台嘗試的 Chrome 執行檔
+CHROME_COMMANDS = {
+    "win": [
+        r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+        r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+    ],
+    "darwin": ["/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"],
+    "linux": ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser"],
+}
+
+
+class DriverResolutionError(RuntimeError):
+    """找不到可用的 ChromeDriver（例如離線模式且快取中沒有對應版本）"""
+
+
+def _registry_chrome_version() -> Optional[str]:
+    """Windows：從登錄檔讀取 Chrome 版本（不需啟動 chrome.exe）"""
+    try:
+        import winreg
+    except ImportError:
+        return None
+    for root in (winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE):
+        try:
+            with winreg.OpenKey(root, r"Software\Google\Chrome\BLBeacon") as key:
+                return winreg.QueryValueEx(key, "version")[0]
+        except OSError:
+            continue
+    return None
+
+
+def detect_chrome_version(chrome_binary: Optional[str] = None) -> Optional[str]:
+    """偵測本機 Chrome 完整版本號，例如 "126.0.6478.126"；偵測不到回傳 None"""
+    if chrome_binary is None and sys.platform.startswith("win"):
+        version = _registry_chrome_version()
+        if version:
+            return version
+
+    platform = "win" if sys.platform.startswith("win") else sys.platform
+    candidates = [chrome_binary] if chrome_binary else CHROME_COMMANDS.get(platform, CHROME_COMMANDS["linux"])
+    for command in candidates:
+        try:
+            output = subprocess.run(
+                [command, "--version"], capture_output=True, text=True, timeout=10
+            ).stdout
+        except (OSError, subprocess.SubprocessError):
+            continue
+        match = VERSION_PATTERN.search(output)
+        if match:
+            return match.group(0)
+    return None
+
+
+def major_version(version: Optional[str]) -> Optional[str]:
+    return version.split(".")[0] if version else None
+
+
+class DriverProvider:
+    """
+    ChromeDriver 提供者
+
+    解析順序：
+    1. CHROMEDRIVER_PATH 環境變數（或 settings["chromedriver_path"]）
+    2. 本機快取中與 Chrome 主版本相符的驅動
+    3. 非離線模式：以 webdriver_manager 下載後複製進快取
+    4. 離線模式：偵測不到 Chrome 版本時使用最近一次使用的快取驅動
+    """
+
+    def __init__(self, cache_dir: Path = DRIVER_CACHE_DIR, offline: bool = False,
+                 explicit_path: Optional[str] = None, chrome_binary: Optional[str] = None):
+        self.cache_dir = Path(cache_dir)
+        self.offline = offline
+        self.explicit_path = explicit_path
+        self.chrome_binary = chrome_binary
+        self._lock = threading.Lock()
+        self._resolved: Optional[str] = None
+        self.metrics: Dict[str, Any] = {}
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> "DriverProvider":
+        """由 config["settings"] 建立；環境變數優先於設定檔"""
+        offline_env = os.environ.get("OTC_DRIVER_OFFLINE", "").lower() in ("1", "true", "yes")
+        return cls(
+            cache_dir=Path(settings.get("driver_cache_dir", DRIVER_CACHE_DIR)),
+            offline=offline_env or settings.get("offline_driver", False),
+            explicit_path=os.environ.get("CHROMEDRIVER_PATH") or settings.get("chromedriver_path"),
+            chrome_binary=os.environ.get("CHROME_BINARY") or settings.get("chrome_binary"),
+        )
+
+    # ===== 快取清單 =====
+    def _manifest_path(self) -> Path:
+        return self.cache_dir / MANIFEST_NAME
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"drivers": {}, "last_used": None}
+
+    def _save_manifest(self, manifest: Dict[str, Any]) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._manifest_path().with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self._manifest_path())
+
+    def cached_path(self, major: str) -> Optional[str]:
+        entry = self._load_manifest()["drivers"].get(major)
+        if entry and os.path.exists(entry["path"]):
+            return entry["path"]
+        return None
+
+    def _pin(self, major: str, source_path: str, chrome_version: Optional[str]) -> str:
+        """把下載的驅動複製到 drivers/<主版本>/，並記錄到清單"""
+        target_dir = self.cache_dir / major
+        target_dir.mkdir(parents=True, exist_ok=True)
+        target = target_dir / DRIVER_BINARY
+        shutil.copy2(source_path, target)
+        os.chmod(target, 0o755)
+        manifest = self._load_manifest()
+        manifest["drivers"][major] = {
+            "path": str(target),
+            "chrome_version": chrome_version,
+            "pinned_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        manifest["last_used"] = major
+        self._save_manifest(manifest)
+        return str(target)
+
+    def _mark_used(self, major: str) -> None:
+        manifest = self._load_manifest()
+        if manifest.get("last_used") != major:
+            manifest["last_used"] = major
+            self._save_manifest(manifest)
+
+    # ===== 解析 =====
+    def resolve(self) -> str:
+        """回傳 ChromeDriver 路徑；同一個 provider 只解析一次"""
+        with self._lock:
+            if self._resolved is None:
+                start_time = time.perf_counter()
+                path, source, chrome_version = self._resolve_uncached()
+                elapsed = time.perf_counter() - start_time
+                self.metrics = {
+                    "path": path,
+                    "source": source,
+                    "chrome_version": chrome_version,
+                    "resolution_seconds": round(elapsed, 3),
+                }
+                logging.info(f"ChromeDriver 解析完成（{source}）: {path}，耗時 {elapsed:.3f} 秒")
+                self._resolved = path
+            return self._resolved
+
+    def _resolve_uncached(self):
+        if self.explicit_path:
+            if not os.path.exists(self.explicit_path):
+                raise DriverResolutionError(f"指定的 ChromeDriver 不存在: {self.explicit_path}")
+            return self.explicit_path, "explicit", None
+
+        chrome_version = detect_chrome_version(self.chrome_binary)
+        major = major_version(chrome_version)
+
+        if major:
+            cached = self.cached_path(major)
+            if cached:
+                self._mark_used(major)
+                return cached, "cache", chrome_version
+
+        if self.offline:
+            # 偵測不到 Chrome 版本時，離線模式退回最近一次使用的驅動
+            manifest = self._load_manifest()
+            last_used = manifest.get("last_used")
+            if major is None and last_used and self.cached_path(last_used):
+                logging.warning(f"無法偵測 Chrome 版本，離線模式使用最近一次的驅動（Chrome {last_used}）")
+                return self.cached_path(last_used), "cache", chrome_version
+            raise DriverResolutionError(
+                f"離線模式下快取中沒有 Chrome {major or '（未知版本）'} 的 ChromeDriver，"
+                f"請先在可連網的環境執行一次，或設定 CHROMEDRIVER_PATH"
+            )
+
+        from webdriver_manager.chrome import ChromeDriverManager
+        downloaded = ChromeDriverManager().install()
+        if major is None:
+            # 無法得知 Chrome 版本時不固定到快取，避免日後誤用
+            return downloaded, "download", chrome_version
+        return self._pin(major, downloaded, chrome_version), "download", chrome_version
+
+
+_providers: Dict[str, DriverProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_driver_provider(settings: Optional[Dict[str, Any]] = None) -> DriverProvider:
+    """取得程序內共用的 DriverProvider（重建或回收瀏覽器時不再重新解析）"""
+    provider = DriverProvider.from_settings(settings or {})
+    key = f"{provider.cache_dir}|{provider.offline}|{provider.explicit_path}|{provider.chrome_binary}"
+    with _providers_lock:
+        if key not in _providers:
+            _providers[key] = provider
+        return _providers[key]
+
+
+def resolve_chromedriver(settings: Optional[Dict[str, Any]] = None) -> str:
+    """取得 ChromeDriver 路徑"""
+    return get_driver_provider(settings).resolve()
+
+
+# ===== 抓取專用瀏覽器設定 =====
+SCRAPE_PROFILE = "scrape"
+
+# 以 Network.setBlockedURLs 擋下的資源（頁面上的表格與 CSV 按鈕不需要這些）
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*hotjar.com*",
+]
+BLOCKED_CSS_PATTERNS = ["*.css"]
+
+PROFILE_DISK_CACHE_BYTES = 50 * 1024 * 1024   # 持久化快取上限，避免 profile 目錄無限成長
+PROFILE_OWNER_FILE = ".owner_pid"                 # 記錄目前使用持久化 profile 的程序
+
+
+def blocked_url_patterns(settings: Dict[str, Any]) -> List[str]:
+    """依設定組合要擋下的資源；block_css=False 時保留樣式表（版面相依的頁面）"""
+    patterns = list(BLOCKED_URL_PATTERNS)
+    if settings.get("block_css", True):
+        patterns += BLOCKED_CSS_PATTERNS
+    patterns += settings.get("extra_blocked_urls", [])
+    return patterns
+
+
+def _release_profile(owner_file: Path) -> None:
+    try:
+        if owner_file.read_text().strip() == str(os.getpid()):
+            owner_file.unlink()
+    except OSError:
+        pass
+
+
+def _try_own(owner_file: Path) -> bool:
+    """以 O_EXCL 建立擁有者檔；已存在但擁有者已結束時接手"""
+    pid = os.getpid()
+    for _ in range(2):
+        try:
+            fd = os.open(owner_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                owner = int(owner_file.read_text().strip())
+            except (OSError, ValueError):
+                owner = None
+            if owner == pid:
+                return True
+            if owner is not None and psutil.pid_exists(owner):
+                return False
+            try:
+                owner_file.unlink()     # 前一個擁有者已結束（或當機）
+            except OSError:
+                return False
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(str(pid))
+        atexit.register(_release_profile, owner_file)
+        return True
+    return False
+
+
+def claim_profile_dir(base_dir: Path, profile_name: str) -> Path:
+    """
+    取得 user-data 目錄：Chrome 會鎖定 user-data-dir，不能多個程序共用。
+    入口程式的持久化目錄（browser_profiles/<入口>）沒有其他執行中的程序使用時由本程序佔用；
+    已被佔用時（例如 daemon 與排程的 daily 同時執行、gap_planner 修補與回補同時執行）
+    改用本程序專用的暫時目錄（<入口>_<pid>），程式結束時刪除
+    """
+    persistent = base_dir / profile_name
+    persistent.mkdir(parents=True, exist_ok=True)
+    if _try_own(persistent / PROFILE_OWNER_FILE):
+        return persistent
+
+    # 清掉已結束程序留下的暫時目錄（當機時 atexit 不會執行）
+    for stale in base_dir.glob(f"{profile_name}_*"):
+        suffix = stale.name[len(profile_name) + 1:]
+        if suffix.isdigit() and not psutil.pid_exists(int(suffix)):
+            shutil.rmtree(stale, ignore_errors=True)
+
+    private = base_dir / f"{profile_name}_{os.getpid()}"
+    if not private.exists():
+        private.mkdir(parents=True)
+        atexit.register(shutil.rmtree, private, True)
+    logging.info(f"profile {profile_name} 已被其他程序使用，改用暫時目錄 {private.name}")
+    return private
+
+
+def build_scrape_options(settings: Dict[str, Any], profile_name: str,
+                         download_dir: Path = DOWNLOAD_DIR) -> "Options":
+    """建立抓取專用的 ChromeOptions"""
+    options = Options()
+    options.page_load_strategy = "eager"   # DOMContentLoaded 即返回，不等圖片與追蹤腳本
+    options.add_experimental_option("prefs", {
+        "download.default_directory": str(download_dir),
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True,
+        "profile.default_content_setting_values": {
+            "images": 2, "plugins": 2, "popups": 2, "geolocation": 2,
+            "notifications": 2, "media_stream": 2,
+        },
+    })
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option("useAutomationExtension", False)
+    if settings.get("network_capture", True):
+        enable_network_capture(options)
+
+    user_data_dir = claim_profile_dir(Path(settings.get("profile_dir", PROFILE_DIR)), profile_name)
+    if settings.get("headless", True):
+        options.add_argument("--headless=new")
+
+    for arg in (
+        f"--user-data-dir={user_data_dir}",
+        f"--disk-cache-size={PROFILE_DISK_CACHE_BYTES}",
+        "--window-size=1280,900",
+        "--no-sandbox",
+        "--disable-dev-shm-usage",
+        "--disable-gpu",
+        "--disable-extensions",
+        "--disable-notifications",
+        "--disable-popup-blocking",
+        "--disable-blink-features=AutomationControlled",
+        "--blink-settings=imagesEnabled=false",
+        "--disable-background-networking",
+        "--disable-component-update",
+        "--disable-default-apps",
+        "--disable-sync",
+        "--no-first-run",
+        "--mute-audio",
+        "--disable-features=Translate,MediaRouter,OptimizationHints",
+        "--renderer-process-limit=2",
+    ):
+        options.add_argument(arg)
+
+    if "user_agent" in settings:
+        options.add_argument(f"--user-agent={settings['user_agent']}")
+    return options
+
+
+def apply_request_blocking(driver, patterns: List[str]) -> None:
+    """透過 DevTools Network 網域擋下資源請求"""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+
+
+def create_scrape_driver(settings: Dict[str, Any], profile_name: str,
+                         download_dir: Path = DOWNLOAD_DIR):
+    """
+    建立抓取專用的 Chrome WebDriver
+    settings["browser_profile"] == "scrape" 時由各下載器的 setup_chrome_driver 呼叫
+    """
+    options = build_scrape_options(settings, profile_name, download_dir)
+    provider = get_driver_provider(settings)
+    service = Service(provider.resolve())
+
+    start_time = time.perf_counter()
+    driver = webdriver.Chrome(service=service, options=options)
+    apply_request_blocking(driver, blocked_url_patterns(settings))
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+        "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+    })
+    driver.implicitly_wait(settings.get("implicit_wait", 8))
+    driver.set_page_load_timeout(settings.get("page_load_timeout", 15))
+    logging.info(f"Chrome WebDriver 初始化成功（scrape profile: {profile_name}，"
+                 f"啟動 {time.perf_counter() - start_time:.2f} 秒）")
+    return driver
+
+
+# ===== 下載：DevTools 擷取 + 每次執行獨立的下載目錄 =====
+CSV_MIME_TYPES = ("text/csv", "application/csv", "application/vnd.ms-excel", "application/octet-stream")
+BODY_GRACE_SECONDS = 2.0    # 收到回應標頭後等待 loadingFinished 的時間，逾時直接嘗試取內容
+
+
+def run_download_dir(profile_name: str) -> Path:
+    """本次執行專用的下載目錄（downloads/<入口>_<pid>），避免平行執行互相搶檔"""
+    path = RUN_DOWNLOAD_DIR / f"{profile_name}_{os.getpid()}"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def clear_download_dir(path: Path) -> None:
+    """點擊下載前清空本次執行的下載目錄，確保等到的是這次的檔案"""
+    for leftover in path.iterdir():
+        if leftover.is_file():
+            leftover.unlink()
+
+
+def enable_network_capture(options) -> None:
+    """開啟 performance log，讓 NetworkCapture 可讀取 Network / Page 事件"""
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+
+def filename_from_response(response: Dict[str, Any]) -> str:
+    """由 Content-Disposition 或網址取得檔名"""
+    headers = {k.lower(): v for k, v in response.get("headers", {}).items()}
+    disposition = headers.get("content-disposition", "")
+    match = re.search(r"filename\*=(?:UTF-8'')?([^;]+)", disposition, re.IGNORECASE)
+    if not match:
+        match = re.search(r'filename="?([^";]+)"?', disposition, re.IGNORECASE)
+    if match:
+        return os.path.basename(unquote(match.group(1).strip()))
+    name = os.path.basename(urlparse(response.get("url", "")).path) or "download"
+    return name if name.lower().endswith(".csv") else f"{name}.csv"
+
+
+class CapturedFile:
+    """從 DevTools 取得的 CSV 回應"""
+
+    def __init__(self, url: str, filename: str, body: bytes):
+        self.url = url
+        self.filename = filename
+        self.body = body
+
+    def __repr__(self) -> str:
+        return f"CapturedFile({self.filename}, {len(self.body)} bytes)"
+
+
+class NetworkCapture:
+    """
+    監聽既有 driver 的 DevTools Network 事件，直接取出頁面發出的 CSV 請求回應
+    需在建立 driver 時呼叫 enable_network_capture(options)
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.enabled = True
+        self.download_started = False   # 回應被瀏覽器轉為下載（取不到 body），需退回等待下載檔
+        self.stats = {"captured": 0, "fallback": 0}
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        """讀出累積的 performance log；driver 未開啟 performance log 時停用擷取"""
+        if not self.enabled:
+            return []
+        try:
+            return self.driver.get_log("performance")
+        except Exception as e:
+            logging.warning(f"無法讀取 performance log，停用 DevTools 擷取：{e}")
+            self.enabled = False
+            return []
+
+    def reset(self) -> None:
+        """清掉點擊前累積的事件"""
+        self._drain()
+        self.download_started = False
+
+    @staticmethod
+    def _is_csv(response: Dict[str, Any]) -> bool:
+        headers = {k.lower(): v for k, v in response.get("headers", {}).items()}
+        mime = response.get("mimeType", "").lower()
+        url = response.get("url", "").lower()
+        return (
+            mime in CSV_MIME_TYPES
+            or ".csv" in headers.get("content-disposition", "").lower()
+            or "response=csv" in url
+            or url.split("?")[0].endswith(".csv")
+        )
+
+    @staticmethod
+    def _charset(response: Dict[str, Any]) -> Optional[str]:
+        """回應標頭宣告的字元集（Content-Type: text/csv; charset=...）"""
+        headers = {k.lower(): v for k, v in response.get("headers", {}).items()}
+        match = re.search(r"charset=[\"']?([\w.:-]+)", headers.get("content-type", ""), re.IGNORECASE)
+        return match.group(1) if match else None
+
+    def _body(self, request_id: str, charset: Optional[str]) -> Optional[bytes]:
+        """
+        取回應原始位元組。二進位回應（base64）原樣還原；
+        文字回應已被 Chrome 解碼，只有宣告了字元集時才能以同一字元集還原成原始位元組，
+        否則回傳 None 退回瀏覽器下載，確保存下的原始檔與網站回應一致
+        """
+        try:
+            result = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+        except Exception as e:
+            logging.debug(f"    無法取得回應內容（{request_id}）：{e}")
+            return None
+        body = result.get("body", "")
+        if result.get("base64Encoded"):
+            return base64.b64decode(body)
+        if not charset:
+            logging.debug(f"    文字回應未宣告字元集（{request_id}），改用瀏覽器下載")
+            return None
+        try:
+            return body.encode(charset)
+        except (LookupError, UnicodeEncodeError) as e:
+            logging.debug(f"    無法以 {charset} 還原回應內容（{request_id}）：{e}")
+            return None
+
+    def wait_for_csv(self, timeout: float) -> Optional[CapturedFile]:
+        """
+        等待點擊後出現的 CSV 回應並取出內容
+        回傳 None 時 download_started 表示回應已交給瀏覽器下載，應退回 wait_for_download
+        """
+        deadline = time.time() + timeout
+        pending: Dict[str, Dict[str, Any]] = {}
+        while self.enabled and time.time() < deadline:
+            for entry in self._drain():
+                message = json.loads(entry["message"])["message"]
+                method = message.get("method")
+                params = message.get("params", {})
+                request_id = params.get("requestId")
+
+                if method == "Network.responseReceived" and self._is_csv(params.get("response", {})):
+                    pending[request_id] = {
+                        "url": params["response"].get("url", ""),
+                        "filename": filename_from_response(params["response"]),
+                        "charset": self._charset(params["response"]),
+                        "seen": time.time(),
+                    }
+                elif method == "Network.loadingFinished" and request_id in pending:
+                    pending[request_id]["finished"] = True
+                elif method == "Network.loadingFailed" and request_id in pending:
+                    pending.pop(request_id)
+                    self.download_started = True
+                elif method in ("Page.downloadWillBegin", "Browser.downloadWillBegin"):
+                    self.download_started = True
+
+            for request_id, info in list(pending.items()):
+                if not info.get("finished") and time.time() - info["seen"] < BODY_GRACE_SECONDS:
+                    continue
+                body = self._body(request_id, info["charset"])
+                pending.pop(request_id)
+                if body:
+                    self.stats["captured"] += 1
+                    logging.info(f"    [📡] 擷取 CSV 回應：{info['filename']}（{len(body)} bytes）")
+                    return CapturedFile(info["url"], info["filename"], body)
+                self.download_started = True
+
+            if self.download_started and not pending:
+                break
+            time.sleep(0.2)
+
+        if not self.enabled:
+            self.download_started = True
+        self.stats["fallback"] += 1
+        return None
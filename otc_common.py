@@ -0,0 +1,1091 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OTC Common - 上櫃每日更新與歷史批量下載共用元件
+目錄設定、日誌、效能監控、資料驗證、清洗器與設定檔載入集中於此；
+pandas / selenium / psutil / holidays 皆延遲載入，只清洗或只驗證時不會載入 Selenium
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterable
+
+from endpoints import rebase_download_items
+from lazy_imports import lazy_import, lazy_attr
+from raw_catalog import get_catalog, parse_filename
+from structured_logging import setup_structured_logging, span, structured_enabled
+
+pd = lazy_import("pandas")
+psutil = lazy_import("psutil")
+holidays = lazy_import("holidays")
+
+# Selenium 只在實際建立瀏覽器時載入
+webdriver = lazy_import("selenium.webdriver")
+EC = lazy_import("selenium.webdriver.support.expected_conditions")
+By = lazy_attr("selenium.webdriver.common.by", "By")
+WebDriverWait = lazy_attr("selenium.webdriver.support.ui", "WebDriverWait")
+Select = lazy_attr("selenium.webdriver.support.ui", "Select")
+Options = lazy_attr("selenium.webdriver.chrome.options", "Options")
+Service = lazy_attr("selenium.webdriver.chrome.service", "Service")
+
+# ===== 目錄設定 =====
+BASE_DIR = Path(__file__).parent
+RAW_DIR = BASE_DIR / "otc_raw"
+DOWNLOAD_DIR = Path.home() / "Downloads"
+CLEAN_DIR = BASE_DIR / "otc_cleaned"
+LOG_DIR = BASE_DIR / "logs"
+CONFIG_FILE = BASE_DIR / "otc_config.json"
+
+def setup_logging(log_filename: str, structured: Optional[bool] = None):
+    """
+    設定日誌系統（檔案 + 控制台）。
+    structured=True（或環境變數 SLA_LOG_JSON=1）時改為 JSON lines（.jsonl）+ 背景佇列輸出，
+    見 structured_logging
+    """
+    LOG_DIR.mkdir(exist_ok=True)
+    if structured is None:
+        structured = structured_enabled()
+    if structured:
+        setup_structured_logging(LOG_DIR / Path(log_filename).with_suffix(".jsonl").name)
+        return
+    
+    formatter = logging.Formatter(
+        '%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    
+    file_handler = logging.FileHandler(LOG_DIR / log_filename, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+    
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    logger.addHandler(console_handler)
+
+class PerformanceMonitor:
+    """效能監控器"""
+    
+    def __init__(self):
+        self.metrics = {}
+    
+    @contextmanager
+    def measure_time(self, operation_name: str):
+        """測量操作時間的上下文管理器"""
+        start_time = time.time()
+        start_memory = psutil.virtual_memory().used / 1024 / 1024  # MB
+        
+        try:
+            yield
+        finally:
+            end_time = time.time()
+            end_memory = psutil.virtual_memory().used / 1024 / 1024  # MB
+            duration = end_time - start_time
+            memory_diff = end_memory - start_memory
+            
+            self.metrics[operation_name] = {
+                "duration_seconds": round(duration, 2),
+                "memory_change_mb": round(memory_diff, 2),
+                "timestamp": datetime.now().isoformat()
+            }
+            logging.info(f"{operation_name} 完成 - 耗時: {duration:.2f}秒, 記憶體變化: {memory_diff:+.2f}MB")
+    
+    def get_summary(self) -> Dict[str, Any]:
+        """取得效能摘要"""
+        if not self.metrics:
+            return {"message": "無效能資料"}
+        total_time = sum(m["duration_seconds"] for m in self.metrics.values())
+        return {
+            "total_operations": len(self.metrics),
+            "total_duration_seconds": round(total_time, 2),
+            "operations": self.metrics
+        }
+    
+    def save_report(self, filepath: Path, extra: Optional[Dict[str, Any]] = None):
+        """儲存效能報告；extra 為額外區段（例如 ChromeDriver 解析指標）"""
+        report = {
+            "timestamp": datetime.now().isoformat(),
+            "summary": self.get_summary(),
+            "system_info": {
+                "cpu_percent": psutil.cpu_percent(),
+                "memory_percent": psutil.virtual_memory().percent
+            }
+        }
+        report.update(extra or {})
+        
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+class DataValidator:
+    """資料驗證器"""
+    
+    def validate_dataframe(self, df: pd.DataFrame, file_type: str) -> Dict[str, Any]:
+        """驗證整個資料框"""
+        results = {
+            "is_valid": True,
+            "errors": [],
+            "warnings": [],
+            "statistics": {}
+        }
+        
+        results["statistics"] = {
+            "total_rows": len(df),
+            "total_columns": len(df.columns),
+            "null_counts": df.isnull().sum().to_dict(),
+            "unique_stocks": df['stock_id'].nunique() if 'stock_id' in df.columns else 0
+        }
+        
+        # 股票代號驗證
+        if 'stock_id' in df.columns:
+            invalid_stock_ids = df[~df['stock_id'].str.match(r'^\d{4}$', na=False)]
+            if not invalid_stock_ids.empty:
+                results["errors"].append({
+                    "type": "invalid_stock_id",
+                    "count": len(invalid_stock_ids),
+                    "samples": invalid_stock_ids['stock_id'].head(5).tolist()
+                })
+                results["is_valid"] = False
+        
+        # 重複資料檢查
+        if 'stock_id' in df.columns:
+            duplicates = df[df.duplicated(subset=['stock_id'])]
+            if not duplicates.empty:
+                results["warnings"].append({
+                    "type": "duplicate_stock_id",
+                    "count": len(duplicates),
+                    "description": "發現重複的股票代號"
+                })
+        
+        return results
+
+class OTCDataCleaner:
+    """OTC資料清洗器類別（每日更新與歷史批量共用）"""
+    
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.download_items = config.get("download_items", {})
+        self.validator = DataValidator()
+        self.performance_monitor = PerformanceMonitor()
+    
+    def ensure_dir(self, path: Path) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+    
+    def read_csv_with_encoding(self, file_path: Path, skiprows: int = 0) -> Optional[pd.DataFrame]:
+        encodings = ["cp950", "big5", "utf-8-sig", "utf-8", "gb2312", "gbk", "gb18030"]
+        for encoding in encodings:
+            try:
+                df = pd.read_csv(file_path, encoding=encoding, skiprows=skiprows,
+                                 dtype=object, low_memory=False, thousands=',')
+                logging.debug("成功使用 %s 編碼讀取 %s，skiprows=%d", encoding, file_path.name, skiprows)
+                if df is not None and len(df.columns) > 0:
+                    first_col = str(df.columns[0]).replace(',', '').replace('.', '')
+                    if first_col.isdigit() and skiprows > 0:
+                        logging.debug("偵測到欄位名稱異常（%s），嘗試 skiprows=%d", df.columns[0], skiprows - 1)
+                        return self.read_csv_with_encoding(file_path, skiprows - 1)
+                return df
+            except Exception as e:
+                logging.debug("使用 %s 編碼讀取失敗（skiprows=%d）：%s", encoding, skiprows, e)
+                continue
+        logging.error(f"無法讀取檔案 {file_path.name}，skiprows={skiprows}")
+        return None
+    
+    def get_file_type_and_config(self, filename: str) -> tuple:
+        """根據檔案名稱判斷類型和跳過行數"""
+        filename_lower = filename.lower()
+        
+        # 歷史批量下載的命名：YYYYMMDD_項目.csv，跳過行數取自設定
+        parsed = parse_filename(filename)
+        if parsed and parsed[1] in self.download_items:
+            config_key = parsed[1]
+            return config_key, self.download_items[config_key].get("skiprows", 0)
+        
+        file_patterns = {
+            "daily_close_no1430": ("daily_close_no1430", 3),
+            "bigd_": ("institutional_detail", 1),
+            "brktop1_": ("sec_trading", 2),
+            "daytraderpt_": ("day_trading", 5),
+            "margratio_": ("highlight", 2),
+            "owz66u_": ("sbl", 2),
+            "rsta3106_": ("margin_transactions", 2),
+            "margmark_": ("exempted", 1)
+        }
+        for pattern, (config_key, skiprows) in file_patterns.items():
+            if pattern in filename_lower:
+                logging.debug("  檔案 %s 匹配模式 %s，類型=%s，跳過行數=%d", filename, pattern, config_key, skiprows)
+                return config_key, skiprows
+        
+        if filename_lower.startswith("sit_"):
+            if "_buy" in filename_lower:
+                return "investment_trust_buy", 1
+            elif "_sell" in filename_lower:
+                return "investment_trust_sell", 1
+        
+        return None, 0
+    
+    def clean_numeric_column(self, series: pd.Series) -> pd.Series:
+        cleaned = series.astype(str).str.replace(",", "").str.strip()
+        cleaned = cleaned.replace(["--", "---", "----", "　", ""], "0")
+        numeric_values = pd.to_numeric(cleaned, errors="coerce").fillna(0)
+        
+        result = []
+        for val in numeric_values:
+            if pd.isna(val):
+                result.append(0)
+            elif val == int(val):
+                result.append(int(val))
+            else:
+                result.append(float(val))
+        
+        return pd.Series(result, index=series.index)
+    
+    def extract_stock_id(self, series: pd.Series) -> pd.Series:
+        """提取4位數股票代號，排除含字母的代號"""
+        def extract_4_digits(code_str):
+            if pd.isna(code_str):
+                return None
+            code_str = str(code_str).strip()
+            
+            if code_str.isdigit():
+                if len(code_str) < 3:
+                    return None
+                elif len(code_str) == 3:
+                    return code_str.zfill(4)
+                elif len(code_str) == 4:
+                    return code_str
+                else:
+                    return None
+            
+            if any('\u4e00' <= char <= '\u9fff' for char in code_str):
+                return None
+            
+            if re.search(r'[A-Za-z]', code_str):
+                return None
+            
+            match = re.match(r'^(\d{3,4})', code_str)
+            if match:
+                digits = match.group(1)
+                if len(digits) == 3:
+                    return digits.zfill(4)
+                elif len(digits) == 4:
+                    return digits
+            
+            return None
+        
+        return series.apply(extract_4_digits)
+    
+    def get_all_raw_files_by_date(self) -> Dict[str, List[Path]]:
+        """取得所有原始檔案，按日期分組（查詢原始檔目錄索引）"""
+        if not RAW_DIR.exists():
+            return {}
+        
+        return {
+            date_str: [Path(p) for p in paths]
+            for date_str, paths in get_catalog(RAW_DIR).files_by_date().items()
+        }
+    
+    def clean_single_file(self, file_path: Path) -> bool:
+        """清洗單一檔案 - 保持原有清洗邏輯"""
+        cleaned = self.clean_to_frame(file_path)
+        if cleaned is None:
+            return False
+        try:
+            self.write_clean_file(cleaned[1], file_path.name)
+            return True
+        except Exception as e:
+            logging.error(f"    [❌] 寫出失敗：{e}")
+            return False
+    
+    def clean_to_frame(self, file_path: Path) -> Optional[tuple]:
+        """清洗單一檔案但不寫出，回傳 (檔案類型, 清洗後資料)；失敗回傳 None"""
+        parsed = parse_filename(file_path.name)
+        with span("clean", file=file_path.name, date=parsed[0] if parsed else None) as fields:
+            cleaned = self._clean_to_frame(file_path)
+            fields["status"] = "ok" if cleaned is not None else "failed"
+            if cleaned is not None:
+                fields["source"], fields["rows"] = cleaned[0], len(cleaned[1])
+            return cleaned
+    
+    def _clean_to_frame(self, file_path: Path) -> Optional[tuple]:
+        filename = file_path.name
+        logging.info("  處理：%s", filename)
+        
+        file_type, skiprows = self.get_file_type_and_config(filename)
+        skiprows = max(skiprows, 0)
+        if file_type is None:
+            logging.warning("    [❌] 未匹配清洗規則，跳過")
+            return None
+        
+        df = self.read_csv_with_encoding(file_path, skiprows)
+        if df is None:
+            return None
+        
+        df.columns = df.columns.str.strip()
+        df = df.dropna(axis=1, how="all").dropna(axis=0, how="all")
+        if len(df) == 0:
+            logging.warning(f"    [❌] 檔案 {filename} 清理後無資料")
+            return None
+        
+        try:
+            clean_df = self._clean_by_type(df, file_type, filename)
+            if clean_df is None or len(clean_df) == 0:
+                logging.error(f"    [❌] 檔案 {filename} 清理失敗")
+                return None
+            
+            # 最終過濾：只保留純4位數且 >=1000 的股票代號
+            if 'stock_id' in clean_df.columns:
+                clean_df = clean_df[
+                    (clean_df['stock_id'].str.len() == 4) &
+                    (clean_df['stock_id'].str.isdigit()) &
+                    (clean_df['stock_id'].astype(int) >= 1000)
+                ]
+            
+            validation_result = self.validator.validate_dataframe(clean_df, file_type)
+            if not validation_result["is_valid"]:
+                logging.warning(f"    [⚠️] 資料驗證發現問題：{validation_result['errors']}")
+            return file_type, clean_df
+            
+        except Exception as e:
+            logging.error(f"    [❌] 清洗失敗：{e}")
+            logging.error(traceback.format_exc())
+            return None
+    
+    def write_clean_file(self, clean_df: pd.DataFrame, filename: str) -> None:
+        """輸出到 otc_cleaned 目錄，保持原檔名"""
+        output_path = CLEAN_DIR / filename
+        with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+            float_format = lambda x: '{:.0f}'.format(x) if isinstance(x, (int, float)) and x == int(x) else '{:.2f}'.format(x) if isinstance(x, float) else str(x)
+            clean_df.to_csv(f, index=False, float_format=float_format)
+        logging.info("    [✅] 清洗完成: %s (%d 行)", filename, len(clean_df), extra={"stage": "clean"})
+    
+    def _clean_by_type(self, df: pd.DataFrame, file_type: str, filename: str) -> Optional[pd.DataFrame]:
+        """根據檔案類型選擇清洗方法 - 保持原有邏輯"""
+        if file_type == "daily_close_no1430" or "daily_close_no1430" in filename.lower():
+            return self._clean_daily_close(df)
+        elif file_type == "institutional_detail" or "bigd_" in filename.lower():
+            return self._clean_institutional_detail(df)
+        elif file_type == "sec_trading" or "brktop1_" in filename.lower():
+            return self._clean_sec_trading(df)
+        elif file_type == "day_trading" or "daytraderpt_" in filename.lower():
+            return self._clean_day_trading(df)
+        elif file_type == "highlight" or "margratio_" in filename.lower():
+            return self._clean_highlight(df)
+        elif file_type == "sbl" or "owz66u_" in filename.lower():
+            return self._clean_sbl(df)
+        elif file_type == "margin_transactions" or "rsta3106_" in filename.lower():
+            return self._clean_margin_transactions(df)
+        elif file_type == "exempted" or "margmark_" in filename.lower():
+            return self._clean_exempted(df)
+        elif "investment_trust" in file_type or filename.lower().startswith("sit_"):
+            return self._clean_investment_trust(df)
+        else:
+            logging.warning(f"  未知檔案類型：{file_type}")
+            return None
+    
+    def _clean_daily_close(self, df: pd.DataFrame) -> pd.DataFrame:
+        """清洗每日收盤行情資料"""
+        cols = list(df.columns)
+        
+        if len(cols) > 0 and str(cols[0]).replace(',', '').replace('.', '').isdigit():
+            logging.error(f"  欄位識別異常，第一欄為數字：{cols[0]}")
+            return None
+        
+        code_col = next((c for c in cols if "代號" in c or "代碼" in c), None)
+        name_col = next((c for c in cols if "名稱" in c), None)
+        close_col = next((c for c in cols if "收盤" in c and "收盤" == c[:2]), None)
+        
+        if not all([code_col, name_col, close_col]):
+            logging.error("  缺少必要欄位")
+            return None
+        
+        column_mapping = {
+            code_col: "stock_id",
+            name_col: "name",
+            close_col: "close"
+        }
+        
+        optional_fields = {
+            "漲跌": "change", "開盤": "open", "最高": "high", "最低": "low",
+            "均價": "avg_price", "成交股數": "volume", "成交金額": "amount",
+            "成交筆數": "trades", "最後買價": "last_bid_price", "最後買量": "last_bid_vol",
+            "最後賣價": "last_ask_price", "最後賣量": "last_ask_vol", "發行股數": "issued_shares",
+            "次日參考價": "next_ref_price", "次日漲停價": "next_up_limit", "次日跌停價": "next_down_limit"
+        }
+        
+        for pattern, new_name in optional_fields.items():
+            matching_col = next((c for c in cols if pattern in c), None)
+            if matching_col:
+                column_mapping[matching_col] = new_name
+        
+        available_cols = [col for col in column_mapping.keys() if col in df.columns]
+        clean_df = df[available_cols].rename(columns=column_mapping).copy()
+        
+        clean_df["stock_id"] = self.extract_stock_id(clean_df["stock_id"])
+        clean_df = clean_df.dropna(subset=["stock_id"])
+        clean_df = clean_df[clean_df["stock_id"].str.match(r'^\d{4}$', na=False)]
+        
+        numeric_cols = [col for col in clean_df.columns if col not in ["stock_id", "name"]]
+        for col in numeric_cols:
+            clean_df[col] = self.clean_numeric_column(clean_df[col])
+        
+        return clean_df.sort_values("stock_id").reset_index(drop=True)
+    
+    def _clean_institutional_detail(self, df: pd.DataFrame) -> pd.DataFrame:
+        """清洗三大法人買賣明細資料"""
+        cols = list(df.columns)
+        
+        code_col = next((c for c in cols if "代號" in c or "代碼" in c), None)
+        name_col = next((c for c in cols if "名稱" in c), None)
+        
+        if not all([code_col, name_col]):
+            logging.error("  缺少必要欄位")
+            return None
+        
+        column_mapping = {
+            code_col: "stock_id",
+            name_col: "name"
+        }
+        
+        institutional_fields = {
+            "外資及陸資": "ii_foreign_net",
+            "外資自營商": "ii_foreign_self_net",
+            "投信": "ii_trust_net",
+            "自營商(自行買賣)": "ii_dealer_self_net",
+            "自營商(避險)": "ii_dealer_hedge_net",
+            "合計": "ii_total_net"
+        }
+        
+        for pattern, new_name in institutional_fields.items():
+            matching_col = next((c for c in cols if pattern in c and "買賣超" in c), None)
+            if matching_col:
+                column_mapping[matching_col] = new_name
+        
+        available_cols = [col for col in column_mapping.keys() if col in df.columns]
+        clean_df = df[available_cols].rename(columns=column_mapping).copy()
+        
+        clean_df["stock_id"] = self.extract_stock_id(clean_df["stock_id"])
+        clean_df = clean_df.dropna(subset=["stock_id"])
+        clean_df = clean_df[clean_df["stock_id"].str.match(r'^\d{4}$', na=False)]
+        
+        numeric_cols = [col for col in clean_df.columns if col not in ["stock_id", "name"]]
+        for col in numeric_cols:
+            clean_df[col] = self.clean_numeric_column(clean_df[col])
+        
+        return clean_df.sort_values("stock_id").reset_index(drop=True)
+    
+    def _clean_sec_trading(self, df: pd.DataFrame) -> pd.DataFrame:
+        """清洗券商營業額統計資料"""
+        cols = list(df.columns)
+        
+        if len(cols) < 5:
+            logging.error("  欄位數量不足")
+            return None
+        
+        left_cols = cols[:5]
+        column_mapping = {
+            left_cols[0]: "rank",
+            left_cols[1]: "prev_rank",
+            left_cols[2]: "broker",
+            left_cols[3]: "name",
+            left_cols[4]: "amount_thousands"
+        }
+        
+        clean_df = df[left_cols].rename(columns=column_mapping).copy()
+        
+        numeric_cols = ["rank", "prev_rank", "amount_thousands"]
+        for col in numeric_cols:
+            if col in clean_df.columns:
+                clean_df[col] = self.clean_numeric_column(clean_df[col])
+        
+        return clean_df.sort_values("broker").reset_index(drop=True)
+    
+    def _clean_day_trading(self, df: pd.DataFrame) -> pd.DataFrame:
+        """清洗現股當沖交易統計資料"""
+        cols = list(df.columns)
+        
+        # 過濾統計行
+        if len(df) > 0:
+            first_col = df.iloc[:, 0].astype(str)
+            mask = ~first_col.str.contains('共計|合計|總計|統計|說明|註[：:]', na=False, regex=True)
+            df = df[mask].copy()
+        
+        code_col = None
+        name_col = None
+        
+        for pattern in ["證券代號", "代號", "股票代號", "代碼"]:
+            for c in cols:
+                if pattern in c:
+                    code_col = c
+                    break
+            if code_col:
+                break
+        
+        for pattern in ["證券名稱", "名稱", "股票名稱"]:
+            for c in cols:
+                if pattern in c:
+                    name_col = c
+                    break
+            if name_col:
+                break
+        
+        if not code_col and len(cols) >= 2:
+            if df.iloc[0, 0] and str(df.iloc[0, 0]).strip().replace(' ', ''):
+                if any(char.isdigit() for char in str(df.iloc[0, 0])):
+                    code_col = cols[0]
+                    name_col = cols[1] if len(cols) > 1 else None
+        
+        if not code_col:
+            logging.error(f"  無法識別證券代號欄位，欄位列表：{cols}")
+            return None
+        
+        column_mapping = {code_col: "stock_id"}
+        if name_col:
+            column_mapping[name_col] = "name"
+        
+        dt_fields = {
+            "暫停": "flag",
+            "成交股數": "dt_volume",
+            "買進成交金額": "dt_buy_amount",
+            "賣出成交金額": "dt_sell_amount",
+            "買賣總額": "dt_total_amount",
+            "當沖率": "dt_rate"
+        }
+        
+        for pattern, new_name in dt_fields.items():
+            matching_col = next((c for c in cols if pattern in c), None)
+            if matching_col:
+                column_mapping[matching_col] = new_name
+        
+        available_cols = [col for col in column_mapping.keys() if col in df.columns]
+        clean_df = df[available_cols].rename(columns=column_mapping).copy()
+        
+        clean_df["stock_id"] = self.extract_stock_id(clean_df["stock_id"])
+        clean_df = clean_df.dropna(subset=["stock_id"])
+        clean_df = clean_df[clean_df["stock_id"].str.match(r'^\d{4}$', na=False)]
+        
+        numeric_cols = [col for col in clean_df.columns if col not in ["stock_id", "name", "flag"]]
+        for col in numeric_cols:
+            clean_df[col] = self.clean_numeric_column(clean_df[col])
+        
+        return clean_df.sort_values("stock_id").reset_index(drop=True)
+    
+    def _clean_highlight(self, df: pd.DataFrame) -> pd.DataFrame:
+        """清洗融資融券餘額概況資料"""
+        cols = list(df.columns)
+        
+        rank_col = next((c for c in cols if "排名" in c), None)
+        code_col = next((c for c in cols if c == "代號"), None)
+        name_col = next((c for c in cols if c == "名稱"), None)
+        
+        if not all([rank_col, code_col, name_col]):
+            logging.error("  缺少必要欄位")
+            return None
+        
+        column_mapping = {
+            rank_col: "rank",
+            code_col: "stock_id",
+            name_col: "name"
+        }
+        
+        margin_fields = {
+            "月均融資餘額": "hg_margin_balance",
+            "月均融券餘額": "hg_short_balance",
+            "券資比": "hg_ratio"
+        }
+        
+        for pattern, new_name in margin_fields.items():
+            matching_col = next((c for c in cols if pattern in c), None)
+            if matching_col:
+                column_mapping[matching_col] = new_name
+        
+        available_cols = [col for col in column_mapping.keys() if col in df.columns]
+        clean_df = df[available_cols].rename(columns=column_mapping).copy()
+        
+        clean_df["stock_id"] = self.extract_stock_id(clean_df["stock_id"])
+        clean_df = clean_df.dropna(subset=["stock_id"])
+        clean_df = clean_df[clean_df["stock_id"].str.match(r'^\d{4}$', na=False)]
+        
+        numeric_cols = [col for col in clean_df.columns if col not in ["stock_id", "name"]]
+        for col in numeric_cols:
+            clean_df[col] = self.clean_numeric_column(clean_df[col])
+        
+        return clean_df.sort_values("stock_id").reset_index(drop=True)
+    
+    def _clean_sbl(self, df: pd.DataFrame) -> pd.DataFrame:
+        """清洗信用額度總量管制餘額資料"""
+        cols = list(df.columns)
+        
+        code_col = next((c for c in cols if "股票代號" in c), None)
+        name_col = next((c for c in cols if "股票名稱" in c), None)
+        
+        if not all([code_col, name_col]):
+            logging.error("  缺少必要欄位")
+            return None
+        
+        column_mapping = {
+            code_col: "stock_id",
+            name_col: "name"
+        }
+        
+        sbl_fields = {
+            "融券前日餘額": "owz_short_prev_balance",
+            "融券賣出": "owz_short_sell",
+            "融券買進": "owz_short_buy",
+            "融券現券": "owz_short_spot",
+            "融券當日餘額": "owz_short_today_balance",
+            "融券限額": "owz_short_limit",
+            "借券前日餘額": "owz_borrow_prev_balance",
+            "借券當日賣出": "owz_borrow_sell",
+            "借券當日還券": "owz_borrow_return",
+            "借券當日調整數額": "owz_borrow_adj",
+            "借券當日餘額": "owz_borrow_today_balance",
+            "借券次一營業日可借券賣出限額": "owz_borrow_next_limit",
+            "備註": "remark"
+        }
+        
+        for pattern, new_name in sbl_fields.items():
+            matching_col = next((c for c in cols if pattern in c), None)
+            if matching_col:
+                column_mapping[matching_col] = new_name
+        
+        available_cols = [col for col in column_mapping.keys() if col in df.columns]
+        clean_df = df[available_cols].rename(columns=column_mapping).copy()
+        
+        clean_df["stock_id"] = self.extract_stock_id(clean_df["stock_id"])
+        clean_df = clean_df.dropna(subset=["stock_id"])
+        clean_df = clean_df[clean_df["stock_id"].str.match(r'^\d{4}$', na=False)]
+        
+        numeric_cols = [col for col in clean_df.columns if col not in ["stock_id", "name", "remark"]]
+        for col in numeric_cols:
+            clean_df[col] = self.clean_numeric_column(clean_df[col])
+        
+        return clean_df.sort_values("stock_id").reset_index(drop=True)
+    
+    def _clean_margin_transactions(self, df: pd.DataFrame) -> pd.DataFrame:
+        """清洗融資融券餘額資料"""
+        cols = list(df.columns)
+        
+        # 過濾只保留數字開頭的行
+        if len(df) > 0:
+            first_col_str = df.iloc[:, 0].astype(str)
+            mask = first_col_str.str.match(r'^\d', na=False)
+            df = df[mask].copy()
+        
+        code_col = None
+        name_col = None
+        
+        for pattern in ["代號", "代碼", "股票代號", "證券代號"]:
+            for c in cols:
+                if pattern in c:
+                    code_col = c
+                    break
+            if code_col:
+                break
+        
+        for pattern in ["名稱", "股票名稱", "證券名稱"]:
+            for c in cols:
+                if pattern in c:
+                    name_col = c
+                    break
+            if name_col:
+                break
+        
+        if not code_col and len(cols) >= 2:
+            if df.iloc[0, 0] and re.match(r'^\d+', str(df.iloc[0, 0])):
+                code_col = cols[0]
+                name_col = cols[1]
+        
+        if not code_col:
+            logging.error(f"  無法識別證券代號欄位，欄位列表：{cols}")
+            return None
+        
+        column_mapping = {code_col: "stock_id"}
+        if name_col:
+            column_mapping[name_col] = "name"
+        
+        mt_fields = {
+            "前資餘額": "mt_prev_balance",
+            "資買": "mt_buy",
+            "資賣": "mt_sell",
+            "現償": "mt_pay",
+            "資餘額": "mt_balance",
+            "資屬證金": "mt_cash",
+            "資使用率": "mt_usage_rate",
+            "資限額": "mt_limit",
+            "前券餘額": "st_prev_balance",
+            "券賣": "st_sell",
+            "券買": "st_buy",
+            "券償": "st_pay",
+            "券餘額": "st_balance",
+            "券屬證金": "st_cash",
+            "券使用率": "st_usage_rate",
+            "券限額": "st_limit",
+            "資券相抵": "mt_st_offset",
+            "備註": "remark"
+        }
+        
+        for pattern, new_name in mt_fields.items():
+            matching_col = next((c for c in cols if pattern in c), None)
+            if matching_col:
+                column_mapping[matching_col] = new_name
+        
+        available_cols = [col for col in column_mapping.keys() if col in df.columns]
+        clean_df = df[available_cols].rename(columns=column_mapping).copy()
+        
+        clean_df["stock_id"] = self.extract_stock_id(clean_df["stock_id"])
+        clean_df = clean_df.dropna(subset=["stock_id"])
+        clean_df = clean_df[clean_df["stock_id"].str.match(r'^\d{4}$', na=False)]
+        
+        numeric_cols = [col for col in clean_df.columns if col not in ["stock_id", "name", "remark"]]
+        for col in numeric_cols:
+            clean_df[col] = self.clean_numeric_column(clean_df[col])
+        
+        return clean_df.sort_values("stock_id").reset_index(drop=True)
+    
+    def _clean_exempted(self, df: pd.DataFrame) -> pd.DataFrame:
+        """清洗平盤下得融券賣出證券名單"""
+        cols = list(df.columns)
+        
+        # 找到數據開始的行
+        data_start_row = 0
+        for i, row in df.iterrows():
+            first_val = str(row.iloc[0])
+            if re.match(r'^\d{3,4}', first_val):
+                data_start_row = i
+                break
+        
+        if data_start_row > 0:
+            df = df.iloc[data_start_row:].copy()
+            df.columns = cols
+        
+        code_col = None
+        name_col = None
+        
+        for c in cols:
+            if "證券代號" in c or "代號" in c or "代碼" in c:
+                code_col = c
+                break
+        
+        for c in cols:
+            if "證券名稱" in c or "名稱" in c:
+                name_col = c
+                break
+        
+        if not code_col:
+            if len(cols) >= 2:
+                code_col = cols[0]
+                name_col = cols[1] if not name_col else name_col
+        
+        if not code_col:
+            logging.error("  無法識別證券代號欄位")
+            return None
+        
+        column_mapping = {code_col: "stock_id"}
+        if name_col:
+            column_mapping[name_col] = "name"
+        
+        # 找到標記欄位
+        mark_cols = []
+        for c in cols:
+            if c not in [code_col, name_col]:
+                if "暫停" in c or "標記" in c or "註記" in c or len(c) <= 3:
+                    mark_cols.append(c)
+        
+        for i, mark_col in enumerate(mark_cols):
+            column_mapping[mark_col] = f"mark_{i+1}" if i > 0 else "mark"
+        
+        available_cols = [col for col in column_mapping.keys() if col in df.columns]
+        clean_df = df[available_cols].rename(columns=column_mapping).copy()
+        
+        clean_df["stock_id"] = self.extract_stock_id(clean_df["stock_id"])
+        clean_df = clean_df.dropna(subset=["stock_id"])
+        clean_df = clean_df[clean_df["stock_id"].str.match(r'^\d{4}$', na=False)]
+        
+        # 過濾統計行
+        if "name" in clean_df.columns:
+            clean_df = clean_df[~clean_df["name"].str.contains("共.*筆|合計|統計|註:|說明:", na=False, regex=True)]
+        
+        return clean_df.sort_values("stock_id").reset_index(drop=True)
+    
+    def _clean_investment_trust(self, df: pd.DataFrame) -> pd.DataFrame:
+        """清洗投信買賣超資料"""
+        cols = list(df.columns)
+        
+        rank_col = next((c for c in cols if "排行" in c), None)
+        code_col = next((c for c in cols if "代號" in c), None)
+        name_col = next((c for c in cols if "名稱" in c), None)
+        
+        if not all([rank_col, code_col, name_col]):
+            logging.error("  缺少必要欄位")
+            return None
+        
+        column_mapping = {
+            rank_col: "rank",
+            code_col: "stock_id",
+            name_col: "name"
+        }
+        
+        it_fields = {
+            "買進": "it_buy_shares",
+            "賣出": "it_sell_shares",
+            "買賣超": "it_diff_shares",
+            "買進金額": "it_buy_amount",
+            "賣出金額": "it_sell_amount",
+            "買賣超金額": "it_diff_amount"
+        }
+        
+        for pattern, new_name in it_fields.items():
+            matching_col = next((c for c in cols if pattern in c), None)
+            if matching_col:
+                column_mapping[matching_col] = new_name
+        
+        available_cols = [col for col in column_mapping.keys() if col in df.columns]
+        clean_df = df[available_cols].rename(columns=column_mapping).copy()
+        
+        clean_df["stock_id"] = self.extract_stock_id(clean_df["stock_id"])
+        clean_df = clean_df.dropna(subset=["stock_id"])
+        clean_df = clean_df[clean_df["stock_id"].str.match(r'^\d{4}$', na=False)]
+        
+        numeric_cols = [col for col in clean_df.columns if col not in ["rank", "stock_id", "name"]]
+        for col in numeric_cols:
+            clean_df[col] = self.clean_numeric_column(clean_df[col])
+        
+        return clean_df.sort_values("stock_id").reset_index(drop=True)
+    
+    def clean_all_files(self, files: Optional[Iterable[Path]] = None) -> Dict[str, int]:
+        """清洗指定檔案（預設為原始目錄下所有 CSV）"""
+        self.ensure_dir(CLEAN_DIR)
+        results = {"success": 0, "failed": 0, "failed_files": []}
+        if files is None:
+            files = RAW_DIR.glob("*.csv")
+        
+        with self.performance_monitor.measure_time("資料清洗"):
+            for csv_file in files:
+                try:
+                    if self.clean_single_file(csv_file):
+                        results["success"] += 1
+                    else:
+                        results["failed"] += 1
+                        results["failed_files"].append(csv_file.name)
+                except Exception as e:
+                    logging.error(f"清理檔案 {csv_file.name} 時發生錯誤: {e}")
+                    results["failed"] += 1
+                    results["failed_files"].append(csv_file.name)
+        
+        return results
+    
+    def clean_all_historical_files(self) -> Dict[str, int]:
+        """清洗所有歷史檔案（settings.clean_workers > 1 時改用多行程清洗）"""
+        workers = self.config.get("settings", {}).get("clean_workers", 1)
+        if workers and workers > 1:
+            # 主行程直接在交棒的 Arrow 表上驗證列數與日期（results["validation"]），不重讀清洗檔
+            return self.clean_files_parallel(workers=workers)[0]
+        
+        self.ensure_dir(CLEAN_DIR)
+        results = {"success": 0, "failed": 0, "failed_files": []}
+        
+        # 取得所有檔案，按日期分組
+        files_by_date = self.get_all_raw_files_by_date()
+        total_dates = len(files_by_date)
+        
+        logging.info(f"\n=== 開始清洗歷史資料 ===")
+        logging.info(f"找到 {total_dates} 個日期的資料")
+        
+        with self.performance_monitor.measure_time("歷史資料清洗"):
+            for date_idx, (date_str, file_list) in enumerate(sorted(files_by_date.items()), 1):
+                logging.info(f"\n── 清洗日期 {date_str} ({date_idx}/{total_dates}) ──")
+                
+                for file_path in file_list:
+                    try:
+                        if self.clean_single_file(file_path):
+                            results["success"] += 1
+                        else:
+                            results["failed"] += 1
+                            results["failed_files"].append(file_path.name)
+                    except Exception as e:
+                        logging.error(f"清理檔案 {file_path.name} 時發生錯誤: {e}")
+                        results["failed"] += 1
+                        results["failed_files"].append(file_path.name)
+        
+        logging.info(f"\n[📊] 清洗統計:")
+        logging.info(f"    - 成功: {results['success']}")
+        logging.info(f"    - 失敗: {results['failed']}")
+        
+        return results
+    
+    def clean_files_parallel(self, files: Optional[Iterable[Path]] = None,
+                             workers: Optional[int] = None, collect: bool = True) -> tuple:
+        """
+        多行程清洗；回傳 (統計, {檔案類型: 多日期 Arrow 表})。
+        清洗檔照常寫到 otc_cleaned，工作行程只回傳小型 FrameHandle，
+        主行程以 memory map 開啟並依類型接成一張表，不經 pickle 複製整個資料框，
+        並在表上驗證各類型的列數、日期數與股票代號（統計的 "validation"）；
+        collect=False 時只寫清洗檔，不匯出交棒檔，回傳的表為空
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from shared_frames import HandoffDir, assemble, chunked, summarize_tables
+        
+        self.ensure_dir(CLEAN_DIR)
+        results = {"success": 0, "failed": 0, "failed_files": []}
+        if files is None:
+            files = [Path(p) for paths in self.get_all_raw_files_by_date().values() for p in paths]
+        files = sorted(str(f) for f in files)
+        if not files:
+            return results, {}
+        
+        handles, tables = [], {}
+        with HandoffDir() if collect else nullcontext() as handoff:
+            handoff_dir = str(handoff.path) if collect else None
+            with self.performance_monitor.measure_time("平行資料清洗"):
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = [pool.submit(_clean_files_worker, self.config, part, handoff_dir)
+                               for part in chunked(files, (workers or os.cpu_count() or 4) * 4)]
+                    for future in futures:
+                        done, part_handles, failed = future.result()
+                        handles.extend(part_handles)
+                        results["success"] += done
+                        results["failed"] += len(failed)
+                        results["failed_files"].extend(failed)
+            if collect:
+                with self.performance_monitor.measure_time("組合清洗結果"):
+                    tables = assemble(handles)
+                    results["validation"] = summarize_tables(tables)
+        
+        logging.info(f"\n[📊] 平行清洗統計: 成功 {results['success']}，失敗 {results['failed']}")
+        validation = results.get("validation", {})
+        for file_type, info in sorted(validation.items()):
+            logging.info(f"    - {file_type}: {info['rows']} 行，{info['dates']} 個日期")
+            if info["invalid_ids"]:
+                logging.warning(f"    [⚠] {file_type}: {info['invalid_ids']} 列股票代號不是 4 位數字")
+        empty = results["success"] - sum(info["dates"] for info in validation.values())
+        if collect and empty > 0:
+            logging.warning(f"    [⚠] {empty} 個清洗檔沒有資料列（只有標題）")
+        return results, tables
+
+def _clean_files_worker(config: Dict[str, Any], files: List[str], handoff_dir: Optional[str]) -> tuple:
+    """
+    平行清洗的工作行程：照常寫出清洗檔；指定 handoff_dir 時再把結果以 Arrow IPC 交給主行程
+    （模組層級函式，Windows 的 spawn 才能 pickle）；回傳 (成功數, handles, 失敗檔名)
+    """
+    from shared_frames import export_frame
+    cleaner = OTCDataCleaner(config)
+    done, handles, failed = 0, [], []
+    for name in files:
+        file_path = Path(name)
+        cleaned = cleaner.clean_to_frame(file_path)
+        if cleaned is None:
+            failed.append(file_path.name)
+            continue
+        file_type, clean_df = cleaned
+        try:
+            cleaner.write_clean_file(clean_df, file_path.name)
+            if handoff_dir:
+                parsed = parse_filename(file_path.name)
+                handles.append(export_frame(clean_df, file_type, parsed[0] if parsed else "", handoff_dir))
+            done += 1
+        except Exception as e:
+            logging.error(f"    [❌] {file_path.name} 輸出失敗：{e}")
+            failed.append(file_path.name)
+    return done, handles, failed
+
+def verify_clean_data():
+    """驗證清理後的資料品質"""
+    logging.info("\n=== 資料品質驗證 ===")
+    
+    issues = []
+    
+    for csv_file in CLEAN_DIR.glob("*.csv"):
+        try:
+            df = pd.read_csv(csv_file, encoding='utf-8-sig')
+            
+            if 'stock_id' in df.columns:
+                invalid_ids = df[~df['stock_id'].astype(str).str.match(r'^\d{4}$', na=False)]
+                if len(invalid_ids) > 0:
+                    issues.append({
+                        'file': csv_file.name,
+                        'issue': '包含非4位數字股票代號',
+                        'count': len(invalid_ids),
+                        'samples': invalid_ids['stock_id'].head(5).tolist()
+                    })
+                
+                for col in df.select_dtypes(include=['float64', 'int64']).columns:
+                    if df[col].astype(str).str.contains(r'[eE][+-]?\d+', regex=True).any():
+                        issues.append({
+                            'file': csv_file.name,
+                            'issue': f'欄位 {col} 包含科學記號',
+                            'column': col
+                        })
+        
+        except Exception as e:
+            logging.error(f"驗證檔案 {csv_file.name} 時發生錯誤: {e}")
+    
+    if issues:
+        logging.warning("發現以下資料品質問題：")
+        for issue in issues:
+            logging.warning(f"  - {issue}")
+    else:
+        logging.info("所有檔案資料品質良好！")
+    
+    return issues
+
+def _fill_missing(target: Dict[str, Any], defaults: Dict[str, Any]) -> None:
+    """target 缺少的鍵以 defaults 補上（巢狀 dict 逐層補，已有的值不覆寫）"""
+    for key, value in defaults.items():
+        if key not in target:
+            target[key] = copy.deepcopy(value)
+        elif isinstance(target[key], dict) and isinstance(value, dict):
+            _fill_missing(target[key], value)
+
+
+def merge_config_defaults(config: Dict[str, Any], default_config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    設定檔缺少的設定（settings.schedule、各項目的 priority …）以預設值補上；
+    download_items 只補設定檔中已列出的項目，刪掉的項目不會被加回來
+    """
+    defaults = dict(default_config)
+    if "download_items" in config:
+        default_items = defaults.pop("download_items", {})
+        for name, item in config["download_items"].items():
+            _fill_missing(item, default_items.get(name, {}))
+    _fill_missing(config, defaults)
+    return config
+
+
+def load_config(default_config: Dict[str, Any]) -> Dict[str, Any]:
+    """載入設定檔（缺少的鍵以 default_config 補上），不存在或格式錯誤時使用 default_config"""
+    if CONFIG_FILE.exists():
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            logging.info(f"已載入設定檔: {CONFIG_FILE}")
+            return rebase_download_items(merge_config_defaults(config, default_config))
+        except Exception as e:
+            logging.warning(f"設定檔載入失敗，使用預設設定: {e}")
+    else:
+        logging.info("未找到設定檔，使用預設設定")
+    
+    # 複製一份再改寫網址，不動到呼叫端模組層級的 DEFAULT_CONFIG
+    return rebase_download_items(copy.deepcopy(default_config))
+
+def save_config(config: Dict[str, Any]):
+    """儲存設定檔"""
+    try:
+        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2, ensure_ascii=False)
+        logging.info(f"設定檔已儲存: {CONFIG_FILE}")
+    except Exception as e:
+        logging.error(f"設定檔儲存失敗: {e}")
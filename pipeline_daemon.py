@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline Daemon - 常駐排程模式（取代每日固定時間的冷啟動排程）
+整天共用同一個 HTTP session 與 Chrome；每個資料源從預期公布時間開始輪詢，
+資料一出現就立刻 下載 → 清洗 → 發布（快照 / 滾動特徵 / 融資券序列），
+逾放棄時間仍無資料則記錄為未公布。進度寫在 daemon_state.json，重啟後不會重做
+
+用法：
+    python pipeline_daemon.py            # 常駐執行
+    python pipeline_daemon.py --once     # 只跑今天，全部完成或放棄後結束（可給排程器呼叫）
+    python pipeline_daemon.py --status   # 顯示今天各資料源狀態
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import daily_data_updater as twse
+from daily_otc_updater import DEFAULT_CONFIG as OTC_DEFAULT_CONFIG, OTCDataDownloader
+from fetch_planner import trading_calendar
+from flow_features import update_flow_features
+from http_client import create_session, connection_stats, format_stats
+from margin_series import update_margin_series
+from market_snapshot import update_snapshot
+from otc_common import OTCDataCleaner, load_config, setup_logging
+from snapshot_changelog import update_changelogs
+from source_readiness import TWSE_PUBLISH_TIMES, at_time, now_tw, probe
+
+BASE_DIR = Path(__file__).parent
+STATE_FILE = BASE_DIR / "daemon_state.json"
+
+POLL_INTERVAL = 300          # 尚未公布時每 5 分鐘再試一次
+GIVE_UP_AT = "23:30"         # 過了這個時間仍無資料，當天記為未公布
+MAX_SLEEP = 60               # 主迴圈最長睡眠秒數（換日、Ctrl+C 反應時間）
+BROWSER_RECYCLE_ERRORS = 3   # Chrome 連續出錯幾次就重開
+
+# 預期公布時間（台灣時間）；poll 可個別覆寫輪詢間隔
+SCHEDULE = {
+    # 上市（requests；公布時間與 source_readiness 共用）
+    "mi_index": {"exchange": "TWSE", "publish": TWSE_PUBLISH_TIMES["mi_index"]},
+    "t86": {"exchange": "TWSE", "publish": TWSE_PUBLISH_TIMES["t86"]},
+    "twt44u": {"exchange": "TWSE", "publish": TWSE_PUBLISH_TIMES["twt44u"]},
+    "twt38u": {"exchange": "TWSE", "publish": TWSE_PUBLISH_TIMES["twt38u"]},
+    "mi_margn": {"exchange": "TWSE", "publish": TWSE_PUBLISH_TIMES["mi_margn"], "poll": 600},
+    # 上櫃（Selenium）
+    "daily_close_no1430": {"exchange": "TPEx", "publish": "14:30"},
+    "institutional_detail": {"exchange": "TPEx", "publish": "15:00"},
+    "investment_trust_buy": {"exchange": "TPEx", "publish": "15:00"},
+    "investment_trust_sell": {"exchange": "TPEx", "publish": "15:00"},
+    "day_trading": {"exchange": "TPEx", "publish": "15:30"},
+    "sec_trading": {"exchange": "TPEx", "publish": "16:00"},
+    "exempted": {"exchange": "TPEx", "publish": "17:00"},
+    "sbl": {"exchange": "TPEx", "publish": "17:00"},
+    "margin_transactions": {"exchange": "TPEx", "publish": "18:00", "poll": 600},
+    "highlight": {"exchange": "TPEx", "publish": "18:00", "poll": 600},
+}
+
+# 資料源就緒後的發布步驟
+POST_PUBLISH: Dict[str, List[Callable[[], Any]]] = {
+    "mi_index": [update_snapshot],
+    "daily_close_no1430": [update_snapshot],
+    "t86": [lambda: update_flow_features(exchange="TWSE")],
+    "twt44u": [lambda: update_flow_features(exchange="TWSE")],
+    "twt38u": [lambda: update_flow_features(exchange="TWSE")],
+    "institutional_detail": [lambda: update_flow_features(exchange="TPEx")],
+    "investment_trust_buy": [lambda: update_flow_features(exchange="TPEx")],
+    "investment_trust_sell": [lambda: update_flow_features(exchange="TPEx")],
+    "mi_margn": [lambda: update_margin_series(exchange="TWSE")],
+    "margin_transactions": [lambda: update_margin_series(exchange="TPEx")],
+    "exempted": [update_changelogs],
+    "sbl": [update_changelogs],
+}
+
+PENDING, DONE, GAVE_UP = "pending", "done", "gave_up"
+
+
+class SourceJob:
+    """單一資料源當天的輪詢狀態"""
+
+    def __init__(self, name: str, spec: Dict[str, Any], day: datetime):
+        self.name = name
+        self.exchange = spec["exchange"]
+        self.publish_at = at_time(day, spec["publish"])
+        self.poll_interval = spec.get("poll", POLL_INTERVAL)
+        self.give_up_at = at_time(day, spec.get("give_up", GIVE_UP_AT))
+        self.next_poll = self.publish_at
+        self.status = PENDING
+        self.polls = 0
+        self.finished_at: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"status": self.status, "polls": self.polls, "finished_at": self.finished_at}
+
+
+class PipelineDaemon:
+    """常駐排程器：暖 session / 暖瀏覽器 + 依公布時間輪詢"""
+
+    def __init__(self, otc_config: Dict[str, Any]):
+        self.otc_config = otc_config
+        self.session = None
+        self.otc: Optional[OTCDataDownloader] = None
+        self.cleaner = OTCDataCleaner(otc_config)
+        self.browser_errors = 0
+        self.day: Optional[datetime] = None
+        self.jobs: Dict[str, SourceJob] = {}
+
+    # ---- 狀態檔 ----
+    @staticmethod
+    def load_state() -> Dict[str, Dict[str, Any]]:
+        if not STATE_FILE.exists():
+            return {}
+        try:
+            with open(STATE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self) -> None:
+        state = self.load_state()
+        state[self.day.strftime("%Y%m%d")] = {name: job.as_dict() for name, job in self.jobs.items()}
+        # 只保留最近兩週
+        state = dict(sorted(state.items())[-14:])
+        tmp_path = STATE_FILE.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, STATE_FILE)
+
+    # ---- 每日計畫 ----
+    def plan_day(self, day: datetime) -> None:
+        """換日：建立當天的輪詢工作；休市日沒有工作，已完成的資料源不重做"""
+        self.day = day
+        self.jobs = {}
+        if not trading_calendar([day]):
+            logging.info(f"[常駐] {day:%Y-%m-%d} 休市")
+            return
+        done = self.load_state().get(day.strftime("%Y%m%d"), {})
+        items = self.otc_config.get("download_items", {})
+        for name, spec in SCHEDULE.items():
+            if spec["exchange"] == "TPEx" and name not in items:
+                continue
+            job = SourceJob(name, spec, day)
+            if name in done and done[name]["status"] != PENDING:
+                job.status, job.polls, job.finished_at = done[name]["status"], done[name]["polls"], done[name]["finished_at"]
+            self.jobs[name] = job
+        pending = [j for j in self.jobs.values() if j.status == PENDING]
+        logging.info(f"[常駐] {day:%Y-%m-%d} 待處理 {len(pending)}/{len(self.jobs)} 個資料源")
+
+    # ---- 暖資源 ----
+    def twse_session(self):
+        if self.session is None:
+            self.session = create_session(twse.HEADERS, transport=twse.HTTP_TRANSPORT)
+        return self.session
+
+    def otc_downloader(self) -> OTCDataDownloader:
+        if self.otc is None or self.otc.driver is None:
+            self.otc = OTCDataDownloader(self.otc_config)
+            self.otc.open_browser()
+            self.browser_errors = 0
+        return self.otc
+
+    def release_browser(self) -> None:
+        """當天上櫃資料源都結束後關閉 Chrome，夜間不佔記憶體"""
+        if self.otc is not None:
+            self.otc.close_browser()
+            self.otc = None
+
+    # ---- 輪詢 ----
+    def poll_twse(self, job: SourceJob) -> bool:
+        # 串流探測：開頭判斷已公布時順帶讀完同一個回應，不再發第二次完整 GET
+        date_str = self.day.strftime("%Y%m%d")
+        url = twse.URLS[job.name](date_str, twse.roc_date(self.day))
+        kind, content = probe(self.twse_session(), url, twse.twse_url(twse.REFERER_PATH[job.name]),
+                              allow_html=(job.name == "t86"))
+        if kind is not None:
+            return False
+        twse.persist_raw(date_str, job.name, content)
+        # 內容是位元組，沒有檔名可取日期：明確傳入，才會寫出帶日期的清洗檔
+        twse.PROCESSORS[job.name](content, date_str)
+        return True
+
+    def poll_otc(self, job: SourceJob) -> bool:
+        downloader = self.otc_downloader()
+        cfg = downloader.download_items[job.name]
+        try:
+            ok = downloader.download_single_file(job.name, cfg, self.day)
+            self.browser_errors = 0
+        except Exception:
+            self.browser_errors += 1
+            if self.browser_errors >= BROWSER_RECYCLE_ERRORS:
+                logging.warning(f"[常駐] Chrome 連續 {self.browser_errors} 次錯誤，重新啟動")
+                self.release_browser()
+            raise
+        downloader.latency.record_result(job.name, ok)
+        if not ok:
+            return False
+        # 尚未公布時頁面可能仍提供空白 CSV：清洗失敗視為未就緒，刪掉原始檔下次重抓
+        raw_path = downloader.stored_files.pop(job.name, None)
+        if raw_path is None:
+            return False
+        if self.cleaner.clean_single_file(raw_path):
+            return True
+        raw_path.unlink(missing_ok=True)
+        return False
+
+    def publish(self, job: SourceJob) -> None:
+        for step in POST_PUBLISH.get(job.name, []):
+            step()
+
+    def run_job(self, job: SourceJob, now: datetime) -> None:
+        job.polls += 1
+        poll = self.poll_twse if job.exchange == "TWSE" else self.poll_otc
+        try:
+            ready = poll(job)
+        except Exception as e:
+            logging.warning(f"[常駐] {job.name} 輪詢錯誤：{e}")
+            ready = False
+
+        if ready:
+            self.publish(job)
+            job.status, job.finished_at = DONE, now_tw().strftime("%H:%M:%S")
+            delay = (now_tw() - job.publish_at).total_seconds() / 60
+            logging.info(f"[常駐] [✅] {job.name} 完成（第 {job.polls} 次輪詢，預期公布後 {delay:.0f} 分鐘）")
+        elif now >= job.give_up_at:
+            job.status, job.finished_at = GAVE_UP, now.strftime("%H:%M:%S")
+            logging.warning(f"[常駐] [❌] {job.name} 至 {job.give_up_at:%H:%M} 仍無資料，今日放棄")
+        else:
+            job.next_poll = now + timedelta(seconds=job.poll_interval)
+            logging.info(f"[常駐] {job.name} 尚未公布，{job.next_poll:%H:%M} 再試")
+        self.save_state()
+
+    def tick(self) -> float:
+        """處理所有到期的工作，回傳可以睡多久"""
+        now = now_tw()
+        if self.day is None or now.date() != self.day.date():
+            self.plan_day(now.replace(hour=0, minute=0, second=0, microsecond=0))
+
+        due = sorted((j for j in self.jobs.values() if j.status == PENDING and j.next_poll <= now),
+                     key=lambda j: (j.publish_at, j.name))
+        for job in due:
+            self.run_job(job, now_tw())
+
+        if self.otc is not None and not any(j.status == PENDING and j.exchange == "TPEx" for j in self.jobs.values()):
+            self.release_browser()
+
+        pending = [j.next_poll for j in self.jobs.values() if j.status == PENDING]
+        if not pending:
+            return MAX_SLEEP
+        return max(0.0, min(MAX_SLEEP, (min(pending) - now_tw()).total_seconds()))
+
+    def finished(self) -> bool:
+        return self.day is not None and all(j.status != PENDING for j in self.jobs.values())
+
+    def run(self, once: bool = False) -> Dict[str, str]:
+        logging.info("=== 常駐排程開始 ===")
+        try:
+            while True:
+                wait = self.tick()
+                if once and self.finished():
+                    break
+                time.sleep(wait)
+        except KeyboardInterrupt:
+            logging.info("收到中斷，結束常駐排程")
+        finally:
+            self.release_browser()
+            if self.session is not None:
+                logging.info(f"[🔗] 連線統計: {format_stats(connection_stats(self.session))}")
+        return {name: job.status for name, job in self.jobs.items()}
+
+
+def print_status() -> None:
+    today = now_tw().strftime("%Y%m%d")
+    state = PipelineDaemon.load_state().get(today, {})
+    print(f"[📊] {today} 資料源狀態")
+    for name, spec in SCHEDULE.items():
+        entry = state.get(name, {"status": PENDING, "polls": 0, "finished_at": None})
+        print(f"  {name:<24} {spec['exchange']:<5} 預期 {spec['publish']}  {entry['status']:<8} "
+              f"輪詢 {entry['polls']:>3} 次  {entry['finished_at'] or ''}")
+
+
+def main():
+    if "--status" in sys.argv:
+        print_status()
+        return
+    setup_logging(f"pipeline_daemon_{datetime.now().strftime('%Y%m%d')}.log")
+    result = PipelineDaemon(load_config(OTC_DEFAULT_CONFIG)).run(once="--once" in sys.argv)
+    if "--once" in sys.argv:
+        sys.exit(1 if GAVE_UP in result.values() else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Raw Catalog - 原始檔目錄索引
+以 SQLite 記錄 (資料源, 日期, 路徑, 大小, 雜湊)，每次寫檔時同步更新；
+latest_raw / 既有檔案檢查 / 依日期分組等查詢改為索引查詢，不再重複掃描整個目錄。
+目錄本身的 mtime 未變時啟動不需列目錄也不需 stat 檔案；有外部新增或刪除檔案時才做一次完整差異同步，
+只有雜湊在大小或 mtime 改變時才重算。外部就地覆寫不會改變目錄 mtime，需要時以 sync(force=True) 完整檢查。
+本程序自己的寫檔包在 writing() 裡：寫入前後比對目錄 mtime，不必重新列目錄。
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+# YYYYMMDD_source.csv（上市、上櫃歷史下載的命名方式）
+NAME_PATTERN = re.compile(r"^(\d{8})_(.+)\.csv$", re.IGNORECASE)
+# 其他含日期的檔名，例如 xxx_20250102_cleaned.csv
+DATE_PATTERN = re.compile(r"(\d{8})_")
+
+CATALOG_FILENAME = "catalog.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path   TEXT PRIMARY KEY,
+    root   TEXT NOT NULL,
+    source TEXT NOT NULL,
+    date   TEXT NOT NULL,
+    size   INTEGER NOT NULL,
+    mtime  REAL NOT NULL,
+    sha1   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_source_date ON files(root, source, date);
+CREATE INDEX IF NOT EXISTS idx_files_date ON files(root, date);
+CREATE TABLE IF NOT EXISTS dirs (
+    root        TEXT PRIMARY KEY,
+    mtime_ns    INTEGER NOT NULL
+);
+"""
+
+
+def parse_filename(filename: str) -> Optional[Tuple[str, str]]:
+    """從檔名取出 (日期, 資料源)；無法辨識時回傳 None"""
+    match = NAME_PATTERN.match(filename)
+    if match:
+        return match.group(1), match.group(2).lower()
+    if not filename.lower().endswith(".csv"):
+        return None
+    match = DATE_PATTERN.search(filename)
+    if match:
+        stem = filename[:-4]
+        source = (stem[:match.start()] + stem[match.end():]).strip("_").lower()
+        return match.group(1), source
+    return None
+
+
+def file_sha1(path: str, content: Optional[bytes] = None) -> str:
+    """計算檔案 SHA-1；寫檔當下已有內容時直接使用，不重讀磁碟"""
+    if content is not None:
+        return hashlib.sha1(content).hexdigest()
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FileCatalog:
+    """
+    單一資料夾的檔案目錄索引
+    多個資料夾（上市 raw、上櫃 raw…）可共用同一個 SQLite 檔，以 root 區分
+    """
+
+    def __init__(self, root: str, db_path: Optional[str] = None, auto_sync: bool = True):
+        self.root = os.path.abspath(str(root))
+        # 索引檔放在資料夾外層：放在資料夾內會讓 SQLite journal 改變目錄 mtime
+        self.db_path = str(db_path or os.path.join(os.path.dirname(self.root), CATALOG_FILENAME))
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        # 本程序最後一次同步（或自己寫檔後推進）時的目錄 mtime
+        self._dir_mtime_ns: Optional[int] = None
+        if auto_sync:
+            self.sync()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ===== 寫入 =====
+    def record(self, path: str, content: Optional[bytes] = None) -> bool:
+        """寫檔後登記；content 為剛寫入的內容（可省略）"""
+        path = os.path.abspath(str(path))
+        parsed = parse_filename(os.path.basename(path))
+        if parsed is None:
+            return False
+        date_str, source = parsed
+        st = os.stat(path)
+        sha1 = file_sha1(path, content)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files(path, root, source, date, size, mtime, sha1) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, self.root, source, date_str, st.st_size, st.st_mtime, sha1),
+            )
+            self._conn.commit()
+        return True
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(str(path)),))
+            self._conn.commit()
+
+    def _root_mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self.root).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def writing(self):
+        """
+        包住本程序對目錄的寫入（寫檔 / 改名後再 record() 或 remove()）。
+        寫入前的目錄 mtime 仍是上次同步的值，才把登記值推進到寫入後的 mtime；
+        否則（其他程序或外部工具先改過目錄）保留舊值，讓下次 sync() 完整掃描
+        """
+        before = self._root_mtime_ns()
+        yield
+        after = self._root_mtime_ns()
+        if before is None or after is None:
+            return
+        with self._lock:
+            row = self._conn.execute("SELECT mtime_ns FROM dirs WHERE root = ?", (self.root,)).fetchone()
+            if row is None or row[0] != before or self._dir_mtime_ns != before:
+                return
+            self._conn.execute("UPDATE dirs SET mtime_ns = ? WHERE root = ?", (after, self.root))
+            self._conn.commit()
+            self._dir_mtime_ns = after
+
+    def sync(self, force: bool = False) -> Dict[str, int]:
+        """
+        與磁碟差異同步。目錄 mtime 未變時（且非 force）不做任何檔案系統掃描；
+        否則列出目錄，大小或 mtime 改變的檔案重算雜湊，消失的檔案移除
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0}
+        if not os.path.isdir(self.root):
+            return stats
+        dir_mtime = os.stat(self.root).st_mtime_ns
+        with self._lock:
+            row = self._conn.execute("SELECT mtime_ns FROM dirs WHERE root = ?", (self.root,)).fetchone()
+            if row and row[0] == dir_mtime and not force:
+                self._dir_mtime_ns = dir_mtime
+                return stats
+            known = {
+                path: (size, mtime)
+                for path, size, mtime in self._conn.execute(
+                    "SELECT path, size, mtime FROM files WHERE root = ?", (self.root,)
+                )
+            }
+
+        seen = set()
+        rows = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                parsed = parse_filename(entry.name)
+                if parsed is None:
+                    continue
+                path = os.path.abspath(entry.path)
+                seen.add(path)
+                st = entry.stat()
+                old = known.get(path)
+                if old and old[0] == st.st_size and old[1] == st.st_mtime:
+                    continue
+                stats["updated" if old else "added"] += 1
+                rows.append((path, self.root, parsed[1], parsed[0], st.st_size, st.st_mtime, file_sha1(path)))
+
+        gone = [(p,) for p in known if p not in seen]
+        stats["removed"] = len(gone)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files(path, root, source, date, size, mtime, sha1) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("DELETE FROM files WHERE path = ?", gone)
+            self._conn.execute("INSERT OR REPLACE INTO dirs(root, mtime_ns) VALUES (?, ?)", (self.root, dir_mtime))
+            self._conn.commit()
+            self._dir_mtime_ns = dir_mtime
+        return stats
+
+    # ===== 查詢 =====
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def latest(self, source: str) -> Optional[str]:
+        """資料源最新日期的檔案路徑"""
+        rows = self._query(
+            "SELECT path FROM files WHERE root = ? AND source = ? ORDER BY date DESC LIMIT 1",
+            (self.root, source.lower()))
+        return rows[0][0] if rows else None
+
+    def has(self, source: str, date_str: str) -> bool:
+        return bool(self._query(
+            "SELECT 1 FROM files WHERE root = ? AND source = ? AND date = ? LIMIT 1",
+            (self.root, source.lower(), date_str)))
+
+    def keys(self) -> Set[str]:
+        """所有 "YYYYMMDD_source" 鍵值"""
+        return {f"{d}_{s}" for d, s in self._query(
+            "SELECT date, source FROM files WHERE root = ?", (self.root,))}
+
+    def dates(self, source: Optional[str] = None) -> List[str]:
+        if source is None:
+            rows = self._query("SELECT DISTINCT date FROM files WHERE root = ? ORDER BY date", (self.root,))
+        else:
+            rows = self._query(
+                "SELECT DISTINCT date FROM files WHERE root = ? AND source = ? ORDER BY date",
+                (self.root, source.lower()))
+        return [r[0] for r in rows]
+
+    def files_for_date(self, date_str: str) -> Dict[str, str]:
+        """指定日期的 {資料源: 路徑}"""
+        return dict(self._query(
+            "SELECT source, path FROM files WHERE root = ? AND date = ?", (self.root, date_str)))
+
+    def files_by_date(self) -> Dict[str, List[str]]:
+        """{日期: [路徑...]}，日期遞增"""
+        result: Dict[str, List[str]] = {}
+        for date_str, path in self._query(
+                "SELECT date, path FROM files WHERE root = ? ORDER BY date, source", (self.root,)):
+            result.setdefault(date_str, []).append(path)
+        return result
+
+    def range(self, source: str, start: str = "00000000", end: str = "99999999") -> List[Tuple[str, str]]:
+        """資料源在 [start, end] 區間的 (日期, 路徑)"""
+        return self._query(
+            "SELECT date, path FROM files WHERE root = ? AND source = ? AND date BETWEEN ? AND ? ORDER BY date",
+            (self.root, source.lower(), start, end))
+
+    def entries(self, source: Optional[str] = None) -> List[Dict[str, object]]:
+        """完整紀錄（路徑、大小、雜湊），供缺漏分析等工具使用"""
+        sql = "SELECT source, date, path, size, sha1 FROM files WHERE root = ?"
+        params: tuple = (self.root,)
+        if source is not None:
+            sql += " AND source = ?"
+            params += (source.lower(),)
+        return [
+            {"source": s, "date": d, "path": p, "size": size, "sha1": sha1}
+            for s, d, p, size, sha1 in self._query(sql + " ORDER BY date, source", params)
+        ]
+
+
+_catalogs: Dict[str, FileCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(root: str, db_path: Optional[str] = None) -> FileCatalog:
+    """取得資料夾的共用目錄索引（同一程序內只同步一次）"""
+    key = os.path.abspath(str(root))
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = FileCatalog(key, db_path)
+        return _catalogs[key]
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Retry Engine - 共用重試 / 退避 / 熔斷元件
+所有抓取程式（上市 requests、上櫃 Selenium）共用同一套重試策略：
+錯誤分類 → 帶抖動的指數退避 → 每個主機一個熔斷器，網站全面異常時所有 worker 一起暫停
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Dict, Any, Optional, Callable
+
+# ===== 錯誤分類 =====
+TIMEOUT = "timeout"            # 連線或讀取逾時
+CONNECTION = "connection"      # 連線失敗、DNS、TLS
+SERVER_ERROR = "server_error"  # HTTP 5xx
+THROTTLED = "throttled"        # HTTP 429/403 或「查詢過於頻繁」頁面
+NO_DATA = "no_data"            # 回傳 HTML 或內容過小（該日無資料），不重試
+CLIENT_ERROR = "client_error"  # 其他 HTTP 4xx，不重試
+UNKNOWN = "unknown"
+
+# 可重試的錯誤類別
+RETRYABLE = {TIMEOUT, CONNECTION, SERVER_ERROR, THROTTLED, UNKNOWN}
+
+# 會累計到熔斷器的錯誤類別（代表網站本身有問題，而不是該日無資料）
+BREAKER_KINDS = {TIMEOUT, CONNECTION, SERVER_ERROR, THROTTLED}
+
+THROTTLE_MARKERS = ("查詢過於頻繁", "too many requests", "請稍後再試", "rate limit")
+
+MIN_CONTENT_SIZE = 500
+
+
+class FetchError(Exception):
+    """帶有錯誤類別的抓取例外"""
+
+    def __init__(self, kind: str, message: str = "", status_code: Optional[int] = None):
+        super().__init__(message or kind)
+        self.kind = kind
+        self.status_code = status_code
+
+
+def is_html_bytes(b: bytes) -> bool:
+    """檢查回應是否為HTML（表示無資料）"""
+    text = b[:500].decode("utf-8", errors="ignore").lower()
+    return any(tag in text for tag in ("<html", "<!doctype", "<head", "<script"))
+
+
+def classify_response(status_code: int, content: bytes, allow_html: bool = False) -> Optional[str]:
+    """分類 HTTP 回應；回傳 None 表示可用資料"""
+    if status_code in (429, 403):
+        return THROTTLED
+    if status_code >= 500:
+        return SERVER_ERROR
+    if status_code >= 400:
+        return CLIENT_ERROR
+    head = content[:2000].decode("utf-8", errors="ignore").lower()
+    if any(marker in head for marker in THROTTLE_MARKERS):
+        return THROTTLED
+    if len(content) <= MIN_CONTENT_SIZE:
+        return NO_DATA
+    if not allow_html and is_html_bytes(content):
+        return NO_DATA
+    return None
+
+
+def classify_exception(exc: BaseException) -> str:
+    """依例外類型名稱分類，避免直接依賴 requests / selenium"""
+    if isinstance(exc, FetchError):
+        return exc.kind
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if names & {"Timeout", "ReadTimeout", "ConnectTimeout", "TimeoutException", "TimeoutError", "timeout"}:
+        return TIMEOUT
+    if names & {"ConnectionError", "SSLError", "ProxyError", "ConnectionResetError", "MaxRetryError"}:
+        return CONNECTION
+    # Selenium 以 WebDriverException 包裝 Chrome 的網路錯誤（net::ERR_CONNECTION_REFUSED 等）
+    if "net::ERR_" in str(exc):
+        return CONNECTION
+    return UNKNOWN
+
+
+class RetryPolicy:
+    """指數退避 + full jitter；被限流時延遲加倍"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 5.0, max_delay: float = 120.0,
+                 multiplier: float = 2.0, throttle_factor: float = 3.0, jitter: bool = True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.throttle_factor = throttle_factor
+        self.jitter = jitter
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any], **defaults) -> "RetryPolicy":
+        """由 settings["retry"] 建立重試策略，未設定的欄位使用 defaults"""
+        params = {**defaults, **settings.get("retry", {})}
+        return cls(**params)
+
+    def should_retry(self, kind: str, attempt: int) -> bool:
+        """attempt 為已完成的嘗試次數（從 1 開始）"""
+        return kind in RETRYABLE and attempt < self.max_attempts
+
+    def delay_for(self, attempt: int, kind: str = UNKNOWN) -> float:
+        """第 attempt 次失敗後的等待秒數"""
+        delay = min(self.base_delay * (self.multiplier ** (attempt - 1)), self.max_delay)
+        if kind == THROTTLED:
+            delay = min(delay * self.throttle_factor, self.max_delay)
+        if self.jitter:
+            delay = random.uniform(delay / 2, delay)
+        return delay
+
+
+class CircuitBreaker:
+    """
+    單一主機的熔斷器（closed → open → half-open）
+    連續失敗達門檻即開啟，所有共用此主機的 worker 在 before_call() 一起等待冷卻；
+    冷卻結束後只放行一個試探請求，其餘 worker 等到試探結果出來（成功關閉 / 失敗重新開啟）
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    PROBE_POLL = 1.0    # half-open 時其他 worker 等待試探結果的輪詢間隔（秒）
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 300.0,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.state = self.CLOSED
+        self.open_count = 0
+
+    def before_call(self) -> None:
+        """熔斷開啟時阻塞直到冷卻結束，之後進入 half-open 只讓一個請求試探"""
+        while True:
+            with self._lock:
+                if self.state == self.CLOSED:
+                    return
+                if self.state == self.HALF_OPEN:
+                    if not self._probing:
+                        # 上一個試探沒有定論（例如非網站問題的錯誤）：由這個請求接手試探
+                        self._probing = True
+                        return
+                    wait = self.PROBE_POLL
+                else:
+                    remaining = self._opened_at + self.reset_timeout - time.time()
+                    if remaining <= 0:
+                        self.state = self.HALF_OPEN
+                        self._probing = True
+                        logging.info(f"[🔌] {self.host} 熔斷冷卻結束，進入 half-open 試探")
+                        return
+                    wait = min(remaining, 30)
+            self._sleep(wait)
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info(f"[🔌] {self.host} 恢復正常，熔斷關閉")
+            self._failures = 0
+            self._probing = False
+            self.state = self.CLOSED
+
+    def record_failure(self, kind: str) -> None:
+        with self._lock:
+            # 試探結束；非網站問題的錯誤不計入熔斷，下一個請求接手試探
+            self._probing = False
+            if kind not in BREAKER_KINDS:
+                return
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.time()
+                self.open_count += 1
+                logging.warning(
+                    f"[🔌] {self.host} 連續失敗 {self._failures} 次，熔斷開啟 {self.reset_timeout:.0f} 秒（所有 worker 暫停）"
+                )
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host: str, **kwargs) -> CircuitBreaker:
+    """取得（或建立）主機共用的熔斷器"""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host, **kwargs)
+        return _breakers[host]
+
+
+class RetryEngine:
+    """
+    執行單一抓取動作：func() 成功回傳結果，失敗丟出例外（建議 FetchError）
+    NO_DATA 視為正常結果，回傳 None 不重試
+    """
+
+    def __init__(self, host: str, policy: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.host = host
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or get_breaker(host)
+        self._sleep = sleep
+        self.stats = {"calls": 0, "attempts": 0, "retries": 0, "no_data": 0, "failures": 0}
+
+    def run(self, func: Callable[[], Any], label: str = "") -> Any:
+        self.stats["calls"] += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            self.stats["attempts"] += 1
+            try:
+                result = func()
+            except Exception as e:
+                kind = classify_exception(e)
+                if kind == NO_DATA:
+                    self.breaker.record_success()
+                    self.stats["no_data"] += 1
+                    return None
+                self.breaker.record_failure(kind)
+                if not self.policy.should_retry(kind, attempt):
+                    self.stats["failures"] += 1
+                    logging.warning(f"[❌] {label} 失敗（{kind}，第 {attempt} 次）：{e}")
+                    raise
+                delay = self.policy.delay_for(attempt, kind)
+                self.stats["retries"] += 1
+                logging.warning(f"[⏳] {label} {kind}（第 {attempt} 次），{delay:.1f} 秒後重試：{e}")
+                self._sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
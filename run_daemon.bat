@@ -0,0 +1,3 @@
+@echo off
+cd /d C:\alldata\updater
+python pipeline_daemon.py
\ No newline at end of file
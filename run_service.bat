@@ -0,0 +1,3 @@
+@echo off
+cd /d C:\alldata\updater
+python cleaned_data_service.py
\ No newline at end of file
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared Frames - 清洗工作行程 → 主行程的零複製資料交棒
+工作行程把清洗結果寫成 Arrow IPC 檔（放在記憶體檔案系統 /dev/shm，沒有時用暫存目錄），
+只把檔名等小型 FrameHandle 回傳給主行程；主行程以 memory map 開啟，
+依資料源把多個日期接成一張 Arrow 表（只串接區塊，不複製資料），不必 pickle 整個 DataFrame；
+主行程再直接在這些表上驗證列數、日期與股票代號（summarize_tables），不重讀清洗檔。
+不用 multiprocessing.shared_memory：Windows 上區段會隨建立者關閉而消失，
+工作行程回傳後主行程不一定來得及附加
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from lazy_imports import lazy_import
+
+pa = lazy_import("pyarrow")
+ipc = lazy_import("pyarrow.ipc")
+pc = lazy_import("pyarrow.compute")
+
+SHM_ROOT = Path("/dev/shm")
+HANDOFF_PREFIX = "sla_handoff_"
+STALE_SECONDS = 24 * 3600    # 前次異常結束遺留的交棒目錄，超過一天就清掉
+
+
+def handoff_root() -> Path:
+    """Linux 用記憶體檔案系統；Windows / macOS 用暫存目錄（由作業系統快取在記憶體）"""
+    if SHM_ROOT.is_dir() and os.access(SHM_ROOT, os.W_OK):
+        return SHM_ROOT
+    return Path(tempfile.gettempdir())
+
+
+class FrameHandle:
+    """工作行程回傳給主行程的資料描述（可 pickle，只有幾十位元組）"""
+
+    def __init__(self, path: str, source: str, date: str, rows: int, nbytes: int):
+        self.path = path
+        self.source = source
+        self.date = date
+        self.rows = rows
+        self.nbytes = nbytes
+
+    def __repr__(self) -> str:
+        return f"FrameHandle({self.source}, {self.date or '多日'}, rows={self.rows})"
+
+
+class HandoffDir:
+    """
+    一次平行清洗使用的交棒目錄；離開時刪除。
+    回傳的 Arrow 表仍以 memory map 參照這些檔案：Linux 上刪除後仍可讀；
+    Windows 上被映射的檔案刪不掉，留到下次執行時依 STALE_SECONDS 清除
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root) if root else handoff_root()
+        self.path: Optional[Path] = None
+
+    def __enter__(self) -> HandoffDir:
+        self._remove_stale()
+        self.path = Path(tempfile.mkdtemp(prefix=HANDOFF_PREFIX, dir=self.root))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def _remove_stale(self) -> None:
+        cutoff = time.time() - STALE_SECONDS
+        for path in self.root.glob(f"{HANDOFF_PREFIX}*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+
+def to_arrow(df) -> pa.Table:
+    """DataFrame → Arrow 表；混合型別的 object 欄位（例如數字與文字並存）轉成字串"""
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        mixed = {c: str for c in df.columns if df[c].dtype == object}
+        return pa.Table.from_pandas(df.astype(mixed), preserve_index=False)
+
+
+def export_frame(df, source: str, date_str: str, directory) -> FrameHandle:
+    """（工作行程）把清洗結果寫成 Arrow IPC 檔；date_str 不為空時加上 date 欄"""
+    table = to_arrow(df)
+    if date_str and "date" not in table.column_names:
+        table = table.append_column("date", pa.array([date_str] * table.num_rows, pa.string()))
+    path = Path(directory) / f"{source}_{date_str or 'batch'}_{uuid.uuid4().hex[:8]}.arrow"
+    with pa.OSFile(str(path), "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return FrameHandle(str(path), source, date_str, table.num_rows, table.nbytes)
+
+
+def open_frame(handle: FrameHandle) -> pa.Table:
+    """（主行程）以 memory map 開啟，不複製資料"""
+    return ipc.open_file(pa.memory_map(handle.path, "r")).read_all()
+
+
+def assemble(handles: Iterable[FrameHandle]) -> Dict[str, pa.Table]:
+    """依資料源把多個日期接成一張表（依日期排序；欄位不同時取聯集並放寬型別）"""
+    by_source: Dict[str, List[FrameHandle]] = {}
+    for handle in handles:
+        by_source.setdefault(handle.source, []).append(handle)
+    tables = {}
+    for source, items in by_source.items():
+        items.sort(key=lambda h: h.date)
+        parts = [open_frame(h) for h in items]
+        tables[source] = pa.concat_tables(parts, promote_options="permissive")
+    return tables
+
+
+def summarize_tables(tables: Dict[str, pa.Table], id_pattern: str = r"^\d{4}$") -> Dict[str, Dict[str, Any]]:
+    """
+    （主行程）在組合好的表上驗證：各資料源的列數、日期數與股票代號不符 id_pattern 的列數。
+    只有標題列的清洗檔不會出現在表中，呼叫端以日期數對照成功清洗的檔案數即可找出
+    """
+    summary = {}
+    for source, table in tables.items():
+        info = {"rows": table.num_rows, "dates": 0, "invalid_ids": 0}
+        if "date" in table.column_names:
+            info["dates"] = len(pc.unique(table["date"]))
+        if "stock_id" in table.column_names:
+            valid = pc.match_substring_regex(pc.cast(table["stock_id"], pa.string()), id_pattern)
+            info["invalid_ids"] = table.num_rows - (pc.sum(pc.fill_null(valid, False)).as_py() or 0)
+        summary[source] = info
+    return summary
+
+
+def chunked(items: Sequence, parts: int) -> List[List]:
+    """平均分成 parts 份（交錯分配，讓各份大小相近）"""
+    parts = max(1, min(parts, len(items)))
+    return [list(items[i::parts]) for i in range(parts)]
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Snapshot Changelog - 少變動名單的逐日差異紀錄
+平盤下得融券賣出名單（exempted）與借券 / 融券限額（sbl）每天都輸出完整清單，
+實際只有少數幾列變動。本模組以 stock_id 為鍵、對每列內容取雜湊，
+與前一交易日比對後只記錄新增 / 移除 / 變更的列（deltas.jsonl），
+每 FULL_EVERY 個交易日另存一份完整清單；任一日期都可由最近的完整清單 + 差異重建
+
+儲存位置：otc_cleaned/changelog/<名單>/
+    full_YYYYMMDD.csv   完整清單
+    deltas.jsonl        每行一個交易日：{"date", "added": [[列]], "changed": [[列]], "removed": [stock_id]}
+    state.json          最新日期、欄位與前一日各列雜湊（比對時不必重讀前一日檔案）
+
+用法：
+    python snapshot_changelog.py                          # 補到最新一天
+    python snapshot_changelog.py --rebuild                # 從頭重建
+    python snapshot_changelog.py --changes exempted --from 20250101 --to 20250131
+    python snapshot_changelog.py --at sbl_limits 20250115  # 重建指定日期的清單
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from lazy_imports import lazy_import
+from market_snapshot import OTC_CLEAN_DIR
+
+pd = lazy_import("pandas")
+
+CHANGELOG_DIR = OTC_CLEAN_DIR / "changelog"
+FULL_EVERY = 20     # 每幾個交易日存一份完整清單（重建時最多套用這麼多筆差異）
+
+# 名單 → 來源清洗檔與要追蹤的欄位（None 表示全部欄位）
+# sbl 的餘額每天都變，只追蹤限額與備註
+CHANGELOGS = {
+    "exempted": {"source": "exempted", "columns": None},
+    "sbl_limits": {"source": "sbl", "columns": ["name", "owz_short_limit", "owz_borrow_next_limit", "remark"]},
+}
+
+ADDED, REMOVED, CHANGED = "added", "removed", "changed"
+
+
+def read_list(path: Path, columns: Optional[List[str]]) -> pd.DataFrame:
+    """讀清洗檔（全部以字串比較，避免浮點表示造成假變動），以 stock_id 為索引"""
+    df = pd.read_csv(path, dtype=str, encoding="utf-8-sig", keep_default_na=False)
+    df["stock_id"] = df["stock_id"].str.strip()
+    df = df.drop_duplicates("stock_id", keep="last").set_index("stock_id").sort_index()
+    if columns is not None:
+        df = df.reindex(columns=columns, fill_value="")
+    return df
+
+
+def row_hashes(df: pd.DataFrame) -> Dict[str, int]:
+    """每列內容的 64 位元雜湊（向量化計算）"""
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    return dict(zip(df.index, (int(h) for h in hashes.to_numpy())))
+
+
+class ChangeLog:
+    """單一名單的差異紀錄"""
+
+    def __init__(self, name: str, directory: Optional[Path] = None):
+        self.name = name
+        self.spec = CHANGELOGS[name]
+        self.dir = Path(directory) if directory else CHANGELOG_DIR / name
+        self.state_path = self.dir / "state.json"
+        self.deltas_path = self.dir / "deltas.jsonl"
+        self.last_date = ""
+        self.last_full = ""
+        self.since_full = 0
+        self.columns: List[str] = []
+        self.hashes: Dict[str, int] = {}
+        self._load()
+
+    # ---- 狀態 ----
+    def _load(self) -> None:
+        if not self.state_path.exists():
+            return
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self.last_date = state["last_date"]
+        self.last_full = state["last_full"]
+        self.since_full = state["since_full"]
+        self.columns = state["columns"]
+        self.hashes = {k: int(v) for k, v in state["hashes"].items()}
+        self._truncate_deltas()
+
+    def _save_state(self) -> None:
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"name": self.name, "last_date": self.last_date, "last_full": self.last_full,
+                       "since_full": self.since_full, "columns": self.columns,
+                       "hashes": {k: str(v) for k, v in self.hashes.items()}}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def _truncate_deltas(self) -> None:
+        """追加差異後、寫入狀態前中斷時，丟掉狀態之後的差異"""
+        if not self.deltas_path.exists():
+            return
+        kept, dropped = [], 0
+        for delta in self._read_deltas():
+            if delta["date"] <= self.last_date:
+                kept.append(delta)
+            else:
+                dropped += 1
+        if dropped:
+            self._write_deltas(kept)
+            logging.warning(f"[變動紀錄] {self.name} 丟棄 {dropped} 筆未完成的差異")
+
+    def _read_deltas(self) -> List[Dict[str, Any]]:
+        if not self.deltas_path.exists():
+            return []
+        with open(self.deltas_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _write_deltas(self, deltas: List[Dict[str, Any]]) -> None:
+        tmp_path = self.deltas_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for delta in deltas:
+                f.write(json.dumps(delta, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.deltas_path)
+
+    def full_path(self, date_str: str) -> Path:
+        return self.dir / f"full_{date_str}.csv"
+
+    def full_dates(self) -> List[str]:
+        return sorted(p.stem[5:] for p in self.dir.glob("full_*.csv"))
+
+    def dates(self) -> List[str]:
+        """有紀錄的交易日（完整清單與差異的聯集）"""
+        return sorted(set(self.full_dates()) | {d["date"] for d in self._read_deltas()})
+
+    # ---- 追加 ----
+    def _write_full(self, date_str: str, df: pd.DataFrame) -> None:
+        path = self.full_path(date_str)
+        tmp_path = path.with_suffix(".tmp")
+        df.reset_index().to_csv(tmp_path, index=False, encoding="utf-8-sig")
+        os.replace(tmp_path, path)
+        self.last_full, self.since_full = date_str, 0
+
+    def append(self, date_str: str, df: pd.DataFrame) -> Dict[str, int]:
+        """加入一個交易日；回傳新增 / 移除 / 變更列數"""
+        if date_str <= self.last_date:
+            raise ValueError(f"{self.name} {date_str} 不晚於最後日期 {self.last_date}，需要 --rebuild")
+        self.dir.mkdir(parents=True, exist_ok=True)
+        hashes = row_hashes(df)
+        counts = {ADDED: 0, REMOVED: 0, CHANGED: 0}
+
+        if not self.last_date or list(df.columns) != self.columns or self.since_full + 1 >= FULL_EVERY:
+            # 第一天、欄位改變或累積夠多差異：存完整清單（同時也記一筆差異，查詢變動時不會漏掉這天）
+            if self.last_date and list(df.columns) == self.columns:
+                counts = self._append_delta(date_str, df, hashes)
+            elif self.last_date:
+                counts = self._append_delta(date_str, df, *self._shared_hashes(df))
+            self._write_full(date_str, df)
+        else:
+            counts = self._append_delta(date_str, df, hashes)
+            self.since_full += 1
+
+        self.columns = list(df.columns)
+        self.hashes = hashes
+        self.last_date = date_str
+        self._save_state()
+        return counts
+
+    def _shared_hashes(self, df: pd.DataFrame) -> tuple:
+        """
+        欄位改變當天：前一日雜湊是以舊欄位計算的，改由重建的前一日清單與今天
+        只取共同欄位重新計算雜湊（沒有共同欄位時只比對新增 / 移除）；回傳 (今天, 前一日)
+        """
+        shared = [c for c in df.columns if c in self.columns]
+        previous = self.reconstruct(self.last_date)
+        if not shared:
+            return dict.fromkeys(df.index, 0), dict.fromkeys(previous.index, 0)
+        return row_hashes(df[shared]), row_hashes(previous[shared])
+
+    def _append_delta(self, date_str: str, df: pd.DataFrame, hashes: Dict[str, int],
+                      previous: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """與前一日比對（previous 預設為狀態中的雜湊），差異列記錄今天欄位的完整內容"""
+        previous = self.hashes if previous is None else previous
+        added = [s for s in hashes if s not in previous]
+        changed = [s for s in hashes if s in previous and hashes[s] != previous[s]]
+        removed = sorted(s for s in previous if s not in hashes)
+        delta = {"date": date_str, ADDED: [[s] + df.loc[s].tolist() for s in added],
+                 CHANGED: [[s] + df.loc[s].tolist() for s in changed], REMOVED: removed}
+        with open(self.deltas_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(delta, ensure_ascii=False) + "\n")
+        return {ADDED: len(added), REMOVED: len(removed), CHANGED: len(changed)}
+
+    # ---- 查詢 ----
+    def reconstruct(self, date_str: str) -> pd.DataFrame:
+        """重建 date_str 當天（非交易日則為之前最近一天）的完整清單"""
+        fulls = [d for d in self.full_dates() if d <= date_str]
+        if not fulls:
+            raise ValueError(f"{self.name} 在 {date_str} 之前沒有資料")
+        base = fulls[-1]
+        df = pd.read_csv(self.full_path(base), dtype=str, encoding="utf-8-sig", keep_default_na=False)
+        rows = {r[0]: r[1:] for r in df.itertuples(index=False, name=None)}
+        columns = list(df.columns[1:])
+        for delta in self._read_deltas():
+            if base < delta["date"] <= date_str:
+                for stock_id in delta[REMOVED]:
+                    rows.pop(stock_id, None)
+                for row in delta[ADDED] + delta[CHANGED]:
+                    rows[row[0]] = tuple(row[1:])
+        result = pd.DataFrame.from_dict(rows, orient="index", columns=columns)
+        result.index.name = "stock_id"
+        return result.sort_index()
+
+    def changes(self, start: str = "00000000", end: str = "99999999",
+                stock_ids: Optional[List[str]] = None) -> pd.DataFrame:
+        """區間內的變動長表：date / stock_id / change / 欄位（移除的列欄位為空）"""
+        wanted = set(stock_ids) if stock_ids else None
+        records = []
+        for delta in self._read_deltas():
+            if not start <= delta["date"] <= end:
+                continue
+            for change in (ADDED, CHANGED):
+                for row in delta[change]:
+                    if wanted is None or row[0] in wanted:
+                        records.append([delta["date"], row[0], change] + row[1:])
+            for stock_id in delta[REMOVED]:
+                if wanted is None or stock_id in wanted:
+                    records.append([delta["date"], stock_id, REMOVED] + [None] * len(self.columns))
+        return pd.DataFrame(records, columns=["date", "stock_id", "change"] + self.columns)
+
+
+# ===== 每日更新 =====
+def source_files(source: str) -> Dict[str, Path]:
+    files = {}
+    for path in OTC_CLEAN_DIR.glob(f"*_{source}.csv"):
+        match = re.match(rf"^(\d{{8}})_{re.escape(source)}\.csv$", path.name)
+        if match:
+            files[match.group(1)] = path
+    return files
+
+
+def update_changelog(name: str, rebuild: bool = False) -> ChangeLog:
+    """把單一名單補到最新一天；早於最後日期的補檔需要 --rebuild"""
+    spec = CHANGELOGS[name]
+    if rebuild:
+        shutil.rmtree(CHANGELOG_DIR / name, ignore_errors=True)
+    log = ChangeLog(name)
+    files = source_files(spec["source"])
+    known = set(log.dates())
+    late = [d for d in files if d < log.last_date and d not in known]
+    if late:
+        logging.warning(f"[變動紀錄] {name} 有 {len(late)} 個早於 {log.last_date} 的新日期，需要 --rebuild")
+    pending = sorted(d for d in files if d > log.last_date)
+    for date_str in pending:
+        counts = log.append(date_str, read_list(files[date_str], spec["columns"]))
+        logging.debug(f"[變動紀錄] {name} {date_str} {counts}")
+    if pending:
+        logging.info(f"[變動紀錄] {name}: +{len(pending)} 天 → {log.last_date}")
+    return log
+
+
+def update_changelogs(rebuild: bool = False) -> Dict[str, str]:
+    """每日流程結尾呼叫；回傳各名單最新日期，失敗不影響主流程"""
+    latest = {}
+    for name in CHANGELOGS:
+        try:
+            latest[name] = update_changelog(name, rebuild).last_date
+        except Exception as e:
+            logging.warning(f"[變動紀錄] {name} 更新失敗：{e}")
+    return latest
+
+
+def arg_value(flag: str, default: str) -> str:
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if "--changes" in sys.argv:
+        name = arg_value("--changes", "exempted")
+        result = ChangeLog(name).changes(arg_value("--from", "00000000"), arg_value("--to", "99999999"))
+        print(result.to_string(index=False) if len(result) else f"[ℹ] {name} 區間內沒有變動")
+        return
+    if "--at" in sys.argv:
+        i = sys.argv.index("--at")
+        print(ChangeLog(sys.argv[i + 1]).reconstruct(sys.argv[i + 2]).to_string())
+        return
+    for name, date_str in update_changelogs(rebuild="--rebuild" in sys.argv).items():
+        print(f"[📊] {name}: {date_str or '尚無資料'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Source Latency - 各資料來源的延遲與成功率歷史
+記錄每個來源最近幾次執行的頁面就緒時間（page_ready）與下載時間（download），
+以 p99 × margin 自動調整逾時（有上下限），並輸出各來源 SLA 統計供效能報告使用
+歷史存在 source_latency.json，跨執行累積
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from otc_common import BASE_DIR
+
+LATENCY_FILE = BASE_DIR / "source_latency.json"
+PHASES = ("page_ready", "download")
+
+DEFAULT_ADAPTIVE = {
+    "enabled": True,
+    "quantile": 0.99,
+    "margin": 1.5,
+    "min_samples": 5,       # 樣本數不足時沿用固定逾時
+    "window": 200,          # 每個來源每個階段保留的樣本數
+    "floor_seconds": 3,
+    "ceiling_seconds": 60,
+}
+
+
+def quantile(samples: List[float], q: float) -> Optional[float]:
+    """最近秩（nearest-rank）分位數"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(q * len(ordered)))
+    return ordered[rank - 1]
+
+
+class SourceLatencyTracker:
+    """
+    各來源延遲追蹤器
+    record() 記錄耗時，record_result() 記錄成敗，timeout_for() 取得自適應逾時
+    """
+
+    def __init__(self, path: Path = LATENCY_FILE, options: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.options = {**DEFAULT_ADAPTIVE, **(options or {})}
+        self.lock = threading.Lock()
+        self.history = self._load()
+        self.run_stats: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any], path: Path = LATENCY_FILE) -> "SourceLatencyTracker":
+        """依 settings["adaptive_timeouts"] 建立"""
+        return cls(path, settings.get("adaptive_timeouts", {}))
+
+    def _load(self) -> Dict[str, Any]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"延遲歷史讀取失敗，重新累積：{e}")
+            return {}
+
+    def _source(self, source: str) -> Dict[str, Any]:
+        entry = self.history.setdefault(source, {"success": [], "updated": None})
+        for phase in PHASES:
+            entry.setdefault(phase, [])
+        return entry
+
+    def record(self, source: str, phase: str, seconds: float) -> None:
+        """記錄一次觀測耗時"""
+        with self.lock:
+            samples = self._source(source)[phase]
+            samples.append(round(seconds, 3))
+            del samples[:-self.options["window"]]
+
+    def record_result(self, source: str, ok: bool) -> None:
+        """記錄一次下載嘗試的成敗"""
+        with self.lock:
+            entry = self._source(source)
+            entry["success"].append(1 if ok else 0)
+            del entry["success"][:-self.options["window"]]
+            entry["updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            stats = self.run_stats.setdefault(source, {"attempts": 0, "success": 0})
+            stats["attempts"] += 1
+            stats["success"] += 1 if ok else 0
+
+    def timeout_for(self, source: str, phase: str, default: float) -> float:
+        """自適應逾時：p99 × margin，限制在 floor ~ ceiling；樣本不足或停用時回傳 default"""
+        if not self.options["enabled"]:
+            return default
+        with self.lock:
+            samples = list(self.history.get(source, {}).get(phase, []))
+        if len(samples) < self.options["min_samples"]:
+            return default
+        value = quantile(samples, self.options["quantile"]) * self.options["margin"]
+        return round(min(max(value, self.options["floor_seconds"]), self.options["ceiling_seconds"]), 1)
+
+    def sla_stats(self, defaults: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """各來源 SLA 統計（供效能報告）"""
+        defaults = defaults or {}
+        report = {}
+        with self.lock:
+            history = {name: {k: list(v) if isinstance(v, list) else v for k, v in entry.items()}
+                       for name, entry in self.history.items()}
+        for source, entry in sorted(history.items()):
+            success = entry.get("success", [])
+            stats = {
+                "samples": len(success),
+                "success_rate": round(sum(success) / len(success), 3) if success else None,
+                "this_run": self.run_stats.get(source, {"attempts": 0, "success": 0}),
+                "updated": entry.get("updated"),
+            }
+            for phase in PHASES:
+                samples = entry.get(phase, [])
+                stats[phase] = {
+                    "samples": len(samples),
+                    "p50": quantile(samples, 0.5),
+                    "p95": quantile(samples, 0.95),
+                    "p99": quantile(samples, 0.99),
+                    "timeout": self.timeout_for(source, phase, defaults.get(phase)),
+                }
+            report[source] = stats
+        return report
+
+    def save(self) -> None:
+        """寫回歷史檔（先寫暫存檔再取代，避免中斷時損毀）"""
+        with self.lock:
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.history, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Source Readiness - 上市資料源就緒檢查（依公布時間）
+取代「往前回溯最多 5 天」的判斷：先依各資料源的公布時間算出應取得的交易日，
+以串流 GET 先讀前幾 KB 探測該日是否已公布（大小 / HTML 判斷），已公布就讀完同一個回應，
+尚未公布時指數退避等待；最後回報拿到的是當天（fresh）還是沿用舊資料（stale）
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from fetch_planner import holidays, is_trading_day
+from retry_engine import NO_DATA, classify_exception, classify_response
+
+# 台灣沒有日光節約時間，固定 UTC+8；主機時區不是台灣時（例如雲端 runner）也能對準公布時間
+TW_TZ = timezone(timedelta(hours=8))
+
+# 證交所各報表的一般公布時間（台灣時間）
+TWSE_PUBLISH_TIMES = {
+    "mi_index": "13:45",
+    "t86": "15:00",
+    "twt44u": "15:00",
+    "twt38u": "15:00",
+    "mi_margn": "21:00",
+}
+
+PROBE_BYTES = 4096         # 探測只讀回應開頭；足以判斷 HTML / 「查詢過於頻繁」/ 過小
+BACKOFF_START = 60         # 未公布時第一次等待秒數，之後加倍
+BACKOFF_MAX = 600
+DEFAULT_MAX_WAIT = 20 * 60  # 過了公布時間仍未出現時最多等多久
+
+FRESH, STALE, ERROR = "fresh", "stale", "error"
+
+
+def now_tw() -> datetime:
+    """台灣時間（naive），與公布時間直接比較"""
+    return datetime.now(TW_TZ).replace(tzinfo=None)
+
+
+def at_time(day: datetime, hhmm: str) -> datetime:
+    hour, minute = (int(x) for x in hhmm.split(":"))
+    return day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+
+def tw_holidays():
+    """國定假日；沒有 holidays 套件時只排除週末"""
+    return holidays.TW() if holidays is not None else None
+
+
+def previous_trading_day(day: datetime, calendar=None) -> datetime:
+    calendar = calendar if calendar is not None else tw_holidays()
+    day -= timedelta(days=1)
+    while not is_trading_day(day, calendar):
+        day -= timedelta(days=1)
+    return day
+
+
+def expected_date(name: str, now: Optional[datetime] = None) -> datetime:
+    """依公布時間，現在應該拿得到的最新交易日"""
+    now = now or now_tw()
+    calendar = tw_holidays()
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    publish = TWSE_PUBLISH_TIMES.get(name, "15:00")
+    if is_trading_day(day, calendar) and now >= at_time(now, publish):
+        return day
+    return previous_trading_day(day, calendar)
+
+
+def read_probe(response, allow_html: bool = False) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    先只讀回應開頭判斷是否已公布；已公布時接著讀完同一個串流回應並回傳完整內容，
+    不必再發第二次完整 GET（httpx 傳輸層不支援串流時直接判斷整個內容）
+    """
+    if not hasattr(response, "iter_content"):
+        content = response.content
+        kind = classify_response(response.status_code, content[:PROBE_BYTES], allow_html=allow_html)
+        return kind, (content if kind is None else None)
+    try:
+        chunks = response.iter_content(PROBE_BYTES)
+        head = next(chunks, b"")
+        kind = classify_response(response.status_code, head, allow_html=allow_html)
+        if kind is not None:
+            return kind, None
+        return None, head + b"".join(chunks)
+    finally:
+        response.close()
+
+
+def probe(session, url: str, referer: str, allow_html: bool = False,
+          timeout: float = 10) -> Tuple[Optional[str], Optional[bytes]]:
+    """探測單一網址；回傳 (錯誤類別, 內容)，錯誤類別為 None 表示已公布且內容為完整檔案（NO_DATA 表示尚未公布）"""
+    try:
+        r = session.get(url, headers={"Referer": referer}, timeout=timeout, stream=True)
+        return read_probe(r, allow_html)
+    except Exception as e:
+        return classify_exception(e), None
+
+
+class Readiness:
+    """單一資料源的就緒結果"""
+
+    def __init__(self, name: str, target: datetime):
+        self.name = name
+        self.target = target
+        self.date_str = target.strftime("%Y%m%d")
+        self.status = STALE
+        self.probes = 0
+        self.waited = 0.0
+        self.last_kind: Optional[str] = None
+        self.content: Optional[bytes] = None  # 已公布時探測順帶讀完的完整內容
+
+    @property
+    def ready(self) -> bool:
+        return self.status == FRESH
+
+    def describe(self) -> str:
+        label = {FRESH: "當日資料", STALE: "尚未公布，沿用舊資料", ERROR: f"探測失敗（{self.last_kind}）"}[self.status]
+        return f"{self.name} {self.date_str}：{label}（探測 {self.probes} 次，等待 {self.waited:.0f} 秒）"
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"name": self.name, "date": self.date_str, "status": self.status,
+                "probes": self.probes, "waited": round(self.waited, 1)}
+
+
+def wait_until_ready(session, name: str, url_func: Callable[[datetime], str], referer: str,
+                     allow_html: bool = False, max_wait: float = DEFAULT_MAX_WAIT,
+                     now: Optional[datetime] = None) -> Readiness:
+    """
+    探測 expected_date(name) 是否已公布；未公布則退避重探，直到 max_wait 用完。
+    網站異常（非「無資料」）時不等待，直接回報 ERROR 交給呼叫端處理
+    """
+    result = Readiness(name, expected_date(name, now))
+    url = url_func(result.target)
+    delay = BACKOFF_START
+    started = time.time()
+    while True:
+        result.probes += 1
+        kind, content = probe(session, url, referer, allow_html)
+        result.last_kind = kind
+        if kind is None:
+            result.status = FRESH
+            result.content = content
+            break
+        if kind != NO_DATA:
+            result.status = ERROR
+            break
+        elapsed = time.time() - started
+        if elapsed + delay > max_wait:
+            result.status = STALE
+            break
+        logging.info(f"[就緒] {name} {result.date_str} 尚未公布，{delay} 秒後再探測")
+        time.sleep(delay)
+        delay = min(delay * 2, BACKOFF_MAX)
+    result.waited = time.time() - started
+    return result
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Structured Logging - 結構化日誌（JSON lines + 非阻塞佇列 + 取樣 + span 計時）
+長時間回補時，每檔案 / 每任務的日誌 I/O 不再拖慢主流程：
+  - 呼叫端只把紀錄丟進佇列（QueueHandler），檔案 / 控制台輸出在背景執行緒（QueueListener）
+  - 日誌檔每行一個 JSON 物件，可直接以 pandas / jq 分析
+  - 依階段（stage）取樣：高頻的逐檔訊息只保留每 N 筆一筆；WARNING 以上與 span 摘要一律保留
+  - 被取樣掉的紀錄不會格式化訊息（請用 logging.info("… %s", x) 形式，不要 f-string）
+  - span("clean", source=..., date=...)：量測區塊耗時，結束時輸出一筆含 duration_ms 的紀錄；
+    區塊內的所有紀錄自動帶上 stage / source / date 欄位
+
+用法：
+    from structured_logging import span
+    with span("clean", source="sbl", date="20250102") as fields:
+        ...
+        fields["rows"] = len(df)
+
+    設定 SLA_LOG_JSON=1（或 setup_logging(..., structured=True)）啟用
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+ENV_FLAG = "SLA_LOG_JSON"
+
+# 各階段取樣比例（保留每 N 筆中的 1 筆）；未列出的階段不取樣
+DEFAULT_SAMPLING = {
+    "clean": 20,
+    "download": 5,
+}
+
+# LogRecord 內建屬性；其餘屬性（extra= 或 span 欄位）都輸出到 JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def structured_enabled() -> bool:
+    return os.environ.get(ENV_FLAG, "").lower() in ("1", "true", "yes", "json")
+
+
+# ===== 格式 =====
+class JsonFormatter(logging.Formatter):
+    """每筆紀錄一行 JSON：ts / level / logger / msg，再加上 extra 與 span 欄位"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage().strip(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# ===== 呼叫端的過濾（在呼叫執行緒執行，決定是否值得放進佇列）=====
+class ContextFilter(logging.Filter):
+    """把目前 span 的欄位（stage / source / date …）附加到紀錄上"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """依 stage 每 N 筆保留 1 筆；WARNING 以上與 span 摘要不取樣"""
+
+    def __init__(self, sampling: Optional[Dict[str, int]] = None):
+        super().__init__()
+        self.sampling = dict(DEFAULT_SAMPLING if sampling is None else sampling)
+        self.counts: Dict[str, int] = {}
+        self.dropped: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or getattr(record, "span", False):
+            return True
+        stage = getattr(record, "stage", None)
+        every = self.sampling.get(stage, 1)
+        if every <= 1:
+            return True
+        with self.lock:
+            count = self.counts.get(stage, 0)
+            self.counts[stage] = count + 1
+            if count % every == 0:
+                return True
+            self.dropped[stage] = self.dropped.get(stage, 0) + 1
+            return False
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    通過過濾後才格式化訊息（被取樣掉的紀錄完全不格式化）；
+    保留 extra 欄位，並且不把 args 丟進佇列（args 可能很大）
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# ===== 設定 =====
+def setup_structured_logging(log_path: Path, level: int = logging.INFO, console: bool = True,
+                             sampling: Optional[Dict[str, int]] = None) -> logging.handlers.QueueListener:
+    """
+    根 logger 只掛一個 QueueHandler；JSON 檔案與控制台輸出由背景 listener 處理。
+    程式結束時自動 flush（atexit）
+    """
+    global _listener
+    stop_listener()
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    file_handler = logging.FileHandler(log_path, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        # 控制台維持原本的人類可讀格式
+        console_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s",
+                                                       datefmt="%Y-%m-%d %H:%M:%S"))
+        # span 摘要只寫入 JSON 檔，控制台不顯示
+        console_handler.addFilter(lambda record: not getattr(record, "span", False))
+        handlers.append(console_handler)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_listener)
+    return _listener
+
+
+def stop_listener() -> None:
+    """送出佇列中剩餘的紀錄並關閉輸出"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def sampling_report() -> Dict[str, int]:
+    """各階段被取樣掉的紀錄數"""
+    for handler in logging.getLogger().handlers:
+        for f in handler.filters:
+            if isinstance(f, SamplingFilter):
+                with f.lock:
+                    return dict(f.dropped)
+    return {}
+
+
+# ===== span =====
+@contextmanager
+def span(stage: str, logger: Optional[logging.Logger] = None, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """
+    量測一個 (stage, source, date …) 任務；區塊內的紀錄自動帶上這些欄位。
+    回傳的 dict 可在區塊內加欄位（例如 rows），結束時一併輸出。
+    未啟用結構化日誌時只維護 context，摘要紀錄以 DEBUG 輸出，不增加一般日誌量
+    """
+    logger = logger or logging.getLogger()
+    extra = dict(fields)
+    token = _context.set({**_context.get(), "stage": stage, **fields})
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield extra
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _context.reset(token)
+        extra.update(stage=stage, span=True, status=extra.get("status", status),
+                     duration_ms=round((time.perf_counter() - started) * 1000, 2))
+        level = logging.INFO if _listener is not None else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(level, "[span] %s %s", stage, extra.get("status"), extra=extra)
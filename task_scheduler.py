@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Task Scheduler - (資料項目, 日期) 任務排程器
+取代「外層日期、內層項目」的雙重迴圈，讓模型最先需要的資料最先落地
+支援排序策略、截止時間（deadline）與重試任務的降級（不阻塞新任務）
+"""
+
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+
+# 支援的排序策略
+ORDERINGS = ("priority_first", "newest_first", "oldest_first")
+
+# 任務類別：數字越小越先執行
+CLASS_DEADLINE = 0   # 有截止時間且尚未逾期
+CLASS_NORMAL = 1     # 一般首次嘗試
+CLASS_RETRY = 2      # 重試任務（長尾），讓位給新任務
+
+
+class DownloadTask:
+    """單一 (項目, 日期) 下載任務"""
+
+    def __init__(self, name: str, config: Dict[str, Any], date_obj: datetime):
+        self.name = name
+        self.config = config
+        self.date_obj = date_obj
+        self.date_str = date_obj.strftime("%Y%m%d")
+        self.priority = config.get("priority", 999)
+        self.deadline: Optional[datetime] = None
+        self.attempts = 0
+        self.not_before = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        """與原始檔名一致的任務鍵值：YYYYMMDD_name"""
+        return f"{self.date_str}_{self.name}"
+
+    def __repr__(self) -> str:
+        return f"DownloadTask({self.key}, priority={self.priority}, attempts={self.attempts})"
+
+
+def parse_deadline(by: str, now: Optional[datetime] = None) -> datetime:
+    """將 "HH:MM" 或 ISO 時間字串轉為下一個到期時間"""
+    now = now or datetime.now()
+    if len(by) <= 5 and ":" in by:
+        hour, minute = (int(x) for x in by.split(":"))
+        deadline = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if deadline <= now:
+            deadline += timedelta(days=1)
+        return deadline
+    return datetime.fromisoformat(by)
+
+
+class TaskScheduler:
+    """
+    以 heap 排序的下載任務排程器
+
+    排序鍵：(任務類別, 截止時間, 策略鍵, 嘗試次數)
+    - priority_first：先依 priority，再由新到舊
+    - newest_first：先由新到舊，再依 priority
+    - oldest_first：由舊到新（等同原本的逐日迴圈）
+    """
+
+    def __init__(self, ordering: str = "priority_first",
+                 deadlines: Optional[List[Dict[str, Any]]] = None,
+                 max_attempts: int = 2, retry_delay: float = 30.0):
+        if ordering not in ORDERINGS:
+            raise ValueError(f"未知的排序策略: {ordering}（可用: {', '.join(ORDERINGS)}）")
+        self.ordering = ordering
+        self.deadline_rules = deadlines or []
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._heap: List[Tuple] = []
+        self._counter = itertools.count()
+        self.done: List[DownloadTask] = []
+        self.failed: List[DownloadTask] = []
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any], max_attempts: int, retry_delay: float) -> "TaskScheduler":
+        """由 config["settings"] 建立排程器"""
+        schedule = settings.get("schedule", {})
+        return cls(
+            ordering=schedule.get("ordering", "priority_first"),
+            deadlines=schedule.get("deadlines", []),
+            max_attempts=schedule.get("max_attempts", max_attempts),
+            retry_delay=schedule.get("retry_delay", retry_delay),
+        )
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def build(self, items: Iterable[Tuple[str, Dict[str, Any]]], dates: List[datetime],
+              existing: Optional[set] = None) -> int:
+        """建立 (項目 × 日期) 任務，略過已存在的檔案，回傳略過數量"""
+        existing = existing or set()
+        items = list(items)
+        skipped = 0
+        for name, config in items:
+            for date_obj in dates:
+                task = DownloadTask(name, config, date_obj)
+                if task.key in existing:
+                    skipped += 1
+                    continue
+                self.push(task)
+        self._apply_deadlines(dates)
+        return skipped
+
+    def _apply_deadlines(self, dates: List[datetime]) -> None:
+        """依截止規則標記任務，例如最近 20 個交易日的 daily_close 須在 09:00 前完成"""
+        if not self.deadline_rules:
+            return
+        now = datetime.now()
+        recent_dates = sorted(dates, reverse=True)
+        tasks = [entry[-1] for entry in self._heap]
+        for rule in self.deadline_rules:
+            deadline = parse_deadline(rule["by"], now)
+            covered = {d.strftime("%Y%m%d") for d in recent_dates[:rule.get("last_n_dates", len(dates))]}
+            for task in tasks:
+                if task.name == rule["item"] and task.date_str in covered:
+                    if task.deadline is None or deadline < task.deadline:
+                        task.deadline = deadline
+            logging.info(f"截止規則: {rule['item']} 最近 {len(covered)} 日須於 {deadline.strftime('%Y-%m-%d %H:%M')} 前完成")
+        self._reheapify()
+
+    def _sort_key(self, task: DownloadTask) -> Tuple:
+        if task.deadline is not None and datetime.now() < task.deadline:
+            task_class = CLASS_DEADLINE
+            deadline_ts = task.deadline.timestamp()
+        else:
+            task_class = CLASS_RETRY if task.attempts > 0 else CLASS_NORMAL
+            deadline_ts = float("inf")
+
+        date_ord = task.date_obj.toordinal()
+        if self.ordering == "priority_first":
+            order_key = (task.priority, -date_ord)
+        elif self.ordering == "newest_first":
+            order_key = (-date_ord, task.priority)
+        else:
+            order_key = (date_ord, task.priority)
+        return (task_class, deadline_ts, order_key, task.attempts)
+
+    def _reheapify(self) -> None:
+        tasks = [entry[-1] for entry in self._heap]
+        self._heap = []
+        for task in tasks:
+            self.push(task)
+
+    def push(self, task: DownloadTask) -> None:
+        heapq.heappush(self._heap, (self._sort_key(task), next(self._counter), task))
+
+    def next_task(self) -> Optional[DownloadTask]:
+        """
+        取出下一個任務；若最前面是尚未到重試時間的任務，
+        優先取出其他可執行任務，全部都在等待時才睡到最早的重試時間
+        """
+        if not self._heap:
+            return None
+
+        now = time.time()
+        waiting = []
+        task = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if entry[-1].not_before <= now:
+                task = entry[-1]
+                break
+            waiting.append(entry)
+
+        for entry in waiting:
+            heapq.heappush(self._heap, entry)
+
+        if task is None:
+            earliest = min(entry[-1].not_before for entry in self._heap)
+            wait = max(earliest - now, 0)
+            logging.info(f"[⏳] 僅剩重試任務，等待 {wait:.1f} 秒...")
+            time.sleep(wait)
+            return self.next_task()
+
+        # 截止時間已過：降級為一般任務並提出警告
+        if task.deadline is not None and datetime.now() >= task.deadline:
+            logging.warning(f"任務 {task.key} 已超過截止時間 {task.deadline.strftime('%H:%M')}")
+            task.deadline = None
+        return task
+
+    def mark_done(self, task: DownloadTask) -> None:
+        task.attempts += 1
+        self.done.append(task)
+
+    def mark_failed(self, task: DownloadTask, error: Optional[str] = None,
+                    retry_delay: Optional[float] = None, retryable: bool = True) -> bool:
+        """記錄失敗；可重試且尚有額度時以較低順位重新排入，回傳是否重新排入"""
+        task.attempts += 1
+        task.last_error = error
+        if retryable and task.attempts < self.max_attempts:
+            delay = self.retry_delay if retry_delay is None else retry_delay
+            task.not_before = time.time() + delay
+            self.push(task)
+            return True
+        self.failed.append(task)
+        return False
+
+    def deadline_report(self) -> Dict[str, int]:
+        """統計仍帶有截止時間、尚未完成的任務數"""
+        pending = sum(1 for entry in self._heap if entry[-1].deadline is not None)
+        return {"pending_deadline_tasks": pending}
@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pytest
+
+import fetch_planner
+import historical_tse_batch_downloader as twse_hist
+from fetch_planner import BulkVariant, build_fetch_plan, plan_summary, register_bulk_variant
+
+HEADER = "證券代號,證券名稱,融資買進\n"
+DAYS = ["20241128", "20241129", "20241202", "20241203"]
+
+
+def day_rows(date_str):
+    return "".join(f"{1101 + i},股票{i},{date_str[-2:]}{i}\n" for i in range(40))
+
+
+def split_monthly(content):
+    """替身月份變體：每行開頭是日期，切回與單日 CSV 相同格式的逐日原始檔"""
+    per_date = {}
+    for line in content.decode("utf-8").splitlines()[1:]:
+        date_str, row = line.split(",", 1)
+        per_date.setdefault(date_str, HEADER)
+        per_date[date_str] += row + "\n"
+    return {d: body.encode("utf-8") for d, body in per_date.items()}
+
+
+def monthly_body(dates):
+    return ("日期," + HEADER + "".join(
+        "".join(f"{d},{row}\n" for row in day_rows(d).splitlines()) for d in dates
+    )).encode("utf-8")
+
+
+class FakeResponse:
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+
+class FakeSession:
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.urls = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.urls.append(url)
+        return FakeResponse(self.bodies[url])
+
+
+@pytest.fixture
+def variant(monkeypatch):
+    monkeypatch.setattr(fetch_planner, "BULK_VARIANTS", {})
+    v = BulkVariant(lambda start, end: f"http://twse.test/MI_MARGN?month={start:%Y%m}",
+                    split_monthly, span="month")
+    register_bulk_variant("mi_margn", v)
+    return v
+
+
+def test_plan_groups_bulk_source_by_month(variant):
+    dates = [datetime(2024, 11, 28), datetime(2024, 11, 29), datetime(2024, 11, 30),
+             datetime(2024, 12, 1), datetime(2024, 12, 2), datetime(2024, 12, 3)]
+    plan = build_fetch_plan(["mi_margn", "t86"], dates, existing={"20241202_t86"})
+
+    bulk = [r for r in plan if r.is_bulk]
+    assert [[d.strftime("%Y%m%d") for d in r.dates] for r in bulk] == [DAYS[:2], DAYS[2:]]
+    assert [r.url for r in bulk] == ["http://twse.test/MI_MARGN?month=202411",
+                                     "http://twse.test/MI_MARGN?month=202412"]
+    daily = [r.dates[0].strftime("%Y%m%d") for r in plan if not r.is_bulk]
+    assert daily == ["20241128", "20241129", "20241203"]
+    assert plan_summary(plan) == {"requests": 5, "bulk_requests": 2,
+                                  "covered_pairs": 7, "saved_requests": 2}
+
+
+def test_split_matches_single_day_csv(variant):
+    per_date = variant.split(monthly_body(DAYS[:2]))
+    assert sorted(per_date) == DAYS[:2]
+    assert per_date["20241129"] == (HEADER + day_rows("20241129")).encode("utf-8")
+
+
+def test_download_bulk_writes_one_raw_file_per_date(variant, tmp_path, monkeypatch):
+    monkeypatch.setattr(twse_hist, "RAW_DIR", str(tmp_path))
+    req = build_fetch_plan(["mi_margn"], [datetime(2024, 11, 28), datetime(2024, 11, 29)])[0]
+    # 月份回應只涵蓋其中一天：另一天計為失敗，不寫出空檔
+    session = FakeSession({req.url: monthly_body(["20241129"])})
+
+    assert twse_hist.download_bulk(session, req) == (1, 1)
+    assert session.urls == [req.url]
+    assert sorted(p.name for p in tmp_path.glob("*.csv")) == ["20241129_mi_margn.csv"]
+    assert (tmp_path / "20241129_mi_margn.csv").read_bytes() == (HEADER + day_rows("20241129")).encode("utf-8")
+    assert twse_hist.get_catalog(str(tmp_path)).has("mi_margn", "20241129")
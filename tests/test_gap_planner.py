@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+import gap_planner
+import market_snapshot
+from gap_planner import (
+    CLEAN_EMPTY, CLEAN_FAILED, CLEAN_STALE, CLEAN_UNDATED, EMPTY, HTML, MISSING,
+)
+
+T0 = 1_700_000_000
+ROWS = "stock_id,close\n" + "".join(f"{1101 + i},{10 + i}\n" for i in range(60))
+RAW = ("證券代號,收盤價\n" + "".join(f"{1101 + i},{10 + i}\n" for i in range(60))).encode("utf-8")
+
+
+def write(path, content, mtime):
+    path.write_bytes(content if isinstance(content, bytes) else content.encode("utf-8"))
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    raw, cleaned = tmp_path / "raw", tmp_path / "cleaned"
+    raw.mkdir()
+    cleaned.mkdir()
+    monkeypatch.setitem(gap_planner.ARCHIVES["TWSE"], "raw", str(raw))
+    monkeypatch.setattr(gap_planner, "TWSE_CLEANED_DIR", str(cleaned))
+    monkeypatch.setattr(market_snapshot, "TWSE_CLEANED_DIR", str(cleaned))
+    monkeypatch.setattr(gap_planner, "LOG_DIR", tmp_path / "logs")
+    return raw, cleaned
+
+
+def test_find_gaps_classifies_each_day(archive):
+    raw, cleaned = archive
+    # 20241014 沒有原始檔
+    write(raw / "20241015_mi_index.csv", b"", T0)
+    write(raw / "20241016_mi_index.csv", b"<!DOCTYPE html><html>" + b" " * 1000, T0)
+    write(raw / "20241017_mi_index.csv", RAW, T0)        # 只有舊版每日更新的不帶日期清洗檔
+    write(raw / "20241018_mi_index.csv", RAW, T0)
+    write(cleaned / "20241018_cleaned_mi_index.csv", ROWS, T0 + 10)
+    write(raw / "20241021_mi_index.csv", RAW, T0 + 20)    # 原始檔重抓後未重新清洗
+    write(cleaned / "20241021_cleaned_mi_index.csv", ROWS, T0 + 10)
+    write(raw / "20241022_mi_index.csv", RAW, T0)
+    write(cleaned / "20241022_cleaned_mi_index.csv", "stock_id,close\n", T0 + 10)
+    write(raw / "20241023_mi_index.csv", RAW, T0 + 200)   # 比不帶日期的清洗檔還新：清洗失敗
+    write(cleaned / "cleaned_mi_index.csv", ROWS, T0 + 100)
+
+    gaps = [g for g in gap_planner.find_gaps("20241014", "20241023", ["TWSE"]) if g.source == "mi_index"]
+    statuses = {g.date: g.status for g in gaps}
+    assert statuses == {
+        "20241014": MISSING,
+        "20241015": EMPTY,
+        "20241016": HTML,
+        "20241017": CLEAN_UNDATED,
+        "20241021": CLEAN_STALE,
+        "20241022": CLEAN_EMPTY,
+        "20241023": CLEAN_FAILED,
+    }
+    assert {g.date for g in gaps if g.needs_fetch} == {"20241014", "20241015", "20241016"}
+
+
+def test_plan_splits_fetch_and_clean(archive):
+    raw, cleaned = archive
+    write(raw / "20241017_mi_index.csv", RAW, T0)
+    gaps = [g for g in gap_planner.find_gaps("20241016", "20241017", ["TWSE"]) if g.source == "mi_index"]
+    plan = gap_planner.build_plan(gaps, "20241016", "20241017")
+    assert plan["fetch"][0]["dates"] == ["20241016"]
+    assert plan["clean"][0]["dates"] == ["20241017"]
+
+
+def test_quarantine_moves_bad_raw_out_of_the_index(archive):
+    raw, _ = archive
+    write(raw / "20241016_mi_index.csv", b"<html></html>" + b" " * 1000, T0)
+    gaps = gap_planner.find_gaps("20241016", "20241016", ["TWSE"])
+    gap_planner.quarantine(gaps)
+    assert (raw / "20241016_mi_index.csv.bad").exists()
+    assert not gap_planner.get_catalog(str(raw)).has("mi_index", "20241016")
@@ -0,0 +1,83 @@
+import logging
+
+import pandas as pd
+import pytest
+
+import margin_series
+from margin_series import FIELDS, MarginSeries
+
+
+def day_frame(rows):
+    """rows: {stock_id: (融資前日餘額, 融資今日餘額, 融券前日餘額, 融券今日餘額)}"""
+    records = []
+    for stock_id, (mt_prev, mt, st_prev, st) in rows.items():
+        records.append({"stock_id": stock_id, "mt_prev_balance": mt_prev, "mt_balance": mt, "mt_limit": 1000,
+                        "mt_usage_rate": mt / 10, "st_prev_balance": st_prev, "st_balance": st,
+                        "st_limit": 1000, "st_usage_rate": st / 10})
+    return pd.DataFrame(records, columns=["stock_id"] + list(FIELDS))
+
+
+@pytest.fixture
+def series(tmp_path):
+    return MarginSeries("TWSE", directory=tmp_path / "series")
+
+
+def test_append_and_query_round_trip(series, tmp_path):
+    assert series.append("20241015", day_frame({"2330": (0, 100, 0, 10), "1101": (0, 50, 0, 5)})) == []
+    assert series.append("20241016", day_frame({"2330": (100, 120, 10, 8), "6488": (0, 30, 0, 0)})) == []
+
+    reopened = MarginSeries("TWSE", directory=tmp_path / "series")
+    assert reopened.dates == ["20241015", "20241016"]
+    result = reopened.query(["2330"])
+    assert result["date"].tolist() == ["20241015", "20241016"]
+    assert result["mt_balance"].tolist() == [100, 120]
+    assert result["st_balance"].tolist() == [10, 8]
+
+    last_day = reopened.query(start="20241016", fields=["mt_balance"])
+    assert sorted(last_day["stock_id"]) == ["2330", "6488"]
+    assert list(last_day.columns) == ["date", "stock_id", "mt_balance"]
+    assert reopened.query(start="20250101").empty
+    assert reopened.balance_matrix().loc["20241016", "6488"] == 30
+
+
+def test_reconcile_reports_prev_balance_mismatches(series):
+    series.append("20241015", day_frame({"2330": (0, 100, 0, 10), "1101": (0, 50, 0, 5)}))
+    # 1101 融券前日餘額應為 5；6488 前一天沒有資料，不核對
+    mismatches = series.append("20241016", day_frame({
+        "2330": (100, 110, 10, 10), "1101": (50, 50, 4, 4), "6488": (7, 7, 0, 0)}))
+    assert mismatches == ["1101"]
+    assert series.days[-1]["mismatches"] == 1
+
+
+def test_append_rejects_dates_not_after_last(series):
+    series.append("20241016", day_frame({"2330": (0, 100, 0, 10)}))
+    with pytest.raises(ValueError):
+        series.append("20241015", day_frame({"2330": (0, 100, 0, 10)}))
+
+
+def test_interrupted_append_is_truncated_on_load(series, tmp_path):
+    series.append("20241015", day_frame({"2330": (0, 100, 0, 10)}))
+    with open(series._column_path("mt_balance"), "ab") as f:
+        f.write(b"\0" * 8)     # 欄位檔寫了、索引還沒更新
+    reopened = MarginSeries("TWSE", directory=tmp_path / "series")
+    assert reopened._column_path("mt_balance").stat().st_size == 8
+    assert reopened.query()["mt_balance"].tolist() == [100]
+
+
+def test_update_warns_about_days_before_last_date(tmp_path, monkeypatch, caplog):
+    directory = tmp_path / "series"
+    monkeypatch.setattr(margin_series, "series_dir", lambda exchange: directory)
+    days = {"20241015": {"2330": (0, 100, 0, 10)}, "20241017": {"2330": (100, 90, 10, 10)}}
+    monkeypatch.setattr(margin_series, "available_days", lambda exchange: sorted(days.items()))
+    monkeypatch.setattr(margin_series, "read_twse_margin", day_frame)
+    assert margin_series.update_margin_series("TWSE") == {"TWSE": "20241017"}
+
+    # 事後補進較早的日期：不寫入，提示 --rebuild
+    days["20241016"] = {"2330": (100, 95, 10, 10)}
+    with caplog.at_level(logging.WARNING):
+        margin_series.update_margin_series("TWSE")
+    assert "--rebuild" in caplog.text and "20241016" in caplog.text
+    assert MarginSeries("TWSE", directory=directory).dates == ["20241015", "20241017"]
+
+    margin_series.update_margin_series("TWSE", rebuild=True)
+    assert MarginSeries("TWSE", directory=directory).dates == ["20241015", "20241016", "20241017"]
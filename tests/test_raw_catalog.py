@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from raw_catalog import FileCatalog, parse_filename
+
+
+@pytest.fixture
+def raw_dir(tmp_path):
+    root = tmp_path / "raw"
+    root.mkdir()
+    return root
+
+
+def make_catalog(raw_dir, tmp_path):
+    return FileCatalog(str(raw_dir), db_path=str(tmp_path / "catalog.sqlite3"))
+
+
+def write(catalog, path, content):
+    with catalog.writing():
+        path.write_bytes(content)
+        catalog.record(path, content)
+
+
+def test_parse_filename():
+    assert parse_filename("20241016_t86.csv") == ("20241016", "t86")
+    assert parse_filename("20241016_MI_MARGN.csv") == ("20241016", "mi_margn")
+    assert parse_filename("otc_20241016_cleaned.csv") == ("20241016", "otc_cleaned")
+    assert parse_filename("catalog.sqlite3") is None
+    assert parse_filename("notes.csv") is None
+
+
+def test_initial_sync_indexes_existing_files(raw_dir, tmp_path):
+    (raw_dir / "20241015_t86.csv").write_bytes(b"a")
+    (raw_dir / "20241016_t86.csv").write_bytes(b"b")
+    (raw_dir / "20241016_mi_index.csv").write_bytes(b"c")
+    (raw_dir / "readme.txt").write_bytes(b"x")
+    catalog = make_catalog(raw_dir, tmp_path)
+    assert catalog.dates() == ["20241015", "20241016"]
+    assert catalog.latest("t86") == str(raw_dir / "20241016_t86.csv")
+    assert catalog.has("mi_index", "20241016") and not catalog.has("mi_index", "20241015")
+    assert catalog.keys() == {"20241015_t86", "20241016_t86", "20241016_mi_index"}
+    assert [d for d, _ in catalog.range("t86", "20241016")] == ["20241016"]
+
+
+def test_record_and_remove_keep_directory_synced(raw_dir, tmp_path):
+    catalog = make_catalog(raw_dir, tmp_path)
+    path = raw_dir / "20241016_t86.csv"
+    write(catalog, path, b"data")
+    assert catalog.latest("t86") == str(path)
+    # 自己的寫入已推進目錄 mtime：重新開啟不需完整掃描，結果一致
+    reopened = make_catalog(raw_dir, tmp_path)
+    assert reopened.sync() == {"added": 0, "updated": 0, "removed": 0}
+    assert reopened.latest("t86") == str(path)
+
+    with catalog.writing():
+        os.remove(path)
+        catalog.remove(path)
+    assert catalog.latest("t86") is None
+    assert make_catalog(raw_dir, tmp_path).latest("t86") is None
+
+
+def test_external_changes_are_picked_up_by_next_sync(raw_dir, tmp_path):
+    catalog = make_catalog(raw_dir, tmp_path)
+    write(catalog, raw_dir / "20241015_t86.csv", b"a")
+    # 其他程序新增與刪除的檔案
+    (raw_dir / "20241016_t86.csv").write_bytes(b"b")
+    os.remove(raw_dir / "20241015_t86.csv")
+    assert catalog.sync() == {"added": 1, "updated": 0, "removed": 1}
+    assert catalog.dates("t86") == ["20241016"]
+    # 共用同一個索引檔的其他程序不必再掃描
+    assert make_catalog(raw_dir, tmp_path).dates("t86") == ["20241016"]
+
+
+def test_write_after_external_change_does_not_hide_it(raw_dir, tmp_path):
+    catalog = make_catalog(raw_dir, tmp_path)
+    (raw_dir / "20241014_t86.csv").write_bytes(b"external")
+    write(catalog, raw_dir / "20241015_t86.csv", b"own")
+    # 寫入前目錄已被改過：不推進，下一次 sync 仍會完整掃描並找到外部檔案
+    assert catalog.sync()["added"] == 1
+    assert catalog.dates("t86") == ["20241014", "20241015"]
+
+
+def test_force_sync_rehashes_overwritten_files(raw_dir, tmp_path):
+    path = raw_dir / "20241016_t86.csv"
+    path.write_bytes(b"old")
+    catalog = make_catalog(raw_dir, tmp_path)
+    before = catalog.entries("t86")[0]["sha1"]
+    path.write_bytes(b"new content")
+    assert catalog.sync() == {"added": 0, "updated": 0, "removed": 0}
+    assert catalog.sync(force=True)["updated"] == 1
+    assert catalog.entries("t86")[0]["sha1"] != before
@@ -0,0 +1,110 @@
+import pytest
+
+from retry_engine import (
+    CLIENT_ERROR, NO_DATA, SERVER_ERROR, THROTTLED, TIMEOUT,
+    CircuitBreaker, FetchError, RetryEngine, RetryPolicy, classify_exception, classify_response,
+)
+
+
+def open_breaker(sleep, reset_timeout=0.0):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=reset_timeout, sleep=sleep)
+    breaker.record_failure(TIMEOUT)
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+
+def test_half_open_lets_one_probe_through_and_others_wait_for_its_result():
+    sleeps = []
+    breaker = open_breaker(lambda s: (sleeps.append(s), breaker.record_success()))
+    breaker.before_call()           # 冷卻結束：第一個請求成為試探
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()           # 第二個請求等待，直到試探成功關閉熔斷
+    assert sleeps == [CircuitBreaker.PROBE_POLL]
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    sleeps = []
+    breaker = open_breaker(lambda s: (sleeps.append(s), breaker.record_failure(SERVER_ERROR)))
+    breaker.before_call()
+    breaker.before_call()           # 試探失敗重新開啟；冷卻為 0，這個請求成為新的試探
+    assert sleeps == [CircuitBreaker.PROBE_POLL]
+    assert breaker.open_count == 2
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_probe_with_non_site_error_hands_probing_to_next_request():
+    breaker = open_breaker(lambda s: pytest.fail("不應等待"))
+    breaker.before_call()
+    breaker.record_failure(CLIENT_ERROR)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()           # 不等待，直接接手試探
+
+
+def test_classify_response():
+    body = b"a" * 1000
+    assert classify_response(200, body) is None
+    assert classify_response(429, body) == THROTTLED
+    assert classify_response(503, body) == SERVER_ERROR
+    assert classify_response(404, body) == CLIENT_ERROR
+    assert classify_response(200, b"short") == NO_DATA
+    html = b"<!DOCTYPE html><html>" + b" " * 1000
+    assert classify_response(200, html) == NO_DATA
+    assert classify_response(200, html, allow_html=True) is None
+    assert classify_response(200, "查詢過於頻繁".encode("utf-8") + body) == THROTTLED
+
+
+def test_classify_exception_by_type_name():
+    class ReadTimeout(Exception):
+        pass
+
+    assert classify_exception(ReadTimeout()) == TIMEOUT
+    assert classify_exception(FetchError(NO_DATA)) == NO_DATA
+    assert classify_exception(RuntimeError("net::ERR_CONNECTION_REFUSED")) == "connection"
+
+
+def make_engine():
+    sleeps = []
+    breaker = CircuitBreaker("test", failure_threshold=10, sleep=sleeps.append)
+    engine = RetryEngine("test", RetryPolicy(max_attempts=3, base_delay=1, jitter=False),
+                         breaker=breaker, sleep=sleeps.append)
+    return engine, sleeps
+
+
+def test_no_data_returns_none_without_retry():
+    engine, sleeps = make_engine()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise FetchError(NO_DATA, "html")
+
+    assert engine.run(fetch) is None
+    assert len(calls) == 1 and sleeps == []
+    assert engine.stats["no_data"] == 1
+
+
+def test_retryable_errors_back_off_then_succeed():
+    engine, sleeps = make_engine()
+    results = iter([FetchError(TIMEOUT), FetchError(SERVER_ERROR), b"ok"])
+
+    def fetch():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert engine.run(fetch) == b"ok"
+    assert sleeps == [1, 2]
+    assert engine.stats["retries"] == 2
+
+
+def test_client_error_is_not_retried():
+    engine, sleeps = make_engine()
+
+    def fetch():
+        raise FetchError(CLIENT_ERROR, "404", 404)
+
+    with pytest.raises(FetchError):
+        engine.run(fetch)
+    assert engine.stats["attempts"] == 1 and sleeps == []
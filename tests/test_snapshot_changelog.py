@@ -0,0 +1,89 @@
+import logging
+
+import pandas as pd
+import pytest
+
+import snapshot_changelog
+from snapshot_changelog import ADDED, CHANGED, REMOVED, ChangeLog
+
+
+def frame(rows, columns=("name", "remark")):
+    df = pd.DataFrame([[sid] + list(values) for sid, values in rows.items()], columns=["stock_id"] + list(columns))
+    return df.set_index("stock_id").sort_index().astype(str)
+
+
+@pytest.fixture
+def log(tmp_path):
+    return ChangeLog("exempted", directory=tmp_path / "exempted")
+
+
+def test_deltas_record_added_changed_removed(log):
+    log.append("20241014", frame({"1101": ("台泥", ""), "2330": ("台積電", "")}))
+    counts = log.append("20241015", frame({"2330": ("台積電", "*"), "6488": ("環球晶", "")}))
+    assert counts == {ADDED: 1, REMOVED: 1, CHANGED: 1}
+    changes = log.changes()
+    assert sorted(zip(changes["stock_id"], changes["change"])) == [
+        ("1101", REMOVED), ("2330", CHANGED), ("6488", ADDED)]
+
+
+def test_reconstruct_round_trip(log, tmp_path):
+    days = {
+        "20241014": frame({"1101": ("台泥", ""), "2330": ("台積電", "")}),
+        "20241015": frame({"2330": ("台積電", "*"), "6488": ("環球晶", "")}),
+        "20241016": frame({"2330": ("台積電", "*"), "6488": ("環球晶", "*"), "3008": ("大立光", "")}),
+    }
+    for date_str, df in days.items():
+        log.append(date_str, df)
+    reopened = ChangeLog("exempted", directory=tmp_path / "exempted")
+    for date_str, df in days.items():
+        pd.testing.assert_frame_equal(reopened.reconstruct(date_str), df, check_names=False)
+    # 非交易日取之前最近一天
+    pd.testing.assert_frame_equal(reopened.reconstruct("20241020"), days["20241016"], check_names=False)
+
+
+def test_column_change_writes_full_list_and_delta_on_shared_columns(log):
+    before = frame({"1101": ("台泥", ""), "2330": ("台積電", "")})
+    after = frame({"2330": ("台積電", "", "Y"), "6488": ("環球晶", "", "N")}, columns=("name", "remark", "flag"))
+    log.append("20241014", before)
+    counts = log.append("20241015", after)
+    # 共同欄位（name / remark）沒變的 2330 不算變更；新增與移除照常記錄
+    assert counts == {ADDED: 1, REMOVED: 1, CHANGED: 0}
+    assert "20241015" in log.full_dates()
+    assert "20241015" in {d for d in log.changes()["date"]}
+    pd.testing.assert_frame_equal(log.reconstruct("20241014"), before, check_names=False)
+    pd.testing.assert_frame_equal(log.reconstruct("20241015"), after, check_names=False)
+
+    # 欄位改變後照常以新欄位記差異
+    later = frame({"2330": ("台積電", "*", "Y"), "6488": ("環球晶", "", "N")}, columns=("name", "remark", "flag"))
+    assert log.append("20241016", later) == {ADDED: 0, REMOVED: 0, CHANGED: 1}
+    pd.testing.assert_frame_equal(log.reconstruct("20241016"), later, check_names=False)
+
+
+def test_full_list_every_n_days(log, monkeypatch):
+    monkeypatch.setattr(snapshot_changelog, "FULL_EVERY", 2)
+    for i, date_str in enumerate(["20241014", "20241015", "20241016", "20241017"]):
+        log.append(date_str, frame({"2330": ("台積電", str(i))}))
+    assert log.full_dates() == ["20241014", "20241016"]
+    assert log.reconstruct("20241017").loc["2330", "remark"] == "3"
+
+
+def test_append_rejects_earlier_dates(log):
+    log.append("20241015", frame({"2330": ("台積電", "")}))
+    with pytest.raises(ValueError):
+        log.append("20241014", frame({"2330": ("台積電", "")}))
+
+
+def test_update_changelog_warns_about_late_files(tmp_path, monkeypatch, caplog):
+    clean_dir = tmp_path / "otc_cleaned"
+    clean_dir.mkdir()
+    monkeypatch.setattr(snapshot_changelog, "OTC_CLEAN_DIR", clean_dir)
+    monkeypatch.setattr(snapshot_changelog, "CHANGELOG_DIR", clean_dir / "changelog")
+    for date_str in ("20241014", "20241016"):
+        (clean_dir / f"{date_str}_exempted.csv").write_text("stock_id,name\n2330,台積電\n", encoding="utf-8-sig")
+    assert snapshot_changelog.update_changelog("exempted").last_date == "20241016"
+
+    (clean_dir / "20241015_exempted.csv").write_text("stock_id,name\n2330,台積電\n", encoding="utf-8-sig")
+    with caplog.at_level(logging.WARNING):
+        snapshot_changelog.update_changelog("exempted")
+    assert "--rebuild" in caplog.text
+    assert snapshot_changelog.update_changelog("exempted", rebuild=True).dates() == ["20241014", "20241015", "20241016"]
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from task_scheduler import TaskScheduler, parse_deadline
+
+DATES = [datetime(2024, 10, 14), datetime(2024, 10, 15), datetime(2024, 10, 16)]
+ITEMS = [
+    ("daily_close_no1430", {"priority": 1}),
+    ("margin_transactions", {"priority": 2}),
+    ("exempted", {"priority": 9}),
+]
+
+
+def drain(scheduler):
+    keys = []
+    while len(scheduler):
+        task = scheduler.next_task()
+        keys.append(task.key)
+        scheduler.mark_done(task)
+    return keys
+
+
+def test_priority_first_orders_by_priority_then_newest():
+    scheduler = TaskScheduler("priority_first")
+    scheduler.build(ITEMS, DATES)
+    assert drain(scheduler) == [
+        "20241016_daily_close_no1430", "20241015_daily_close_no1430", "20241014_daily_close_no1430",
+        "20241016_margin_transactions", "20241015_margin_transactions", "20241014_margin_transactions",
+        "20241016_exempted", "20241015_exempted", "20241014_exempted",
+    ]
+
+
+def test_newest_first_and_oldest_first():
+    newest = TaskScheduler("newest_first")
+    newest.build(ITEMS, DATES)
+    assert drain(newest)[:3] == ["20241016_daily_close_no1430", "20241016_margin_transactions", "20241016_exempted"]
+
+    oldest = TaskScheduler("oldest_first")
+    oldest.build(ITEMS, DATES)
+    assert drain(oldest)[:3] == ["20241014_daily_close_no1430", "20241014_margin_transactions", "20241014_exempted"]
+
+
+def test_unknown_ordering_is_rejected():
+    with pytest.raises(ValueError):
+        TaskScheduler("random")
+
+
+def test_build_skips_existing_files():
+    scheduler = TaskScheduler()
+    skipped = scheduler.build(ITEMS, DATES, existing={"20241016_exempted", "20241014_daily_close_no1430"})
+    assert skipped == 2
+    assert len(scheduler) == len(ITEMS) * len(DATES) - 2
+
+
+def test_deadline_tasks_run_before_higher_priority_items():
+    later = (datetime.now() + timedelta(hours=2)).strftime("%H:%M")
+    scheduler = TaskScheduler("priority_first", deadlines=[{"item": "exempted", "last_n_dates": 2, "by": later}])
+    scheduler.build(ITEMS, DATES)
+    keys = drain(scheduler)
+    # 只有最近 2 個日期帶截止時間，最舊的一天照一般順序
+    assert keys[:2] == ["20241016_exempted", "20241015_exempted"]
+    assert keys[-1] == "20241014_exempted"
+
+
+def test_parse_deadline_rolls_over_to_next_day():
+    now = datetime(2024, 10, 16, 10, 0)
+    assert parse_deadline("09:00", now) == datetime(2024, 10, 17, 9, 0)
+    assert parse_deadline("11:30", now) == datetime(2024, 10, 16, 11, 30)
+    assert parse_deadline("2024-10-20T08:00", now) == datetime(2024, 10, 20, 8, 0)
+
+
+def test_retry_is_requeued_behind_new_tasks():
+    scheduler = TaskScheduler("priority_first", max_attempts=2, retry_delay=0)
+    scheduler.build(ITEMS[:2], DATES[-1:])
+    first = scheduler.next_task()
+    assert first.key == "20241016_daily_close_no1430"
+    assert scheduler.mark_failed(first, "timeout") is True
+    # 重試任務降級：先執行尚未嘗試過的任務
+    assert scheduler.next_task().key == "20241016_margin_transactions"
+    retry = scheduler.next_task()
+    assert retry is first and retry.attempts == 1
+    # 額度用完後不再排入
+    assert scheduler.mark_failed(retry, "timeout") is False
+    assert scheduler.failed == [first]
+    assert len(scheduler) == 0
+
+
+def test_non_retryable_failure_is_not_requeued():
+    scheduler = TaskScheduler(max_attempts=5, retry_delay=0)
+    scheduler.build(ITEMS[:1], DATES[-1:])
+    task = scheduler.next_task()
+    assert scheduler.mark_failed(task, "404", retryable=False) is False
+    assert scheduler.failed == [task] and task.last_error == "404"
+    assert len(scheduler) == 0
+
+
+def test_from_settings_reads_schedule_block():
+    scheduler = TaskScheduler.from_settings(
+        {"schedule": {"ordering": "oldest_first", "max_attempts": 4}}, max_attempts=2, retry_delay=7)
+    assert scheduler.ordering == "oldest_first"
+    assert scheduler.max_attempts == 4
+    assert scheduler.retry_delay == 7